@@ -1,34 +1,164 @@
-import cv2
+import argparse
+import hashlib
+import multiprocessing
 import numpy as np
 import pickle
 import os
-from mtcnn.mtcnn import MTCNN
-from keras_facenet import FaceNet
-from PIL import Image
+from embedding_store import save_store
+from face_ingest import REQUIRED_FACE_SIZE, extract_face, extract_face_task, init_worker
+from gallery_prototypes import MAX_PROTOTYPES_PER_PERSON, PROTOTYPE_METHODS, build_prototypes, print_report, prototype_metadata
+from model_registry import get_detector, get_embedder, model_lock
 
 IMAGES_FOLDER = "dataset"
 OUTPUT_FOLDER = "EmbeddingPicture"
-OUTPUT_FILENAME = "Embeddings_Facenet.p"
+OUTPUT_FILENAME = "Embeddings_Facenet.emb"
 OUTPUT_FILEPATH = os.path.join(OUTPUT_FOLDER, OUTPUT_FILENAME)
-REQUIRED_FACE_SIZE = (160, 160)
+MANIFEST_FILENAME = "Embeddings_Facenet_manifest.p"
+MANIFEST_FILEPATH = os.path.join(OUTPUT_FOLDER, MANIFEST_FILENAME)
+MANIFEST_VERSION = 1
 VALID_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+EMBED_BATCH_SIZE = 32  # Số khuôn mặt gửi cho FaceNet trong một lần gọi
+EXTRACT_CHUNK_SIZE = 4  # Số ảnh gửi cho mỗi tiến trình con trong một lần
+EXTRACT_WORKERS = 1  # Số tiến trình đọc ảnh và chạy MTCNN; mỗi tiến trình tải TensorFlow riêng nên chỉ tăng qua --workers
+MIN_IMAGES_PER_WORKER = 16  # Ít ảnh hơn thì không đáng tải MTCNN trong một tiến trình con
 
-print("Khởi tạo mô hình...")
-try:
-    DETECTOR = MTCNN()
-    EMBEDDER = FaceNet()
-    print("Mô hình đã sẵn sàng.")
-except Exception as e:
-    print(f"[LỖI] Không thể khởi tạo MTCNN hoặc FaceNet: {e}")
-    DETECTOR = None
-    EMBEDDER = None
-
-def generate_and_save_embeddings():
-    if not DETECTOR or not EMBEDDER:
-        print("[LỖI] Mô hình chưa được khởi tạo.")
+DETECTOR = None
+EMBEDDER = None
+
+def _init_models():
+    """Lấy MTCNN và FaceNet từ model_registry ở lần dùng đầu tiên.
+
+    Không khởi tạo lúc import để các tiến trình con (spawn) nạp lại module này không phải tải mô hình;
+    khi chạy trong giao diện, registry trả về đúng các model giao diện đang dùng.
+    """
+    global DETECTOR, EMBEDDER
+    if DETECTOR and EMBEDDER:
+        return True
+    try:
+        DETECTOR = get_detector()
+        EMBEDDER = get_embedder()
+        return True
+    except Exception as e:
+        print(f"[LỖI] Không thể khởi tạo MTCNN hoặc FaceNet: {e}")
+        DETECTOR = None
+        EMBEDDER = None
         return False
 
-    embeddingsData = []
+def _parse_person_folder(person_folder_name):
+    """Tách ID và tên người dùng từ tên thư mục. Trả về None nếu tên không hợp lệ."""
+    if '_' in person_folder_name:
+        try:
+            user_id, user_name = person_folder_name.split('_', 1)
+            user_id = user_id.strip()
+            user_name = user_name.strip()
+            if not user_id or not user_name:
+                print(f"[Cảnh báo] Tên thư mục không hợp lệ: {person_folder_name}")
+                return None
+            return user_id, user_name
+        except ValueError:
+            pass
+    return person_folder_name.strip(), person_folder_name.strip()
+
+def _file_hash(path):
+    """Tính mã băm SHA-1 của nội dung file."""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _load_manifest():
+    """Đọc manifest các ảnh đã xử lý. Trả về từ điển rỗng nếu không có hoặc bị lỗi."""
+    if not os.path.exists(MANIFEST_FILEPATH):
+        return {}
+    try:
+        with open(MANIFEST_FILEPATH, 'rb') as file:
+            data = pickle.load(file)
+        if isinstance(data, dict) and data.get('version') == MANIFEST_VERSION and isinstance(data.get('images'), dict):
+            return data['images']
+        print("[Cảnh báo] Manifest không đúng định dạng, sẽ tạo lại toàn bộ.")
+    except Exception as e:
+        print(f"[Cảnh báo] Không thể đọc manifest, sẽ tạo lại toàn bộ: {e}")
+    return {}
+
+def _save_manifest(images):
+    """Ghi manifest ra file tạm rồi thay thế file cũ để tránh file hỏng giữa chừng."""
+    tmp_path = MANIFEST_FILEPATH + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        pickle.dump({'version': MANIFEST_VERSION, 'images': images}, file)
+    os.replace(tmp_path, MANIFEST_FILEPATH)
+
+def record_enrolled_image(img_path, user_id, user_name, embedding):
+    """Ghi ảnh vừa được thêm trực tiếp (xem enrollment) vào manifest để lần tạo embeddings sau dùng lại
+    embedding đã có thay vì phát hiện và tạo lại. Trả về False nếu img_path không nằm trong IMAGES_FOLDER.
+    """
+    folder_path, filename = os.path.split(img_path)
+    if os.path.abspath(os.path.dirname(folder_path)) != os.path.abspath(IMAGES_FOLDER):
+        return False  # Ảnh nằm ngoài dataset mà manifest này mô tả
+    rel_path = f"{os.path.basename(folder_path)}/{filename}"
+    stat = os.stat(img_path)
+    images = _load_manifest()
+    images[rel_path] = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'hash': _file_hash(img_path),
+        'rows': [{'id': user_id, 'name': user_name, 'embedding': np.asarray(embedding, dtype=np.float32)}]
+    }
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    _save_manifest(images)
+    return True
+
+def _embed_batch(pending, new_manifest):
+    """Tạo embedding cho cả lô khuôn mặt bằng một lần gọi EMBEDDER và ghi vào manifest.
+
+    Trả về số ảnh đã tạo embedding thành công.
+    """
+    if not pending:
+        return 0
+    try:
+        with model_lock(EMBEDDER):  # Giao diện có thể gọi cùng model từ luồng khác
+            embeddings = EMBEDDER.embeddings(np.stack([item[2] for item in pending]))
+    except Exception as e:
+        for rel_path, filename, _, _, _ in pending:
+            print(f"  [LỖI] Khi xử lý ảnh {filename}: {e}")
+            del new_manifest[rel_path]
+        return 0
+
+    for (rel_path, _, _, user_id, user_name), embedding in zip(pending, embeddings):
+        new_manifest[rel_path]['rows'] = [{'id': user_id, 'name': user_name, 'embedding': embedding}]
+    return len(pending)
+
+def _iter_extracted(tasks, workers):
+    """Phát hiện và cắt khuôn mặt cho danh sách (đường dẫn, tên file), giữ nguyên thứ tự đầu vào."""
+    workers = min(workers, len(tasks) // MIN_IMAGES_PER_WORKER)
+    if workers <= 1:
+        for img_path, filename in tasks:
+            yield extract_face(DETECTOR, img_path, filename)
+        return
+
+    # Dùng spawn vì fork tiến trình đang chạy TensorFlow không an toàn
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=workers, initializer=init_worker) as pool:
+        # imap trả kết quả theo đúng thứ tự tasks nên đầu ra ổn định giữa các lần chạy
+        for result in pool.imap(extract_face_task, tasks, chunksize=EXTRACT_CHUNK_SIZE):
+            yield result
+
+def generate_and_save_embeddings(full_rebuild=False, batch_size=EMBED_BATCH_SIZE, workers=EXTRACT_WORKERS, prototypes=None,
+                                 max_prototypes=MAX_PROTOTYPES_PER_PERSON):
+    """Tạo embeddings cho thư mục dataset và lưu ra file.
+
+    Mặc định chỉ xử lý ảnh mới hoặc đã thay đổi dựa trên manifest (kích thước, mtime,
+    mã băm nội dung); ảnh không đổi dùng lại embedding cũ, ảnh đã bị xóa bị loại khỏi kết quả.
+    Truyền full_rebuild=True để bỏ qua manifest và tạo lại toàn bộ. Khuôn mặt được gom
+    thành lô batch_size ảnh cho mỗi lần gọi FaceNet. Việc đọc ảnh và chạy MTCNN được chia cho một pool
+    workers tiến trình (mặc định 1 = chạy tuần tự; 0 = số lõi CPU), tiến trình chính chỉ tạo embedding;
+    khi có ít ảnh cần xử lý thì số tiến trình được giảm để mỗi tiến trình có ít nhất MIN_IMAGES_PER_WORKER ảnh.
+    Với prototypes='mean' hoặc 'medoids', file đầu ra là gallery prototype (xem gallery_prototypes);
+    manifest vẫn giữ embedding từng ảnh nên lần chạy sau chỉ phải tạo embedding cho ảnh mới.
+    """
+    if not _init_models():
+        print("[LỖI] Mô hình chưa được khởi tạo.")
+        return False
 
     if not os.path.exists(IMAGES_FOLDER):
         print(f"[LỖI] Không tìm thấy thư mục: {IMAGES_FOLDER}")
@@ -37,105 +167,130 @@ def generate_and_save_embeddings():
         print(f"[LỖI] Đường dẫn không phải thư mục: {IMAGES_FOLDER}")
         return False
 
-    for person_folder_name in os.listdir(IMAGES_FOLDER):
+    old_manifest = {} if full_rebuild else _load_manifest()
+    # Chỉ mục theo mã băm để dùng lại embedding khi thư mục được đổi tên
+    hash_index = {entry['hash']: entry for entry in old_manifest.values()}
+    new_manifest = {}
+    to_extract = []  # Ảnh mới hoặc đã thay đổi cần phát hiện khuôn mặt
+    batch_size = max(1, int(batch_size))
+    workers = int(workers) or os.cpu_count() or 1
+    reused_count = 0
+    embedded_count = 0
+
+    for person_folder_name in sorted(os.listdir(IMAGES_FOLDER)):
         person_folder_path = os.path.join(IMAGES_FOLDER, person_folder_name)
         if not os.path.isdir(person_folder_path) or person_folder_name.startswith('.'):
             continue
 
-        user_id = ""
-        user_name = ""
-
-        if '_' in person_folder_name:
-            try:
-                user_id, user_name = person_folder_name.split('_', 1)
-                user_id = user_id.strip()
-                user_name = user_name.strip()
-                if not user_id or not user_name:
-                    print(f"[Cảnh báo] Tên thư mục không hợp lệ: {person_folder_name}")
-                    continue
-            except ValueError:
-                user_id = person_folder_name.strip()
-                user_name = person_folder_name.strip()
-        else:
-            user_id = person_folder_name.strip()
-            user_name = person_folder_name.strip()
+        parsed = _parse_person_folder(person_folder_name)
+        if parsed is None:
+            continue
+        user_id, user_name = parsed
 
         image_count = 0
-        for filename in os.listdir(person_folder_path):
+        for filename in sorted(os.listdir(person_folder_path)):
             if not filename.lower().endswith(VALID_IMAGE_EXTENSIONS):
                 continue
 
             img_path = os.path.join(person_folder_path, filename)
+            rel_path = f"{person_folder_name}/{filename}"
             image_count += 1
-            print(f"  [{image_count}] Xử lý ảnh: {filename}...")
 
             try:
-                img_bgr = cv2.imread(img_path)
-                if img_bgr is None:
-                    print(f"  [LỖI] Không thể đọc ảnh: {filename}")
-                    continue
-
-                img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-                results = DETECTOR.detect_faces(img_rgb)
-
-                if not results:
-                    print(f"  [!] Không phát hiện khuôn mặt: {filename}")
-                    continue
-
-                # Lấy khuôn mặt lớn nhất nếu có nhiều khuôn mặt
-                if len(results) > 1:
-                    best_face_idx = np.argmax([res['box'][2] * res['box'][3] for res in results])
-                    face_data = results[best_face_idx]
+                stat = os.stat(img_path)
+                entry = old_manifest.get(rel_path)
+                if not (entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns):
+                    file_hash = _file_hash(img_path)
+                    if not (entry and entry['hash'] == file_hash):
+                        entry = hash_index.get(file_hash)
                 else:
-                    face_data = results[0]
-
-                x1, y1, width, height = face_data['box']
-                x1, y1 = abs(x1), abs(y1)
-                x2, y2 = x1 + width, y1 + height
-                face_pixels = img_rgb[y1:y2, x1:x2]
-
-                if face_pixels.size == 0:
-                    print(f"  [LỖI] Không thể cắt ảnh: {filename}")
-                    continue
-
-                # Resize và tạo embedding
-                face_image = Image.fromarray(face_pixels).resize(REQUIRED_FACE_SIZE)
-                face_array = np.asarray(face_image)
-                samples = np.expand_dims(face_array, axis=0)
-                embedding = EMBEDDER.embeddings(samples)[0]
-
-                embeddingsData.append({
-                    'id': user_id,
-                    'name': user_name,
-                    'embedding': embedding
-                })
-
-            except Exception as e:
-                print(f"  [LỖI] Khi xử lý ảnh {filename}: {e}")
+                    file_hash = entry['hash']
+            except OSError as e:
+                print(f"  [LỖI] Không thể đọc file {filename}: {e}")
                 continue
 
+            rows = []
+            if entry is not None:
+                rows = [{'id': user_id, 'name': user_name, 'embedding': row['embedding']} for row in entry['rows']]
+                reused_count += 1
+            else:
+                to_extract.append((rel_path, img_path, filename, user_id, user_name, image_count))
+
+            new_manifest[rel_path] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'hash': file_hash,
+                'rows': rows
+            }
+
         if image_count == 0:
             print(f"[!] Thư mục '{person_folder_name}' không có ảnh hợp lệ.")
 
-    print(f"\nTổng số embeddings đã tạo: {len(embeddingsData)}")
+    pending = []  # Khuôn mặt đang chờ tạo embedding theo lô
+    tasks = [(item[1], item[2]) for item in to_extract]
+    for item, (face_array, ok, message) in zip(to_extract, _iter_extracted(tasks, workers)):
+        rel_path, _, filename, user_id, user_name, image_count = item
+        print(f"  [{image_count}] Xử lý ảnh: {filename}...")
+        if message:
+            print(message)
+        if not ok:
+            del new_manifest[rel_path]
+            continue
+        if face_array is not None:
+            pending.append((rel_path, filename, face_array, user_id, user_name))
+        if len(pending) >= batch_size:
+            embedded_count += _embed_batch(pending, new_manifest)
+            pending = []
+
+    embedded_count += _embed_batch(pending, new_manifest)
+
+    # Giữ thứ tự duyệt thư mục cho kết quả đầu ra
+    embeddingsData = [row for entry in new_manifest.values() for row in entry['rows']]
+    removed_count = len(set(old_manifest) - set(new_manifest))
+    print(f"\nẢnh mới xử lý: {embedded_count}, dùng lại: {reused_count}, đã xóa: {removed_count}")
+    print(f"Tổng số embeddings đã tạo: {len(embeddingsData)}")
 
     try:
-        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-        with open(OUTPUT_FILEPATH, 'wb') as file:
-            pickle.dump(embeddingsData, file)
+        embeddings = np.array([row['embedding'] for row in embeddingsData], dtype=np.float32)
+        ids = [row['id'] for row in embeddingsData]
+        names = [row['name'] for row in embeddingsData]
+        # Embedding của các backend khác nhau lệch nhau một chút, ghi lại backend đã dùng
+        metadata = {'embedder': getattr(EMBEDDER, 'backend', 'keras')}
+        if prototypes and embeddingsData:
+            labels = [rel_path for rel_path, entry in new_manifest.items() for _ in entry['rows']]
+            embeddings, ids, names, report = build_prototypes(embeddings, ids, names, prototypes, max_prototypes,
+                                                              labels=labels)
+            print_report(report)
+            metadata.update(prototype_metadata(report))
+        save_store(OUTPUT_FILEPATH, embeddings, ids, names, metadata=metadata)
 
         if embeddingsData:
             print(f"Đã lưu embeddings vào: {OUTPUT_FILEPATH}")
         else:
             print(f"Đã lưu file rỗng (không có ảnh hợp lệ): {OUTPUT_FILEPATH}")
-        return True
     except Exception as e:
         print(f"[LỖI] Không thể lưu embeddings: {e}")
         return False
 
+    try:
+        _save_manifest(new_manifest)
+    except Exception as e:
+        # Manifest chỉ dùng để tăng tốc, lần sau sẽ tạo lại toàn bộ
+        print(f"[Cảnh báo] Không thể lưu manifest: {e}")
+    return True
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo embeddings FaceNet cho thư mục dataset.")
+    parser.add_argument("--full", action="store_true", help="Bỏ qua manifest và tạo lại toàn bộ embeddings.")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Số khuôn mặt cho mỗi lần gọi FaceNet.")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="Số tiến trình đọc ảnh và chạy MTCNN (mặc định 1 = tuần tự, 0 = số lõi CPU).")
+    parser.add_argument("--prototypes", choices=PROTOTYPE_METHODS, help="Lưu gallery prototype thay vì mỗi ảnh một hàng.")
+    parser.add_argument("--max-prototypes", type=int, default=MAX_PROTOTYPES_PER_PERSON, help="Số prototype tối đa mỗi người (medoids).")
+    args = parser.parse_args()
+
     print("Đang chạy CodeGenerator...")
-    if generate_and_save_embeddings():
+    if generate_and_save_embeddings(full_rebuild=args.full, batch_size=args.batch_size, workers=args.workers,
+                                    prototypes=args.prototypes, max_prototypes=args.max_prototypes):
         print("Tạo embeddings thành công.")
     else:
         print("Tạo embeddings thất bại.")
@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import cv2
+import numpy as np
+from embedding_store import load_gallery
+from face_matcher import RECOGNITION_THRESHOLD, create_matcher
+from face_pipeline import DETECTION_SCALE, MIN_FACE_SIZE, detect_faces_scaled, face_boxes, prepare_face_batch
+
+# Cấu hình
+EMBEDDING_FILEPATH = os.path.join("EmbeddingPicture", "Embeddings_Facenet.emb")
+MATCHER_BACKEND = 'auto'
+VALID_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+FRAMES_PER_WORKER = 8  # Số khung hình gửi cho mỗi tiến trình con trong một đợt
+PROGRESS_INTERVAL = 5.0  # Giây giữa hai lần in tiến độ
+
+# Module chỉ nhập thư viện nhẹ ở cấp cao nhất để tiến trình con (spawn) nạp lại nhanh;
+# mỗi tiến trình tự tạo MTCNN và FaceNet của nó.
+_MODELS = None
+
+def init_models(detection_scale=DETECTION_SCALE, min_face_size=MIN_FACE_SIZE):
+    """Lấy MTCNN và FaceNet của tiến trình hiện tại từ model_registry."""
+    global _MODELS
+    from model_registry import get_detector, get_embedder
+    _MODELS = (get_detector(), get_embedder(), detection_scale, min_face_size)
+
+def embed_frame(task):
+    """Phát hiện và tạo embedding cho một khung hình.
+
+    task là (chỉ số khung, tên nguồn, ảnh BGR hoặc đường dẫn ảnh); trả về
+    (chỉ số khung, tên nguồn, boxes, embeddings, thông báo lỗi hoặc None).
+    """
+    frame_index, source, frame = task
+    detector, embedder, detection_scale, min_face_size = _MODELS
+    try:
+        frame_bgr = cv2.imread(frame) if isinstance(frame, str) else frame
+        if frame_bgr is None:
+            return frame_index, source, [], None, "Không thể đọc ảnh"
+        frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+        boxes = face_boxes(frame_rgb, detect_faces_scaled(detector, frame_rgb, detection_scale, min_face_size))
+        embeddings = embedder.embeddings(prepare_face_batch(frame_rgb, boxes)) if boxes else None
+        return frame_index, source, boxes, embeddings, None
+    except Exception as e:
+        return frame_index, source, [], None, str(e)
+
+def iter_video(path, stride=1, start=0):
+    """Sinh (chỉ số khung, tên nguồn, ảnh BGR) cho mỗi khung thứ stride, bắt đầu từ khung start."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Không thể mở video: {path}")
+    try:
+        frame_index = 0
+        if start > 0:
+            # Tua bằng grab() để không phải giải mã ảnh đầy đủ cho các khung bỏ qua
+            while frame_index < start and cap.grab():
+                frame_index += 1
+        while True:
+            if frame_index % stride == 0:
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                yield frame_index, path, frame
+            elif not cap.grab():
+                return
+            frame_index += 1
+    finally:
+        cap.release()
+
+def list_images(folder):
+    """Danh sách ảnh trong cây thư mục, sắp xếp cố định để chỉ số khung ổn định giữa các lần chạy."""
+    paths = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(VALID_IMAGE_EXTENSIONS))
+    return paths
+
+def iter_images(folder, stride=1, start=0):
+    for frame_index, path in enumerate(list_images(folder)):
+        if frame_index >= start and frame_index % stride == 0:
+            yield frame_index, path, path
+
+def last_processed_frame(output_path):
+    """Chỉ số khung cuối cùng đã ghi trong file JSONL, -1 nếu chưa có.
+
+    Dòng cuối ghi dở (khi tiến trình bị dừng giữa chừng) bị cắt bỏ để file luôn hợp lệ.
+    """
+    if not os.path.exists(output_path):
+        return -1
+    last_frame = -1
+    valid_size = 0
+    with open(output_path, 'rb') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            last_frame = record['frame']
+            valid_size += len(line)
+    if valid_size != os.path.getsize(output_path):
+        with open(output_path, 'r+b') as file:
+            file.truncate(valid_size)
+    return last_frame
+
+def _iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _iter_results(tasks, workers, detection_scale, min_face_size):
+    """Kết quả embed_frame theo đúng thứ tự tasks; với workers > 1 chia cho pool tiến trình."""
+    if workers <= 1:
+        init_models(detection_scale, min_face_size)
+        for task in tasks:
+            yield embed_frame(task)
+        return
+
+    # Dùng spawn vì fork tiến trình đang chạy TensorFlow không an toàn
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=workers, initializer=init_models, initargs=(detection_scale, min_face_size)) as pool:
+        # Gửi theo từng đợt để không đọc trước cả video vào bộ nhớ
+        for chunk in _iter_chunks(tasks, workers * FRAMES_PER_WORKER):
+            for result in pool.imap(embed_frame, chunk):
+                yield result
+
+def recognize(input_path, output_path, embedding_filepath=EMBEDDING_FILEPATH, stride=1, workers=1,
+              resume=False, threshold=RECOGNITION_THRESHOLD, detection_scale=DETECTION_SCALE,
+              min_face_size=MIN_FACE_SIZE):
+    """Nhận diện khuôn mặt trên file video hoặc thư mục ảnh và ghi kết quả dạng JSONL.
+
+    Mỗi khung hình được xử lý ghi một dòng {'frame', 'source', 'time', 'faces': [{'box', 'id', 'name',
+    'distance'}]} ngay khi có kết quả. Với resume=True, các khung đến khung cuối cùng trong file đầu ra
+    được bỏ qua và kết quả mới được ghi tiếp vào file. Trả về số khung đã xử lý trong lần chạy này.
+    """
+    stride = max(1, int(stride))
+    workers = int(workers) or os.cpu_count() or 1
+
+    store = load_gallery(embedding_filepath)
+    matcher = create_matcher(store.embeddings, MATCHER_BACKEND, threshold) if len(store) else None
+    print(f"Đã tải {len(store)} embeddings.")
+
+    # Kiểm tra nguồn trước khi động vào file đầu ra để lỗi mở video không làm mất kết quả cũ
+    fps = 0.0
+    is_folder = os.path.isdir(input_path)
+    if not is_folder:
+        cap = cv2.VideoCapture(input_path)
+        opened = cap.isOpened()
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        cap.release()
+        if not opened:
+            raise IOError(f"Không thể mở video: {input_path}")
+
+    start = 0
+    if resume:
+        start = last_processed_frame(output_path) + 1
+        if start > 0:
+            print(f"Tiếp tục từ khung {start}.")
+    tasks = iter_images(input_path, stride, start) if is_folder else iter_video(input_path, stride, start)
+
+    processed = 0
+    faces_found = 0
+    started = time.time()
+    last_progress = started
+    output_folder = os.path.dirname(output_path)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+    with open(output_path, 'a' if resume else 'w', encoding='utf-8') as output:
+        for frame_index, source, boxes, embeddings, error in _iter_results(tasks, workers, detection_scale, min_face_size):
+            faces = []
+            if embeddings is not None and matcher is not None:
+                distances, indices = matcher.search(embeddings, k=1)
+                for box, idx, distance in zip(boxes, indices[:, 0], distances[:, 0]):
+                    person = store[idx] if idx >= 0 else None
+                    faces.append({
+                        'box': [int(value) for value in box],
+                        'id': person['id'] if person is not None else None,
+                        'name': person['name'] if person is not None else None,
+                        'distance': float(distance) if np.isfinite(distance) else None,
+                    })
+            else:
+                faces = [{'box': [int(value) for value in box], 'id': None, 'name': None, 'distance': None} for box in boxes]
+
+            record = {'frame': frame_index, 'source': os.path.relpath(source, input_path) if source != input_path else source,
+                      'time': frame_index / fps if fps > 0 else None, 'faces': faces}
+            if error:
+                record['error'] = error
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+            processed += 1
+            faces_found += len(faces)
+            now = time.time()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                print(f"  Khung {frame_index}: {processed} khung, {processed / (now - started):.1f} khung/giây")
+                last_progress = now
+
+    elapsed = time.time() - started
+    print(f"Đã xử lý {processed} khung ({faces_found} khuôn mặt) trong {elapsed:.1f} giây, kết quả: {output_path}")
+    return processed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nhận diện khuôn mặt hàng loạt trên file video hoặc thư mục ảnh.")
+    parser.add_argument("input", help="File video hoặc thư mục ảnh (duyệt cả thư mục con).")
+    parser.add_argument("output", help="File kết quả JSONL.")
+    parser.add_argument("--embeddings", default=EMBEDDING_FILEPATH)
+    parser.add_argument("--stride", type=int, default=1, help="Chỉ xử lý mỗi khung thứ N.")
+    parser.add_argument("--workers", type=int, default=1, help="Số tiến trình phát hiện và tạo embedding (0 = số lõi CPU).")
+    parser.add_argument("--resume", action="store_true", help="Bỏ qua các khung đã có trong file kết quả và ghi tiếp.")
+    parser.add_argument("--detection-scale", type=float, default=DETECTION_SCALE)
+    parser.add_argument("--min-face-size", type=int, default=MIN_FACE_SIZE)
+    args = parser.parse_args()
+
+    recognize(args.input, args.output, args.embeddings, args.stride, args.workers, args.resume,
+              detection_scale=args.detection_scale, min_face_size=args.min_face_size)
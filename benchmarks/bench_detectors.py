@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_pipeline import DETECTION_SCALE, detect_faces_scaled, face_boxes
+from face_tracker import box_iou
+from model_registry import DETECTOR_FACTORIES, get_detector
+
+# So sánh tốc độ và độ phủ (recall) của các bộ phát hiện trên ảnh trong dataset/.
+# Ảnh không có nhãn box nên MTCNN được dùng làm tham chiếu: một khuôn mặt của tham chiếu được tính là
+# tìm thấy nếu bộ phát hiện có box với IoU >= IOU_THRESHOLD.
+# Chạy từ thư mục gốc: python -m benchmarks.bench_detectors --backends mtcnn,yunet,ssd,haar
+IMAGES_FOLDER = "dataset"
+REFERENCE_BACKEND = 'mtcnn'
+IOU_THRESHOLD = 0.5
+VALID_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+def load_images(folder, limit=None):
+    images = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.lower().endswith(VALID_IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(root, filename))
+            if image is not None:
+                images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            if limit and len(images) >= limit:
+                return images
+    return images
+
+def run_detector(detector, images, scale):
+    """Trả về (box (x1, y1, x2, y2) của từng ảnh, thời gian từng ảnh theo ms)."""
+    detect_faces_scaled(detector, images[0], scale)  # Chạy thử
+    boxes, times = [], []
+    for image in images:
+        start = time.perf_counter()
+        faces = detect_faces_scaled(detector, image, scale)
+        times.append((time.perf_counter() - start) * 1000.0)
+        boxes.append(face_boxes(image, faces))
+    return boxes, np.array(times)
+
+def recall(reference_boxes, boxes):
+    found = total = 0
+    for expected, detected in zip(reference_boxes, boxes):
+        for box in expected:
+            total += 1
+            found += any(box_iou(box, candidate) >= IOU_THRESHOLD for candidate in detected)
+    return found / total if total else None
+
+def compare(backends, folder=IMAGES_FOLDER, scale=DETECTION_SCALE, limit=None):
+    images = load_images(folder, limit)
+    if not images:
+        raise ValueError(f"Không có ảnh trong {folder}.")
+    print(f"Đã đọc {len(images)} ảnh.", file=sys.stderr)
+
+    reference_boxes, _ = run_detector(get_detector(REFERENCE_BACKEND), images, 1.0)
+    report = {'images': len(images), 'scale': scale, 'reference': REFERENCE_BACKEND,
+              'iou_threshold': IOU_THRESHOLD, 'backends': {}}
+    for backend in backends:
+        try:
+            detector = get_detector(backend)
+        except (FileNotFoundError, ImportError, AttributeError, cv2.error) as e:
+            print(f"[Cảnh báo] Bỏ qua {backend}: {e}", file=sys.stderr)
+            report['backends'][backend] = {'error': str(e)}
+            continue
+        boxes, times = run_detector(detector, images, scale)
+        report['backends'][backend] = {
+            'mean_ms': float(times.mean()),
+            'p95_ms': float(np.percentile(times, 95)),
+            'images_per_s': float(1000.0 / times.mean()),
+            'recall': recall(reference_boxes, boxes),
+            'detection_rate': float(np.mean([len(b) > 0 for b in boxes])),
+            'faces_per_image': float(np.mean([len(b) for b in boxes])),
+        }
+        result = report['backends'][backend]
+        print(f"  {backend:6s} {result['mean_ms']:8.2f} ms  recall={result['recall']}  "
+              f"phát hiện={result['detection_rate']:.3f}", file=sys.stderr)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="So sánh tốc độ và độ phủ của các bộ phát hiện khuôn mặt.")
+    parser.add_argument("--backends", default=",".join(DETECTOR_FACTORIES))
+    parser.add_argument("--dataset", default=IMAGES_FOLDER)
+    parser.add_argument("--scale", type=float, default=DETECTION_SCALE, help="Tỉ lệ thu nhỏ ảnh trước khi phát hiện.")
+    parser.add_argument("--limit", type=int, help="Số ảnh tối đa.")
+    parser.add_argument("--output", help="Ghi báo cáo JSON vào file (mặc định in ra stdout).")
+    args = parser.parse_args()
+
+    report = compare([b.strip() for b in args.backends.split(",") if b.strip()], args.dataset, args.scale, args.limit)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+        print(f"Đã ghi báo cáo vào {args.output}", file=sys.stderr)
+    else:
+        print(text)
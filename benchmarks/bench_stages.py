@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import EMBEDDING_DIM, StubDetector, StubEmbedder
+from face_matcher import create_matcher
+from face_pipeline import detect_faces_scaled, face_boxes, prepare_face_batch
+from frame_pipeline import FramePool, fit_size
+
+# Đo thời gian từng bước của đường nhận diện (RecognitionWorker.run và generate_and_save_embeddings):
+# giải mã ảnh, đổi màu, phát hiện, cắt + resize, tạo embedding, so khớp gallery, chuyển sang QImage.
+# Chạy từ thư mục gốc: python -m benchmarks.bench_stages --stub-models --output results.json
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+GALLERY_SIZES = (1000, 10000, 100000, 1000000)
+EMBED_BATCH_SIZES = (1, 8, 32)
+DEFAULT_REPEAT = 20
+DEFAULT_WARMUP = 3
+GALLERY_CHUNK_SIZE = 100000
+DISPLAY_SIZE = (381, 351)  # Kích thước labelCamera trong cửa sổ chính
+
+def time_call(func, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP):
+    """Gọi func warmup lần (không tính) rồi repeat lần; trả về thống kê thời gian theo mili giây."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples = np.array(samples)
+    return {
+        'repeat': repeat,
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'min_ms': float(samples.min()),
+        'max_ms': float(samples.max()),
+    }
+
+def allocated_bytes(func, calls=10):
+    """Số byte cấp phát trung bình mỗi lần gọi func (đỉnh theo tracemalloc, gồm cả mảng numpy tạm thời)."""
+    func()
+    tracemalloc.start()
+    try:
+        total = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            func()
+            total += tracemalloc.get_traced_memory()[1] - start
+        return total // calls
+    finally:
+        tracemalloc.stop()
+
+def synthetic_frame(seed=0, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """Khung hình BGR tổng hợp: nền chuyển màu và vài vùng sáng tối để JPEG có nội dung thực tế."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)),
+                      np.full((height, width), 128, np.float32)], axis=2)
+    frame += rng.normal(0, 12, frame.shape)
+    for _ in range(5):
+        cx, cy, r = rng.integers(0, width), rng.integers(0, height), rng.integers(20, 80)
+        cv2.circle(frame, (int(cx), int(cy)), int(r), [float(v) for v in rng.integers(0, 255, 3)], -1)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def load_frames(folder, limit=10):
+    """Đọc tối đa limit ảnh thật (vd. từ dataset/) để phát hiện khuôn mặt có nội dung thật."""
+    frames = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if len(frames) >= limit:
+                return frames
+            frame = cv2.imread(os.path.join(root, filename))
+            if frame is not None:
+                frames.append(cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT)))
+    return frames
+
+def synthetic_gallery(size, dim=EMBEDDING_DIM, seed=0):
+    """Gallery ngẫu nhiên đã chuẩn hóa L2, tạo theo từng phần để giới hạn bộ nhớ tạm."""
+    rng = np.random.default_rng(seed)
+    gallery = np.empty((size, dim), np.float32)
+    for start in range(0, size, GALLERY_CHUNK_SIZE):
+        chunk = rng.standard_normal((min(GALLERY_CHUNK_SIZE, size - start), dim), dtype=np.float32)
+        chunk /= np.linalg.norm(chunk, axis=1, keepdims=True)
+        gallery[start:start + len(chunk)] = chunk
+    return gallery
+
+def load_models(stub_models, num_faces):
+    if stub_models:
+        return StubDetector(num_faces), StubEmbedder()
+    from model_registry import get_detector, get_embedder
+    return get_detector(), get_embedder()
+
+def bench_frame_stages(detector, embedder, frames, repeat, warmup):
+    """Các bước xử lý một khung hình, theo thứ tự trong RecognitionWorker."""
+    results = []
+    frame_bgr = frames[0]
+    encoded = cv2.imencode('.jpg', frame_bgr)[1]
+    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+
+    results.append(('decode_jpeg', {}, time_call(lambda: cv2.imdecode(encoded, cv2.IMREAD_COLOR), repeat, warmup)))
+    results.append(('bgr_to_rgb', {}, time_call(lambda: cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB), repeat, warmup)))
+
+    frames_rgb = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+    for scale in (1.0, 0.5):
+        # Xoay vòng các khung hình để kết quả không phụ thuộc vào một ảnh duy nhất
+        index = iter(range(10 ** 9))
+        results.append(('detect', {'scale': scale}, time_call(
+            lambda: detect_faces_scaled(detector, frames_rgb[next(index) % len(frames_rgb)], scale), repeat, warmup)))
+
+    boxes = face_boxes(frame_rgb, detector.detect_faces(frame_rgb)) or [(220, 140, 380, 300)]
+    results.append(('crop_resize', {'faces': len(boxes)},
+                    time_call(lambda: prepare_face_batch(frame_rgb, boxes), repeat, warmup)))
+
+    face = prepare_face_batch(frame_rgb, boxes[:1])
+    for batch_size in EMBED_BATCH_SIZES:
+        batch = np.repeat(face, batch_size, axis=0)
+        stats = time_call(lambda: embedder.embeddings(batch), repeat, warmup)
+        stats['per_face_ms'] = stats['mean_ms'] / batch_size
+        results.append(('embed', {'batch_size': batch_size}, stats))
+
+    try:
+        from PyQt5.QtGui import QImage
+    except ImportError:
+        print("[Cảnh báo] Không có PyQt5, bỏ qua bước chuyển sang QImage.", file=sys.stderr)
+    else:
+        def to_qimage():
+            processed_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+            h, w, ch = processed_rgb.shape
+            return QImage(processed_rgb.data, w, h, ch * w, QImage.Format_RGB888).copy()
+        results.append(('qimage', {}, time_call(to_qimage, repeat, warmup)))
+
+    # Đưa khung hình đã vẽ tới kích thước hiển thị: cách cũ (sao chép, đổi màu hai lần, QImage.copy, scale trên
+    # luồng giao diện) so với cách mới (một lần resize từ ảnh RGB vào bộ đệm dùng lại của FramePool)
+    display_size = fit_size(frame_rgb.shape, DISPLAY_SIZE)
+
+    def display_legacy():
+        processed = frame_bgr.copy()
+        processed_rgb = cv2.cvtColor(processed, cv2.COLOR_BGR2RGB)
+        image_copy = processed_rgb.copy()
+        return cv2.resize(image_copy, display_size, interpolation=cv2.INTER_LINEAR)
+
+    pool = FramePool()
+
+    def display_pooled():
+        slot, buffer = pool.acquire((display_size[1], display_size[0], 3))
+        cv2.resize(frame_rgb, display_size, dst=buffer, interpolation=cv2.INTER_LINEAR)
+        pool.release(slot)
+
+    for name, func in (('display_legacy', display_legacy), ('display_pooled', display_pooled)):
+        stats = time_call(func, repeat, warmup)
+        stats['alloc_bytes'] = allocated_bytes(func)
+        results.append((name, {'size': list(display_size)}, stats))
+    return results
+
+def bench_matching(gallery_sizes, backends, num_queries, repeat, warmup):
+    """So khớp num_queries embedding với gallery tổng hợp ở từng kích thước."""
+    results = []
+    queries = synthetic_gallery(num_queries, seed=1)
+    for size in gallery_sizes:
+        gallery = synthetic_gallery(size)
+        for backend in backends:
+            start = time.perf_counter()
+            matcher = create_matcher(gallery, backend)
+            build_ms = (time.perf_counter() - start) * 1000.0
+            stats = time_call(lambda: matcher.search(queries, k=1), repeat, warmup)
+            stats['build_ms'] = build_ms
+            results.append(('match', {'gallery_size': size, 'backend': backend, 'queries': num_queries}, stats))
+            print(f"  match {backend:5s} gallery={size:>8d}: {stats['mean_ms']:.3f} ms", file=sys.stderr)
+        del gallery
+    return results
+
+def compare(results, baseline_path):
+    """In tỉ lệ thời gian so với file kết quả trước đó (cùng bước và tham số)."""
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {(item['stage'], json.dumps(item['params'], sort_keys=True)): item
+                    for item in json.load(file)['results']}
+    print(f"\nSo với {baseline_path}:")
+    for item in results:
+        key = (item['stage'], json.dumps(item['params'], sort_keys=True))
+        if key in baseline and baseline[key]['mean_ms'] > 0:
+            ratio = item['mean_ms'] / baseline[key]['mean_ms']
+            print(f"  {item['stage']:12s} {key[1]:60s} {ratio:6.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark từng bước của đường nhận diện khuôn mặt.")
+    parser.add_argument("--stub-models", action="store_true",
+                        help="Dùng detector/embedder thay thế xác định thay cho MTCNN/FaceNet (không cần trọng số).")
+    parser.add_argument("--faces", type=int, default=1, help="Số khuôn mặt mỗi khung của detector thay thế.")
+    parser.add_argument("--frames-from", help="Thư mục ảnh thật (vd. dataset) thay cho khung hình tổng hợp.")
+    parser.add_argument("--gallery-sizes", default=",".join(str(size) for size in GALLERY_SIZES),
+                        help="Kích thước gallery tổng hợp, cách nhau bởi dấu phẩy.")
+    parser.add_argument("--matchers", default="exact,ivf", help="Các backend so khớp cần đo.")
+    parser.add_argument("--queries", type=int, default=1, help="Số embedding truy vấn mỗi lần so khớp.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP)
+    parser.add_argument("--skip-frame-stages", action="store_true", help="Chỉ đo so khớp gallery.")
+    parser.add_argument("--output", help="Ghi kết quả JSON vào file (mặc định in ra stdout).")
+    parser.add_argument("--compare", help="File JSON kết quả trước đó để so sánh.")
+    args = parser.parse_args()
+
+    results = []
+    if not args.skip_frame_stages:
+        frames = load_frames(args.frames_from) if args.frames_from else []
+        frames = frames or [synthetic_frame(seed) for seed in range(4)]
+        detector, embedder = load_models(args.stub_models, args.faces)
+        results += bench_frame_stages(detector, embedder, frames, args.repeat, args.warmup)
+
+    gallery_sizes = [int(size) for size in args.gallery_sizes.split(",") if size.strip()]
+    backends = [backend.strip() for backend in args.matchers.split(",") if backend.strip()]
+    results += bench_matching(gallery_sizes, backends, args.queries, args.repeat, args.warmup)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+            'stub_models': args.stub_models,
+            'frame_size': [FRAME_WIDTH, FRAME_HEIGHT],
+        },
+        'results': [dict(stage=stage, params=params, **stats) for stage, params, stats in results],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+        print(f"Đã ghi kết quả vào {args.output}")
+    else:
+        print(text)
+    if args.compare:
+        compare(report['results'], args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import EMBEDDING_DIM
+from embedding_store import load_gallery
+from face_matcher import RECOGNITION_THRESHOLD, create_matcher
+from gallery_prototypes import MAX_PROTOTYPES_PER_PERSON, OUTLIER_THRESHOLD, build_prototypes, condense_identity
+
+# So sánh gallery mỗi ảnh một hàng với gallery prototype bằng leave-one-out: mỗi ảnh (của người có ít nhất
+# hai ảnh) lần lượt làm truy vấn với gallery dựng từ mọi ảnh còn lại. Báo cáo độ chính xác top-1, số hàng
+# gallery và thời gian so khớp.
+# Chạy từ thư mục gốc: python -m benchmarks.evaluate_prototypes --embeddings EmbeddingPicture/Embeddings_Facenet.emb
+# hoặc với dữ liệu giả: python -m benchmarks.evaluate_prototypes --synthetic
+EMBEDDING_FILEPATH = os.path.join("EmbeddingPicture", "Embeddings_Facenet.emb")
+SYNTHETIC_PEOPLE = 500
+SYNTHETIC_IMAGES_PER_PERSON = 10
+SYNTHETIC_SPREAD = 0.35  # Độ lệch giữa các ảnh của cùng người so với khoảng cách giữa hai người
+SYNTHETIC_OUTLIER_RATE = 0.02  # Tỉ lệ ảnh bị gán nhầm người (giống ảnh sai thư mục)
+QUERY_CHUNK_SIZE = 1024
+TIMING_QUERIES = 256
+
+def load_rows(path):
+    """Embedding và id của một store mỗi ảnh một hàng."""
+    store = load_gallery(path)
+    if store.header.get('gallery') == 'prototype':
+        raise ValueError(f"{path} là gallery prototype, cần gallery mỗi ảnh một hàng.")
+    return np.asarray(store.embeddings, dtype=np.float32), np.array(store.ids.tolist())
+
+def synthetic_rows(people=SYNTHETIC_PEOPLE, images_per_person=SYNTHETIC_IMAGES_PER_PERSON, dim=EMBEDDING_DIM,
+                   spread=SYNTHETIC_SPREAD, outlier_rate=SYNTHETIC_OUTLIER_RATE, seed=0):
+    """Embedding giả đã chuẩn hóa L2: mỗi người là một tâm, các ảnh là tâm cộng nhiễu; một phần nhỏ bị gán nhầm người."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((people, dim)).astype(np.float32)
+    owners = np.repeat(np.arange(people), images_per_person)
+    sources = owners.copy()
+    mislabeled = rng.random(len(owners)) < outlier_rate
+    sources[mislabeled] = rng.integers(0, people, mislabeled.sum())
+    noise = rng.standard_normal((len(owners), dim)).astype(np.float32) * spread
+    rows = centers[sources] + noise
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows, np.array([f"{owner:05d}" for owner in owners])
+
+def _nearest(queries, gallery):
+    """(khoảng cách, chỉ số) của hàng gần nhất trong gallery cho mỗi truy vấn."""
+    squared = (queries ** 2).sum(1)[:, None] - 2.0 * queries @ gallery.T + (gallery ** 2).sum(1)[None, :]
+    nearest = squared.argmin(axis=1)
+    return np.sqrt(np.maximum(squared[np.arange(len(queries)), nearest], 0.0)), nearest
+
+def _per_image_loo(embeddings, labels, queries):
+    distances, predicted = np.empty(len(queries)), np.empty(len(queries), dtype=labels.dtype)
+    for start in range(0, len(queries), QUERY_CHUNK_SIZE):
+        chunk = queries[start:start + QUERY_CHUNK_SIZE]
+        squared = (embeddings[chunk] ** 2).sum(1)[:, None] - 2.0 * embeddings[chunk] @ embeddings.T + (embeddings ** 2).sum(1)[None, :]
+        squared[np.arange(len(chunk)), chunk] = np.inf  # Bỏ chính ảnh truy vấn
+        nearest = squared.argmin(axis=1)
+        distances[start:start + len(chunk)] = np.sqrt(np.maximum(squared[np.arange(len(chunk)), nearest], 0.0))
+        predicted[start:start + len(chunk)] = labels[nearest]
+    return distances, predicted
+
+def _prototype_loo(embeddings, labels, queries, method, max_prototypes, outlier_threshold):
+    """Prototype của người khác dựng một lần; prototype của người có ảnh truy vấn được dựng lại không có ảnh đó."""
+    gallery, gallery_ids, _, report = build_prototypes(embeddings, labels.tolist(), labels.tolist(), method,
+                                                       max_prototypes, outlier_threshold)
+    gallery_ids = np.array(gallery_ids)
+    rows_by_id = {}
+    for row, user_id in enumerate(labels):
+        rows_by_id.setdefault(user_id, []).append(row)
+
+    distances, predicted = np.empty(len(queries)), np.empty(len(queries), dtype=labels.dtype)
+    for start in range(0, len(queries), QUERY_CHUNK_SIZE):
+        chunk = queries[start:start + QUERY_CHUNK_SIZE]
+        squared = (embeddings[chunk] ** 2).sum(1)[:, None] - 2.0 * embeddings[chunk] @ gallery.T + (gallery ** 2).sum(1)[None, :]
+        for position, row in enumerate(chunk):
+            user_id = labels[row]
+            squared[position, gallery_ids == user_id] = np.inf
+            best = int(squared[position].argmin())
+            best_distance, best_label = np.sqrt(max(squared[position, best], 0.0)), gallery_ids[best]
+            others = [r for r in rows_by_id[user_id] if r != row]
+            own, _, _ = condense_identity(embeddings[others], method, max_prototypes, outlier_threshold)
+            own_distance, _ = _nearest(embeddings[row][None], own)
+            if own_distance[0] < best_distance:
+                best_distance, best_label = own_distance[0], user_id
+            distances[start + position], predicted[start + position] = best_distance, best_label
+    return distances, predicted, gallery, report
+
+def _match_time_ms(gallery, queries):
+    matcher = create_matcher(gallery, 'exact')
+    matcher.search(queries[:8])
+    started = time.perf_counter()
+    matcher.search(queries)
+    return (time.perf_counter() - started) * 1000.0 / len(queries)
+
+def _summary(labels, queries, distances, predicted, threshold):
+    truth = labels[queries]
+    accepted = distances < threshold
+    return {
+        'top1_accuracy': float(np.mean(accepted & (predicted == truth))),
+        'nearest_identity_accuracy': float(np.mean(predicted == truth)),  # Bỏ qua ngưỡng
+        'false_accept_rate': float(np.mean(accepted & (predicted != truth))),
+        'reject_rate': float(np.mean(~accepted)),
+    }
+
+def evaluate(embeddings, labels, methods=('mean', 'medoids'), max_prototypes=MAX_PROTOTYPES_PER_PERSON,
+             threshold=RECOGNITION_THRESHOLD, outlier_threshold=OUTLIER_THRESHOLD):
+    """Báo cáo leave-one-out cho gallery mỗi ảnh một hàng và từng kiểu prototype."""
+    counts = {user_id: count for user_id, count in zip(*np.unique(labels, return_counts=True))}
+    queries = np.array([row for row, user_id in enumerate(labels) if counts[user_id] >= 2], dtype=np.int64)
+    if len(queries) == 0:
+        raise ValueError("Cần ít nhất một người có từ hai ảnh trở lên.")
+    timing_queries = embeddings[queries[:TIMING_QUERIES]]
+
+    report = {'rows': len(embeddings), 'people': len(counts), 'queries': len(queries), 'threshold': threshold,
+              'galleries': {}}
+    print(f"Đánh giá {len(queries)} truy vấn trên {len(embeddings)} hàng, {len(counts)} người.", file=sys.stderr)
+
+    distances, predicted = _per_image_loo(embeddings, labels, queries)
+    baseline = _summary(labels, queries, distances, predicted, threshold)
+    baseline.update({'gallery_rows': len(embeddings), 'match_ms_per_query': _match_time_ms(embeddings, timing_queries)})
+    report['galleries']['image'] = baseline
+
+    for method in methods:
+        print(f"  Prototype '{method}'...", file=sys.stderr)
+        distances, predicted, gallery, build_report = _prototype_loo(embeddings, labels, queries, method,
+                                                                     max_prototypes, outlier_threshold)
+        result = _summary(labels, queries, distances, predicted, threshold)
+        result.update({
+            'gallery_rows': len(gallery),
+            'compression': len(embeddings) / len(gallery),
+            'match_ms_per_query': _match_time_ms(gallery, timing_queries),
+            'max_prototypes': build_report['max_prototypes'],
+            'outliers': len(build_report['outliers']),
+            'top1_accuracy_change': result['top1_accuracy'] - baseline['top1_accuracy'],
+        })
+        report['galleries'][method] = result
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đánh giá gallery prototype so với gallery mỗi ảnh một hàng (leave-one-out).")
+    parser.add_argument("--embeddings", default=EMBEDDING_FILEPATH, help="Store mỗi ảnh một hàng (CodeGenerator không dùng --prototypes).")
+    parser.add_argument("--synthetic", action="store_true", help="Dùng embedding giả thay vì store.")
+    parser.add_argument("--people", type=int, default=SYNTHETIC_PEOPLE)
+    parser.add_argument("--images-per-person", type=int, default=SYNTHETIC_IMAGES_PER_PERSON)
+    parser.add_argument("--methods", default="mean,medoids")
+    parser.add_argument("--max-prototypes", type=int, default=MAX_PROTOTYPES_PER_PERSON)
+    parser.add_argument("--threshold", type=float, default=RECOGNITION_THRESHOLD)
+    parser.add_argument("--outlier-threshold", type=float, default=OUTLIER_THRESHOLD)
+    parser.add_argument("--output", help="Ghi báo cáo JSON vào file (mặc định in ra stdout).")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings, labels = synthetic_rows(args.people, args.images_per_person)
+    else:
+        embeddings, labels = load_rows(args.embeddings)
+    report = evaluate(embeddings, labels, [m.strip() for m in args.methods.split(",") if m.strip()],
+                      args.max_prototypes, args.threshold, args.outlier_threshold)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    print(output)
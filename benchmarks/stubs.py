@@ -0,0 +1,47 @@
+import numpy as np
+
+# Mô hình thay thế có kết quả xác định, để chạy benchmark khi không có trọng số MTCNN/FaceNet.
+EMBEDDING_DIM = 512
+
+class StubDetector:
+    """Thay MTCNN: trả về num_faces box cố định, phân bố đều theo chiều ngang khung hình.
+
+    Có cùng cấu trúc kết quả với MTCNN.detect_faces ('box', 'confidence', 'keypoints').
+    """
+
+    def __init__(self, num_faces=1):
+        self.num_faces = num_faces
+
+    def detect_faces(self, img, **kwargs):
+        height, width = img.shape[:2]
+        size = max(1, min(height // 2, width // max(1, self.num_faces)))
+        faces = []
+        for i in range(self.num_faces):
+            x, y = i * size, (height - size) // 2
+            faces.append({
+                'box': [x, y, size, size],
+                'confidence': 0.99,
+                'keypoints': {
+                    'left_eye': (x + size // 3, y + size // 3), 'right_eye': (x + 2 * size // 3, y + size // 3),
+                    'nose': (x + size // 2, y + size // 2),
+                    'mouth_left': (x + size // 3, y + 2 * size // 3), 'mouth_right': (x + 2 * size // 3, y + 2 * size // 3),
+                },
+            })
+        return faces
+
+class StubEmbedder:
+    """Thay FaceNet: chiếu ngẫu nhiên cố định của ảnh thu nhỏ, chuẩn hóa L2 như embedding thật."""
+
+    def __init__(self, dim=EMBEDDING_DIM, seed=0, pool=8):
+        self.pool = pool
+        rng = np.random.default_rng(seed)
+        self._projection = rng.standard_normal((pool * pool * 3, dim)).astype(np.float32)
+
+    def embeddings(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        n, h, w, c = images.shape
+        pooled = images[:, :h - h % self.pool, :w - w % self.pool].reshape(
+            n, self.pool, h // self.pool, self.pool, w // self.pool, c).mean(axis=(2, 4))
+        vectors = pooled.reshape(n, -1) @ self._projection
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_ingest import extract_face
+from face_matcher import RECOGNITION_THRESHOLD
+from model_registry import EMBEDDER_FACTORIES, get_detector, get_embedder
+
+# So sánh các backend embedder với backend tham chiếu (Keras) trên thư mục dataset/:
+# độ lệch embedding, tỉ lệ trùng kết quả top-1 và tốc độ.
+# Chạy từ thư mục gốc: python -m benchmarks.validate_embedder --backends graph,tflite-fp16,tflite-int8
+IMAGES_FOLDER = "dataset"
+REFERENCE_BACKEND = 'keras'
+THROUGHPUT_BATCH_SIZES = (1, 32)
+THROUGHPUT_REPEAT = 10
+
+def load_faces(folder):
+    """Cắt khuôn mặt của mọi ảnh trong dataset/<id>_<tên>/. Trả về (mảng khuôn mặt, nhãn id)."""
+    detector = get_detector()
+    faces, labels = [], []
+    for person_folder in sorted(os.listdir(folder)):
+        person_path = os.path.join(folder, person_folder)
+        if not os.path.isdir(person_path) or person_folder.startswith('.'):
+            continue
+        user_id = person_folder.split('_', 1)[0].strip()
+        for filename in sorted(os.listdir(person_path)):
+            face, _, message = extract_face(detector, os.path.join(person_path, filename), filename)
+            if face is not None:
+                faces.append(face)
+                labels.append(user_id)
+            elif message:
+                print(message, file=sys.stderr)
+    return np.stack(faces) if faces else np.empty((0, 160, 160, 3), np.uint8), np.array(labels)
+
+def _pairwise(queries, gallery):
+    squared = (queries ** 2).sum(1)[:, None] - 2.0 * queries @ gallery.T + (gallery ** 2).sum(1)[None, :]
+    return np.sqrt(np.maximum(squared, 0.0))
+
+def leave_one_out(queries, gallery, labels, threshold):
+    """Nhận diện từng ảnh với gallery gồm mọi ảnh khác. Trả về (chỉ số hàng gần nhất, nhãn dự đoán)."""
+    distances = _pairwise(queries, gallery)
+    np.fill_diagonal(distances, np.inf)
+    nearest = distances.argmin(axis=1)
+    predicted = np.where(distances[np.arange(len(queries)), nearest] < threshold, labels[nearest], None)
+    return nearest, predicted
+
+def measure_throughput(embedder, face):
+    results = {}
+    for batch_size in THROUGHPUT_BATCH_SIZES:
+        batch = np.repeat(face[None], batch_size, axis=0)
+        embedder.embeddings(batch)  # Chạy thử
+        start = time.perf_counter()
+        for _ in range(THROUGHPUT_REPEAT):
+            embedder.embeddings(batch)
+        elapsed = (time.perf_counter() - start) / THROUGHPUT_REPEAT
+        results[str(batch_size)] = {'batch_ms': elapsed * 1000.0, 'faces_per_s': batch_size / elapsed}
+    return results
+
+def validate(backends, folder=IMAGES_FOLDER, threshold=RECOGNITION_THRESHOLD):
+    faces, labels = load_faces(folder)
+    if len(faces) < 2:
+        raise ValueError(f"Cần ít nhất 2 khuôn mặt trong {folder} để đánh giá.")
+    print(f"Đã cắt {len(faces)} khuôn mặt của {len(set(labels))} người.", file=sys.stderr)
+
+    reference = get_embedder(REFERENCE_BACKEND)
+    ref_embeddings = np.asarray(reference.embeddings(faces), dtype=np.float32)
+    ref_nearest, ref_predicted = leave_one_out(ref_embeddings, ref_embeddings, labels, threshold)
+
+    report = {'faces': len(faces), 'people': len(set(labels)), 'threshold': threshold, 'backends': {}}
+    for backend in [REFERENCE_BACKEND] + [b for b in backends if b != REFERENCE_BACKEND]:
+        embedder = get_embedder(backend)
+        embeddings = ref_embeddings if backend == REFERENCE_BACKEND else np.asarray(embedder.embeddings(faces), np.float32)
+        drift = np.linalg.norm(embeddings - ref_embeddings, axis=1)
+        cosine = (embeddings * ref_embeddings).sum(1) / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(ref_embeddings, axis=1) + 1e-12)
+
+        # Cả truy vấn và gallery dùng backend này (gallery đã tạo lại bằng backend mới)
+        nearest, predicted = leave_one_out(embeddings, embeddings, labels, threshold)
+        # Truy vấn bằng backend này, gallery cũ tạo bằng backend tham chiếu
+        cross_nearest, cross_predicted = leave_one_out(embeddings, ref_embeddings, labels, threshold)
+
+        report['backends'][backend] = {
+            'drift_l2': {'mean': float(drift.mean()), 'p95': float(np.percentile(drift, 95)), 'max': float(drift.max())},
+            'cosine_to_reference': {'mean': float(cosine.mean()), 'min': float(cosine.min())},
+            'top1_agreement': float(np.mean(nearest == ref_nearest)),
+            'top1_agreement_reference_gallery': float(np.mean(cross_nearest == ref_nearest)),
+            'accuracy': float(np.mean(predicted == labels)),
+            'accuracy_reference_gallery': float(np.mean(cross_predicted == labels)),
+            'reference_accuracy': float(np.mean(ref_predicted == labels)),
+            'throughput': measure_throughput(embedder, faces[0]),
+        }
+        summary = report['backends'][backend]
+        print(f"  {backend:12s} drift={summary['drift_l2']['mean']:.4f} top1={summary['top1_agreement']:.3f} "
+              f"acc={summary['accuracy']:.3f} {summary['throughput'][str(THROUGHPUT_BATCH_SIZES[-1])]['faces_per_s']:.1f} mặt/s",
+              file=sys.stderr)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kiểm tra độ lệch và độ chính xác của các backend embedder.")
+    parser.add_argument("--backends", default=",".join(b for b in EMBEDDER_FACTORIES if b != REFERENCE_BACKEND),
+                        help="Các backend cần kiểm tra, cách nhau bởi dấu phẩy.")
+    parser.add_argument("--dataset", default=IMAGES_FOLDER)
+    parser.add_argument("--threshold", type=float, default=RECOGNITION_THRESHOLD)
+    parser.add_argument("--output", help="Ghi báo cáo JSON vào file (mặc định in ra stdout).")
+    args = parser.parse_args()
+
+    report = validate([b.strip() for b in args.backends.split(",") if b.strip()], args.dataset, args.threshold)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+        print(f"Đã ghi báo cáo vào {args.output}", file=sys.stderr)
+    else:
+        print(text)
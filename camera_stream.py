@@ -0,0 +1,133 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+# Cấu hình
+CAMERA_WIDTH = 640
+CAMERA_HEIGHT = 480
+READ_RETRY_DELAY = 0.05  # Chờ trước khi đọc lại khi camera tạm thời không trả khung hình
+
+def open_capture(source, width=CAMERA_WIDTH, height=CAMERA_HEIGHT):
+    """Mở nguồn video: chỉ số thiết bị (int hoặc chuỗi số), đường dẫn file hoặc URL (rtsp://, http://...)."""
+    if isinstance(source, str) and source.strip().isdigit():
+        source = int(source.strip())
+    cap = cv2.VideoCapture(source)
+    if cap.isOpened() and isinstance(source, int):
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return cap
+
+class LatestFrameGrabber:
+    """Đọc khung hình trên một luồng riêng và chỉ giữ khung mới nhất.
+
+    Khi xử lý chậm hơn camera, các khung cũ bị bỏ (đếm trong dropped_frames) thay vì dồn lại trong
+    bộ đệm của driver, nên khung hình đọc được luôn gần với thời điểm hiện tại. Có thể dùng thay cho
+    cv2.VideoCapture trong các vòng lặp hiện có (read, isOpened, get, release).
+    """
+
+    def __init__(self, capture, pace_files=True):
+        self.capture = capture
+        self.timestamp = None  # Thời điểm (time.time()) chụp khung vừa trả về bởi read()
+        self.frames_captured = 0
+        self.dropped_frames = 0
+        self.finished = False  # True khi nguồn là file đã đọc hết hoặc camera bị ngắt
+
+        # Nguồn là file thì giữ nhịp theo FPS của video để mô phỏng camera thật
+        self._frame_interval = 0.0
+        if pace_files and capture.get(cv2.CAP_PROP_FRAME_COUNT) > 0:
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            self._frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+
+        self._condition = threading.Condition()
+        self._front = None  # Bộ đệm chứa khung mới nhất
+        self._back = None  # Bộ đệm luồng đọc ghi vào, hoán đổi với _front sau mỗi khung
+        self._front_timestamp = None
+        self._seq = 0
+        self._consumed_seq = 0
+        self._running = False
+        self._thread = None
+
+    @classmethod
+    def open(cls, source, width=CAMERA_WIDTH, height=CAMERA_HEIGHT, **kwargs):
+        """Mở nguồn video và bắt đầu đọc. Trả về None nếu không mở được."""
+        cap = open_capture(source, width, height)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        return cls(cap, **kwargs).start()
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._grab_loop, name="frame-grabber", daemon=True)
+            self._thread.start()
+        return self
+
+    def _grab_loop(self):
+        next_frame_time = time.monotonic()
+        while self._running:
+            ret, frame = self.capture.read(self._back) if self._back is not None else self.capture.read()
+            if not ret:
+                if self._frame_interval > 0 or not self.capture.isOpened():
+                    with self._condition:
+                        self.finished = True
+                        self._condition.notify_all()
+                    return
+                time.sleep(READ_RETRY_DELAY)
+                continue
+
+            now = time.time()
+            with self._condition:
+                # Hoán đổi bộ đệm: khung mới thành _front, bộ đệm cũ được tái sử dụng cho lần đọc sau
+                self._back, self._front = self._front, frame
+                self._front_timestamp = now
+                if self._seq > self._consumed_seq:
+                    self.dropped_frames += 1
+                self._seq += 1
+                self.frames_captured += 1
+                self._condition.notify_all()
+
+            if self._frame_interval > 0:
+                next_frame_time += self._frame_interval
+                delay = next_frame_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame_time = time.monotonic()
+
+    def read(self, out=None, timeout=1.0):
+        """Chờ khung hình mới hơn lần đọc trước và trả về (ret, frame) giống cv2.VideoCapture.read.
+
+        Khung được sao chép vào out nếu truyền vào một mảng cùng kích thước, tránh cấp phát mới.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._seq > self._consumed_seq or self.finished, timeout):
+                return False, None
+            if self._seq <= self._consumed_seq:
+                return False, None
+            if out is not None and out.shape == self._front.shape and out.dtype == self._front.dtype:
+                np.copyto(out, self._front)
+                frame = out
+            else:
+                frame = self._front.copy()
+            self.timestamp = self._front_timestamp
+            self._consumed_seq = self._seq
+            return True, frame
+
+    def isOpened(self):
+        return self.capture.isOpened() and not self.finished
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def release(self):
+        """Dừng luồng đọc và giải phóng nguồn video."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.capture.release()
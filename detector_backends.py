@@ -0,0 +1,107 @@
+import os
+import cv2
+import numpy as np
+
+# Các bộ phát hiện khuôn mặt thay thế MTCNN, cùng giao diện detect_faces(img_rgb, min_face_size=None) và
+# cùng cấu trúc kết quả: [{'box': [x, y, w, h], 'confidence': float, 'keypoints': {...}}].
+# keypoints dùng tên của MTCNN (left_eye, right_eye, nose, mouth_left, mouth_right, theo phía trong ảnh);
+# bộ phát hiện không có điểm mốc trả về {}. Chọn qua model_registry (get_detector('yunet')) hoặc
+# biến môi trường FACE_DETECTOR_BACKEND.
+MODEL_FOLDER = "models"
+YUNET_MODEL = os.path.join(MODEL_FOLDER, "face_detection_yunet_2023mar.onnx")
+SSD_PROTOTXT = os.path.join(MODEL_FOLDER, "deploy.prototxt")
+SSD_WEIGHTS = os.path.join(MODEL_FOLDER, "res10_300x300_ssd_iter_140000.caffemodel")
+HAAR_CASCADE = "haarcascade_frontalface_default.xml"
+YUNET_SCORE_THRESHOLD = 0.6
+YUNET_NMS_THRESHOLD = 0.3
+SSD_CONFIDENCE_THRESHOLD = 0.5
+SSD_INPUT_SIZE = (300, 300)
+SSD_MEAN = (104.0, 177.0, 123.0)
+HAAR_SCALE_FACTOR = 1.1
+HAAR_MIN_NEIGHBORS = 5
+DEFAULT_MIN_FACE_SIZE = 20
+
+def _require(path, hint):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Không tìm thấy model {path}. {hint}")
+    return path
+
+def _face(x, y, w, h, confidence, keypoints=None):
+    return {'box': [int(round(x)), int(round(y)), int(round(w)), int(round(h))],
+            'confidence': float(confidence), 'keypoints': keypoints or {}}
+
+class YuNetDetector:
+    """YuNet (cv2.FaceDetectorYN, OpenCV >= 4.5.4): nhanh trên CPU, có 5 điểm mốc như MTCNN."""
+
+    def __init__(self, model_path=YUNET_MODEL, score_threshold=YUNET_SCORE_THRESHOLD, nms_threshold=YUNET_NMS_THRESHOLD):
+        _require(model_path, "Tải face_detection_yunet_2023mar.onnx từ opencv_zoo vào thư mục models/.")
+        self._detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, nms_threshold)
+        self._input_size = None
+
+    def detect_faces(self, img, min_face_size=None):
+        height, width = img.shape[:2]
+        if self._input_size != (width, height):
+            self._detector.setInputSize((width, height))
+            self._input_size = (width, height)
+        _, detections = self._detector.detect(cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+        if detections is None:
+            return []
+
+        faces = []
+        for row in detections:
+            x, y, w, h = row[:4]
+            if min_face_size and min(w, h) < min_face_size:
+                continue
+            # Thứ tự điểm mốc của YuNet: mắt phải, mắt trái, mũi, khóe miệng phải, khóe miệng trái (của người
+            # trong ảnh), tương ứng left_eye, right_eye, ..., mouth_left, mouth_right theo phía trong ảnh của MTCNN
+            points = [(int(round(row[i])), int(round(row[i + 1]))) for i in range(4, 14, 2)]
+            keypoints = dict(zip(('left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right'), points))
+            faces.append(_face(x, y, w, h, row[14], keypoints))
+        return faces
+
+class SSDDetector:
+    """OpenCV DNN SSD ResNet-10 (res10_300x300): chính xác hơn Haar, không có điểm mốc."""
+
+    def __init__(self, prototxt=SSD_PROTOTXT, weights=SSD_WEIGHTS, confidence_threshold=SSD_CONFIDENCE_THRESHOLD):
+        hint = "Tải deploy.prototxt và res10_300x300_ssd_iter_140000.caffemodel (OpenCV face_detector) vào thư mục models/."
+        self._net = cv2.dnn.readNetFromCaffe(_require(prototxt, hint), _require(weights, hint))
+        self.confidence_threshold = confidence_threshold
+
+    def detect_faces(self, img, min_face_size=None):
+        height, width = img.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(img, SSD_INPUT_SIZE), 1.0, SSD_INPUT_SIZE, SSD_MEAN, swapRB=True)
+        self._net.setInput(blob)
+        detections = self._net.forward()[0, 0]
+
+        faces = []
+        for detection in detections[detections[:, 2] >= self.confidence_threshold]:
+            x1, y1, x2, y2 = detection[3:7] * np.array([width, height, width, height])
+            x1, y1 = max(0.0, x1), max(0.0, y1)
+            w, h = min(float(width), x2) - x1, min(float(height), y2) - y1
+            if w <= 0 or h <= 0 or (min_face_size and min(w, h) < min_face_size):
+                continue
+            faces.append(_face(x1, y1, w, h, detection[2]))
+        return faces
+
+class HaarDetector:
+    """Haar cascade đi kèm OpenCV: rất nhẹ cho máy yếu, chỉ khuôn mặt chính diện, không có điểm mốc.
+
+    Haar không có điểm tin cậy chuẩn hóa nên confidence luôn là 1.0.
+    """
+
+    def __init__(self, cascade=HAAR_CASCADE, scale_factor=HAAR_SCALE_FACTOR, min_neighbors=HAAR_MIN_NEIGHBORS):
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise ImportError("Bản OpenCV này không có CascadeClassifier (đã tách khỏi OpenCV 5).")
+        path = cascade if os.path.exists(cascade) else os.path.join(cv2.data.haarcascades, cascade)
+        self._cascade = cv2.CascadeClassifier(path)
+        if self._cascade.empty():
+            raise FileNotFoundError(f"Không thể nạp Haar cascade: {path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect_faces(self, img, min_face_size=None):
+        gray = cv2.equalizeHist(cv2.cvtColor(img, cv2.COLOR_RGB2GRAY))
+        min_size = int(min_face_size or DEFAULT_MIN_FACE_SIZE)
+        boxes = self._cascade.detectMultiScale(gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                                               minSize=(min_size, min_size))
+        return [_face(x, y, w, h, 1.0) for x, y, w, h in boxes]
@@ -0,0 +1,166 @@
+import copy
+import os
+import threading
+import numpy as np
+
+# Các backend tạo embedding FaceNet trên CPU, cùng giao diện embedder.embeddings(batch) nên mọi nơi đang gọi
+# dùng được ngay. Backend 'graph' là bản sao nông của FaceNet (keras_facenet) với .model được thay bằng đồ thị
+# đóng băng; backend TFLite chỉ cần bộ chạy TFLite và file model đã chuyển đổi, không nhập Keras/FaceNet.
+# Chọn backend qua model_registry (get_embedder('tflite-int8')) hoặc biến môi trường FACE_EMBEDDER_BACKEND.
+MODEL_CACHE_FOLDER = "models"  # Nơi lưu model TFLite đã chuyển đổi
+TFLITE_FILENAMES = {'fp16': "facenet_fp16.tflite", 'int8': "facenet_int8.tflite"}
+TFLITE_THREADS = os.cpu_count() or 1
+TFLITE_BATCH_SIZE = 8  # Kích thước lô cố định của Interpreter: lô nhỏ hơn được đệm, lô lớn hơn được chia
+
+class _PredictAdapter:
+    """Thay cho keras Model trong FaceNet: chỉ cung cấp predict(x) mà FaceNet.embeddings dùng."""
+
+    def __init__(self, predict_fn, input_shape):
+        self._predict_fn = predict_fn
+        self.input_shape = input_shape
+
+    def predict(self, x, **kwargs):
+        x = np.asarray(x, dtype=np.float32)
+        if len(x) == 0:
+            return np.empty((0, 0), np.float32)
+        return self._predict_fn(x)
+
+def _wrap(facenet, predict_fn, backend):
+    embedder = copy.copy(facenet)
+    embedder.model = _PredictAdapter(predict_fn, facenet.model.input_shape)
+    embedder.backend = backend
+    return embedder
+
+def _load_facenet():
+    """FaceNet Keras riêng cho việc dựng backend khác, không lưu vào model_registry nên được giải phóng sau khi dùng."""
+    from keras_facenet import FaceNet
+    return FaceNet()
+
+def create_keras_embedder(**options):
+    """Backend tham chiếu: model Keras đầy đủ của keras_facenet, chạy float32 qua model.predict."""
+    from keras_facenet import FaceNet
+    embedder = FaceNet(**options)
+    embedder.backend = 'keras'
+    return embedder
+
+def create_graph_embedder(**options):
+    """Đồ thị TensorFlow đóng băng (biến thành hằng số) với chữ ký đầu vào cố định.
+
+    Gọi trực tiếp hàm đã biên dịch nên tránh chi phí của model.predict (tạo dataset, callback) cho mỗi lô nhỏ,
+    Grappler tối ưu đồ thị một lần khi tạo.
+    """
+    import tensorflow as tf
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    facenet = _load_facenet()
+    model = facenet.model
+    signature = tf.TensorSpec([None] + list(model.input_shape[1:]), tf.float32)
+    concrete = tf.function(lambda x: model(x, training=False)).get_concrete_function(signature)
+    frozen = convert_variables_to_constants_v2(concrete)
+
+    def predict(x):
+        outputs = frozen(tf.constant(x))
+        return (outputs[0] if isinstance(outputs, (list, tuple)) else outputs).numpy()
+
+    # Bản sao không giữ model Keras: đồ thị đóng băng đã chứa trọng số dưới dạng hằng số
+    return _wrap(facenet, predict, 'graph')
+
+def _load_interpreter_class():
+    """Ưu tiên tflite_runtime (nhẹ, dùng trên máy biên), nếu không có thì dùng tf.lite."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+def convert_to_tflite(quantization, output_path):
+    """Chuyển model Keras tham chiếu sang TFLite đã lượng tử hóa và ghi ra output_path.
+
+    Model Keras chỉ được tải cho lần chuyển đổi này và bị bỏ ngay sau đó.
+
+    'fp16': trọng số float16. 'int8': lượng tử hóa dải động, trọng số int8 và phép nhân ma trận int8,
+    đầu vào/ra vẫn là float32 nên không cần dữ liệu hiệu chỉnh.
+    """
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(_load_facenet().model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization != 'int8':
+        raise ValueError(f"Kiểu lượng tử hóa không hợp lệ: {quantization}")
+    tflite_model = converter.convert()
+
+    folder = os.path.dirname(output_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(tflite_model)
+    os.replace(tmp_path, output_path)
+    print(f"Đã chuyển FaceNet sang TFLite ({quantization}): {output_path}")
+    return output_path
+
+class _TFLiteRunner:
+    """Chạy model TFLite với lô cố định TFLITE_BATCH_SIZE (cấp phát tensor một lần); dùng khóa vì Interpreter
+    không an toàn luồng.
+    """
+
+    def __init__(self, model_path, num_threads=TFLITE_THREADS):
+        self.interpreter = _load_interpreter_class()(model_path=model_path, num_threads=num_threads)
+        details = self.interpreter.get_input_details()[0]
+        self.interpreter.resize_tensor_input(details['index'], [TFLITE_BATCH_SIZE] + list(details['shape'][1:]))
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._padded = np.zeros(self._input['shape'], dtype=self._input['dtype'])
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        return (None,) + tuple(int(v) for v in self._input['shape'][1:])
+
+    def __call__(self, x):
+        outputs = []
+        with self._lock:
+            for start in range(0, len(x), TFLITE_BATCH_SIZE):
+                chunk = x[start:start + TFLITE_BATCH_SIZE]
+                self._padded[:len(chunk)] = chunk  # Các hàng đệm phía sau cho ra kết quả bị bỏ đi
+                self.interpreter.set_tensor(self._input['index'], self._padded)
+                self.interpreter.invoke()
+                outputs.append(self.interpreter.get_tensor(self._output['index'])[:len(chunk)].copy())
+        return np.concatenate(outputs)
+
+def create_tflite_embedder(quantization, model_path=None, num_threads=TFLITE_THREADS):
+    """Backend TFLite lượng tử hóa. Nếu file model trong MODEL_CACHE_FOLDER đã có thì chỉ cần bộ chạy TFLite;
+    chỉ lần đầu mới chuyển đổi (cần TensorFlow và keras_facenet).
+    """
+    model_path = model_path or os.path.join(MODEL_CACHE_FOLDER, TFLITE_FILENAMES[quantization])
+    if not os.path.exists(model_path):
+        convert_to_tflite(quantization, model_path)
+    return TFLiteEmbedder(_TFLiteRunner(model_path, num_threads), f'tflite-{quantization}')
+
+class TFLiteEmbedder:
+    """Embedder TFLite độc lập, không cần keras_facenet hay TensorFlow (có thể chỉ cài tflite_runtime).
+
+    Tiền xử lý giống prewhiten của FaceNet: chuẩn hóa mỗi ảnh về trung bình 0, độ lệch chuẩn 1
+    (benchmarks/validate_embedder so kết quả với backend Keras).
+    """
+
+    def __init__(self, runner, backend):
+        self.model = _PredictAdapter(runner, runner.input_shape)
+        self.backend = backend
+
+    def embeddings(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        if len(images) == 0:
+            return self.model.predict(images)
+        mean = images.mean(axis=(1, 2, 3), keepdims=True)
+        std = np.maximum(images.std(axis=(1, 2, 3), keepdims=True), 1.0 / np.sqrt(images[0].size))
+        return self.model.predict((images - mean) / std)
+
+def create_tflite_fp16_embedder(**options):
+    return create_tflite_embedder('fp16', **options)
+
+def create_tflite_int8_embedder(**options):
+    return create_tflite_embedder('int8', **options)
@@ -0,0 +1,396 @@
+import argparse
+import base64
+import json
+import os
+import pickle
+import zlib
+import numpy as np
+
+# Định dạng file:
+#   [0, HEADER_SIZE)   : magic + header JSON (version, dim, count, offset các phần, checksum)
+#   ma trận embedding  : float32 liên tục, shape (count, dim), đọc bằng np.memmap (hoặc đọc hẳn vào RAM)
+#   id, name           : mỗi mảng gồm offsets int64 (count + 1) và một khối byte UTF-8
+# Hàng thêm lẻ (đăng ký người dùng) được ghi nối vào file nhật ký <store>.journal, mỗi dòng một JSON gắn
+# với checksum của store gốc, thay vì ghi lại cả store; load_store gộp nhật ký vào kết quả. compact_store ghi
+# lại store một lần kèm các hàng đó và xóa nhật ký (enrollment gọi ngay sau khi thêm để load_store vẫn chỉ
+# memmap); nhật ký vượt JOURNAL_COMPACT_ROWS hàng cũng được gộp.
+STORE_MAGIC = b"FNETEMB\x00"
+STORE_VERSION = 1
+STORE_EXTENSION = ".emb"
+LEGACY_EXTENSION = ".p"
+HEADER_SIZE = 4096
+CHECKSUM_CHUNK_SIZE = 1 << 24
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_COMPACT_ROWS = 256  # Số hàng trong nhật ký trước khi gộp vào store
+_LAYOUT_KEYS = ('version', 'dtype', 'count', 'dim', 'embeddings_offset', 'id_offsets_offset', 'id_blob_offset',
+                'id_blob_size', 'name_offsets_offset', 'name_blob_offset', 'name_blob_size', 'checksum',
+                'journal_rows')
+
+class LabelArray:
+    """Mảng chuỗi lưu dạng offsets + khối byte UTF-8, chỉ giải mã phần tử khi được truy cập."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Chỉ số nằm ngoài phạm vi.")
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def tolist(self):
+        return list(self)
+
+class EmbeddingStore:
+    """Dữ liệu nhận diện: ma trận embedding float32 cùng mảng id và tên tương ứng từng hàng.
+
+    Truy cập store[i] trả về từ điển {'id', 'name', 'embedding'} giống định dạng pickle cũ.
+    """
+
+    def __init__(self, embeddings, ids, names, header=None):
+        self.embeddings = embeddings
+        self.ids = ids
+        self.names = names
+        self.header = header or {}
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def __getitem__(self, index):
+        return {'id': self.ids[index], 'name': self.names[index], 'embedding': self.embeddings[index]}
+
+def _encode_labels(values):
+    """Mã hóa danh sách chuỗi thành (offsets int64, khối byte)."""
+    if isinstance(values, LabelArray):
+        return np.asarray(values._offsets, dtype='<i8'), bytes(values._blob)
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    if encoded:
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+    return offsets, b"".join(encoded)
+
+def _merge_labels(labels, values):
+    """Nối thêm chuỗi vào LabelArray: chỉ nối khối byte và dịch offsets của phần thêm, không giải mã phần cũ."""
+    offsets, blob = _encode_labels(values)
+    offsets = np.concatenate([labels._offsets, offsets[1:] + labels._offsets[-1]])
+    blob = np.concatenate([np.asarray(labels._blob, dtype=np.uint8), np.frombuffer(blob, dtype=np.uint8)])
+    return LabelArray(offsets, blob)
+
+def _align(value, alignment=64):
+    return (value + alignment - 1) // alignment * alignment
+
+def save_store(path, embeddings, ids, names, metadata=None):
+    """Ghi store ra file tạm rồi thay thế file đích để người đọc không thấy file ghi dở.
+
+    Nhật ký của store cũ (nếu có) bị xóa: các hàng trong đó không thuộc store mới.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='<f4')
+    if embeddings.ndim != 2:
+        embeddings = embeddings.reshape(len(ids), -1) if len(ids) else embeddings.reshape(0, 0)
+    count, dim = embeddings.shape
+    if len(ids) != count or len(names) != count:
+        raise ValueError("Số lượng id, tên và embedding không khớp.")
+
+    id_offsets, id_blob = _encode_labels(ids)
+    name_offsets, name_blob = _encode_labels(names)
+    sections = [embeddings.tobytes(), id_offsets.tobytes(), id_blob, name_offsets.tobytes(), name_blob]
+
+    offsets = []
+    position = HEADER_SIZE
+    for section in sections:
+        offsets.append(position)
+        position = _align(position + len(section))
+
+    checksum = 0
+    for section in sections:
+        checksum = zlib.crc32(section, checksum)
+
+    header = dict(metadata or {})
+    header.update({
+        'version': STORE_VERSION,
+        'dtype': 'float32',
+        'count': count,
+        'dim': dim,
+        'embeddings_offset': offsets[0],
+        'id_offsets_offset': offsets[1],
+        'id_blob_offset': offsets[2],
+        'id_blob_size': len(id_blob),
+        'name_offsets_offset': offsets[3],
+        'name_blob_offset': offsets[4],
+        'name_blob_size': len(name_blob),
+        'checksum': checksum,
+    })
+    header_bytes = STORE_MAGIC + json.dumps(header).encode('utf-8')
+    if len(header_bytes) > HEADER_SIZE:
+        raise ValueError("Header của store quá lớn.")
+
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(header_bytes.ljust(HEADER_SIZE, b" "))
+        for offset, section in zip(offsets, sections):
+            file.seek(offset)
+            file.write(section)
+        file.truncate(position)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    try:
+        os.remove(journal_path(path))
+    except FileNotFoundError:
+        pass
+
+def journal_path(path):
+    return path + JOURNAL_SUFFIX
+
+def _journal_base(header):
+    return {'checksum': header['checksum'], 'count': header['count']}
+
+def _read_journal(path, header):
+    """(các bản ghi hợp lệ, số byte hợp lệ) của nhật ký thuộc store có header này.
+
+    Dừng ở dòng đầu tiên không đọc được (ghi dở khi tiến trình dừng) hoặc thuộc store khác
+    (store đã được ghi lại nhưng chưa kịp xóa nhật ký).
+    """
+    records, valid_size = [], 0
+    try:
+        with open(journal_path(path), 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return records, valid_size
+    base = _journal_base(header)
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        try:
+            record = json.loads(line.decode('utf-8'))
+            embeddings = np.frombuffer(base64.b64decode(record['embeddings']), dtype='<f4')
+            embeddings = embeddings.reshape(len(record['ids']), record['dim'])
+        except (ValueError, KeyError, TypeError):
+            break
+        if record.get('base') != base or len(record['names']) != len(record['ids']):
+            break
+        records.append((embeddings, record['ids'], record['names']))
+        valid_size += len(line)
+    return records, valid_size
+
+def _journal_rows(records):
+    return sum(len(ids) for _, ids, _ in records)
+
+def append_store(path, embeddings, ids, names):
+    """Thêm hàng vào cuối store; tạo store mới nếu chưa có. Trả về số hàng sau khi thêm.
+
+    Với gallery prototype chỉ được thêm người mới (ValueError nếu ID đã có trong store).
+
+    Hàng mới được ghi nối vào nhật ký (chỉ ghi và fsync phần thêm), store chỉ được ghi lại khi nhật ký
+    đầy hoặc khi gọi compact_store. Cả hai cách đều không làm người đọc thấy dữ liệu ghi dở.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+    if len(names) != len(ids):
+        raise ValueError("Số lượng id, tên và embedding không khớp.")
+    if not os.path.exists(path):
+        save_store(path, embeddings, ids, names)
+        return len(ids)
+
+    header = read_header(path)
+    records, valid_size = _read_journal(path, header)
+    dim = header['dim'] if header['count'] else (records[0][0].shape[1] if records else embeddings.shape[1])
+    if embeddings.shape[1] != dim:
+        raise ValueError(f"Kích thước embedding không khớp: {embeddings.shape[1]} != {dim}.")
+    total = header['count'] + _journal_rows(records) + len(ids)
+    if header.get('gallery') == 'prototype':
+        # Người mới với một ảnh chính là prototype của mình, nhưng thêm hàng cho người đã có sẽ làm
+        # gallery không còn đúng kiểu prototype ghi trong header
+        store = load_store(path, in_memory=True)
+        existing = set(store.ids) & {str(value) for value in ids}
+        del store
+        if existing:
+            raise ValueError(f"Gallery prototype đã có ID {', '.join(sorted(existing))}; "
+                             "hãy tạo lại bằng CodeGenerator --prototypes.")
+
+    record = {
+        'base': _journal_base(header),
+        'dim': int(embeddings.shape[1]),
+        'ids': [str(value) for value in ids],
+        'names': [str(value) for value in names],
+        'embeddings': base64.b64encode(np.ascontiguousarray(embeddings, dtype='<f4').tobytes()).decode('ascii'),
+    }
+    with open(journal_path(path), 'ab') as file:
+        file.truncate(valid_size)  # Bỏ dòng ghi dở hoặc của store cũ
+        file.write(json.dumps(record).encode('utf-8') + b"\n")
+        file.flush()
+        os.fsync(file.fileno())
+    if _journal_rows(records) + len(ids) > JOURNAL_COMPACT_ROWS:
+        compact_store(path)
+    return total
+
+def compact_store(path):
+    """Gộp nhật ký vào store (ghi lại store một lần rồi xóa nhật ký). Trả về số hàng gộp được."""
+    header = read_header(path)
+    records, _ = _read_journal(path, header)
+    if not records:
+        return 0
+    store = load_store(path, in_memory=True)  # Không giữ memmap khi thay file (Windows không cho)
+    metadata = {key: value for key, value in store.header.items() if key not in _LAYOUT_KEYS}
+    rows = store.header['journal_rows']
+    if 'source_count' in metadata:
+        metadata['source_count'] += rows
+    save_store(path, store.embeddings, store.ids, store.names, metadata)
+    return rows
+
+def read_header(path):
+    """Đọc và kiểm tra header của file store."""
+    with open(path, 'rb') as file:
+        raw = file.read(HEADER_SIZE)
+    if not raw.startswith(STORE_MAGIC):
+        raise ValueError(f"File không phải embedding store: {path}")
+    header = json.loads(raw[len(STORE_MAGIC):].decode('utf-8'))
+    if header.get('version') != STORE_VERSION:
+        raise ValueError(f"Phiên bản store không được hỗ trợ: {header.get('version')}")
+    return header
+
+def _map(path, dtype, offset, shape):
+    """memmap một phần của file; trả về mảng rỗng nếu phần đó không có dữ liệu."""
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+def _read(file, dtype, offset, shape):
+    """Đọc một phần của file vào mảng mới trong RAM."""
+    count = int(np.prod(shape))
+    if count == 0:
+        return np.empty(shape, dtype=dtype)
+    file.seek(offset)
+    data = np.fromfile(file, dtype=dtype, count=count)
+    if len(data) != count:
+        raise ValueError("File store bị cắt cụt.")
+    return data.reshape(shape)
+
+def _verify_checksum(path, header):
+    sections = [
+        (header['embeddings_offset'], header['count'] * header['dim'] * 4),
+        (header['id_offsets_offset'], (header['count'] + 1) * 8),
+        (header['id_blob_offset'], header['id_blob_size']),
+        (header['name_offsets_offset'], (header['count'] + 1) * 8),
+        (header['name_blob_offset'], header['name_blob_size']),
+    ]
+    checksum = 0
+    with open(path, 'rb') as file:
+        for offset, size in sections:
+            file.seek(offset)
+            while size > 0:
+                chunk = file.read(min(size, CHECKSUM_CHUNK_SIZE))
+                if not chunk:
+                    raise ValueError("File store bị cắt cụt.")
+                checksum = zlib.crc32(chunk, checksum)
+                size -= len(chunk)
+    if checksum != header['checksum']:
+        raise ValueError("Checksum của store không khớp, file có thể bị hỏng.")
+
+def load_store(path, verify=False, in_memory=False):
+    """Mở store bằng memmap, không sao chép dữ liệu. verify=True sẽ đọc toàn bộ file để kiểm tra checksum.
+
+    in_memory=True đọc mọi phần vào RAM và đóng file ngay: dùng cho dữ liệu giữ lâu trong khi file có thể
+    bị ghi đè, vì trên Windows os.replace không thay được file đang được memmap.
+    Các hàng trong nhật ký được nối vào sau; header có thêm 'journal_rows' khi đó.
+    """
+    header = read_header(path)
+    if verify:
+        _verify_checksum(path, header)
+
+    count, dim = header['count'], header['dim']
+    sections = [
+        ('<f4', header['embeddings_offset'], (count, dim)),
+        ('<i8', header['id_offsets_offset'], (count + 1,)),
+        (np.uint8, header['id_blob_offset'], (header['id_blob_size'],)),
+        ('<i8', header['name_offsets_offset'], (count + 1,)),
+        (np.uint8, header['name_blob_offset'], (header['name_blob_size'],)),
+    ]
+    if in_memory:
+        with open(path, 'rb') as file:
+            arrays = [_read(file, dtype, offset, shape) for dtype, offset, shape in sections]
+    else:
+        arrays = [_map(path, dtype, offset, shape) for dtype, offset, shape in sections]
+    embeddings, id_offsets, id_blob, name_offsets, name_blob = arrays
+    ids, names = LabelArray(id_offsets, id_blob), LabelArray(name_offsets, name_blob)
+
+    records, _ = _read_journal(path, header)
+    if records:
+        # Gộp các hàng trong nhật ký (ma trận khi đó nằm trong RAM; compact_store đưa về lại memmap)
+        blocks = [embeddings] if count else []
+        embeddings = np.concatenate(blocks + [block for block, _, _ in records])
+        ids = _merge_labels(ids, [value for _, block, _ in records for value in block])
+        names = _merge_labels(names, [value for _, _, block in records for value in block])
+        header = dict(header, journal_rows=_journal_rows(records))
+    return EmbeddingStore(embeddings, ids, names, header)
+
+def load_legacy_pickle(path):
+    """Đọc file pickle cũ (danh sách {'id', 'name', 'embedding'}), bỏ qua các phần tử sai định dạng."""
+    with open(path, 'rb') as file:
+        data = pickle.load(file)
+    if not isinstance(data, list):
+        raise ValueError("File embedding cũ không chứa danh sách.")
+
+    rows = [
+        item for item in data
+        if isinstance(item, dict) and 'id' in item and 'name' in item and 'embedding' in item
+        and isinstance(item['embedding'], np.ndarray)
+    ]
+    if len(rows) != len(data):
+        print(f"[CẢNH BÁO] Bỏ qua {len(data) - len(rows)} phần tử sai định dạng trong {path}.")
+
+    embeddings = np.array([row['embedding'] for row in rows], dtype=np.float32) if rows else np.empty((0, 0), np.float32)
+    return embeddings, [row['id'] for row in rows], [row['name'] for row in rows]
+
+def convert_legacy_pickle(pickle_path, store_path=None):
+    """Chuyển file pickle cũ sang định dạng store. Trả về đường dẫn store đã ghi."""
+    if store_path is None:
+        store_path = os.path.splitext(pickle_path)[0] + STORE_EXTENSION
+    embeddings, ids, names = load_legacy_pickle(pickle_path)
+    save_store(store_path, embeddings, ids, names)
+    print(f"Đã chuyển {len(ids)} embeddings từ {pickle_path} sang {store_path}")
+    return store_path
+
+def load_gallery(path, in_memory=False):
+    """Tải store; nếu chưa có nhưng còn file pickle cũ cùng tên thì chuyển đổi một lần rồi tải."""
+    if not os.path.exists(path):
+        legacy_path = os.path.splitext(path)[0] + LEGACY_EXTENSION
+        if legacy_path != path and os.path.exists(legacy_path):
+            convert_legacy_pickle(legacy_path, path)
+        else:
+            raise FileNotFoundError(f"Không tìm thấy file embeddings: {path}")
+    return load_store(path, in_memory=in_memory)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Công cụ cho file embedding store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Chuyển file pickle cũ sang store.")
+    convert_parser.add_argument("pickle_path")
+    convert_parser.add_argument("store_path", nargs="?")
+    info_parser = subparsers.add_parser("info", help="Hiển thị header và kiểm tra checksum.")
+    info_parser.add_argument("store_path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_legacy_pickle(args.pickle_path, args.store_path)
+    else:
+        store = load_store(args.store_path, verify=True)
+        print(json.dumps(store.header, indent=2, ensure_ascii=False))
+        print(f"Checksum hợp lệ, {len(store)} embeddings ({store.header.get('journal_rows', 0)} trong nhật ký), dim={store.dim}.")
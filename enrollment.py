@@ -0,0 +1,146 @@
+import os
+import random
+import re
+import threading
+import time
+import cv2
+from embedding_store import LEGACY_EXTENSION, append_store, compact_store, load_gallery
+from face_ingest import crop_largest_face
+from model_registry import model_lock
+
+# Thêm người dùng trực tiếp từ một khung hình: chỉ tạo embedding cho khuôn mặt đó bằng model đã tải
+# rồi nối vào nhật ký của store (append_store), không quét lại dataset/. Sau đó nhật ký được gộp vào store
+# (compact_store) để các tiến trình nạp lại gallery vẫn chỉ memmap file. Ảnh vẫn được lưu vào dataset/<id>_<tên>/ và ghi vào
+# manifest của CodeGenerator nên lần tạo embeddings đầy đủ sau cho cùng kết quả.
+IMAGES_FOLDER = "dataset"
+EMBEDDING_FILEPATH = os.path.join("EmbeddingPicture", "Embeddings_Facenet.emb")
+USER_ID_ATTEMPTS = 100  # Số lần thử chọn ID ba chữ số chưa dùng
+USER_ID_PATTERN = re.compile(r"[0-9]+")  # ID chỉ gồm chữ số (là một phần tên thư mục trong dataset/)
+
+_enroll_lock = threading.Lock()  # Các lần thêm trong cùng tiến trình ghi store lần lượt
+
+class GalleryNotReadyError(RuntimeError):
+    """Chưa có store nhưng dataset/ đã có ảnh: thêm lúc này sẽ tạo gallery chỉ gồm người mới."""
+
+def sanitize_user_name(user_name):
+    """Chỉ giữ chữ, số, '_' và '-', thay khoảng trắng bằng '_' (tên thư mục trong dataset/)."""
+    user_name = ''.join(c for c in user_name if c.isalnum() or c in [' ', '_', '-']).strip()
+    return '_'.join(user_name.split())
+
+def validate_user_id(user_id):
+    """Ném ValueError nếu ID không chỉ gồm chữ số (tránh đường dẫn như '../x' khi ghi ảnh)."""
+    if not isinstance(user_id, str) or not USER_ID_PATTERN.fullmatch(user_id):
+        raise ValueError("ID người dùng chỉ được gồm chữ số.")
+    return user_id
+
+def new_user_id(user_name, images_folder=IMAGES_FOLDER):
+    """Chọn ID ba chữ số chưa có thư mục <id>_<tên> trong images_folder."""
+    for _ in range(USER_ID_ATTEMPTS):
+        user_id = f"{random.randint(100, 999):03d}"
+        if not os.path.exists(os.path.join(images_folder, f"{user_id}_{user_name}")):
+            return user_id
+    raise ValueError("Không thể tạo ID duy nhất.")
+
+def _gallery_missing(images_folder, embedding_filepath):
+    """True nếu chưa có store (hay file pickle cũ) trong khi dataset/ đã có ảnh người dùng."""
+    if os.path.exists(embedding_filepath) or os.path.exists(os.path.splitext(embedding_filepath)[0] + LEGACY_EXTENSION):
+        return False
+    from CodeGenerator_facenet import VALID_IMAGE_EXTENSIONS
+    try:
+        folders = [entry for entry in os.scandir(images_folder) if entry.is_dir()]
+    except FileNotFoundError:
+        return False
+    for folder in folders:
+        if any(name.lower().endswith(VALID_IMAGE_EXTENSIONS) for name in os.listdir(folder.path)):
+            return True
+    return False
+
+def embed_largest_face(detector, embedder, image_bgr):
+    """Phát hiện khuôn mặt lớn nhất trong ảnh BGR và trả về embedding của nó (cắt giống CodeGenerator).
+
+    Model thường dùng chung với luồng nhận diện nên mỗi lần gọi đều giữ model_lock.
+    """
+    image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+    with model_lock(detector):
+        results = detector.detect_faces(image_rgb)
+    if not results:
+        raise ValueError("Không tìm thấy khuôn mặt trong ảnh.")
+    face_array = crop_largest_face(image_rgb, results)
+    if face_array is None:
+        raise ValueError("Không thể cắt khuôn mặt khỏi ảnh.")
+    with model_lock(embedder):
+        return embedder.embeddings(face_array[None])[0]
+
+def save_enrollment(image_bgr, embedding, user_name, user_id=None, images_folder=IMAGES_FOLDER,
+                    embedding_filepath=EMBEDDING_FILEPATH):
+    """Lưu ảnh vào dataset/<id>_<tên>/ và nối embedding vào store.
+
+    Ảnh được ghi trước; nếu ghi store thất bại thì ảnh (và thư mục vừa tạo) bị xóa nên không có người
+    dùng ghi dở. Nếu tiến trình dừng giữa hai bước, ảnh còn lại sẽ được CodeGenerator xử lý ở lần sau.
+    Ném GalleryNotReadyError nếu dataset/ đã có ảnh mà chưa có store (cần chạy CodeGenerator trước).
+    Trả về {'id', 'name', 'photo', 'gallery_size'}.
+    """
+    user_name = sanitize_user_name(user_name)
+    if not user_name:
+        raise ValueError("Tên người dùng không hợp lệ.")
+
+    with _enroll_lock:
+        if _gallery_missing(images_folder, embedding_filepath):
+            raise GalleryNotReadyError(f"Chưa có {embedding_filepath} nhưng {images_folder} đã có ảnh; "
+                                       "hãy chạy CodeGenerator_facenet.py để tạo dữ liệu nhận diện trước.")
+        user_id = validate_user_id(user_id) if user_id is not None else new_user_id(user_name, images_folder)
+        folder_name = f"{user_id}_{user_name}"
+        folder_path = os.path.join(images_folder, folder_name)
+        folder_created = not os.path.isdir(folder_path)
+        os.makedirs(folder_path, exist_ok=True)
+        photo_path = os.path.join(folder_path, f"{folder_name}_{int(time.time() * 1000)}.png")
+        if not cv2.imwrite(photo_path, image_bgr):
+            raise IOError(f"Lưu ảnh thất bại tại '{photo_path}'")
+
+        try:
+            if not os.path.exists(embedding_filepath):
+                try:
+                    load_gallery(embedding_filepath)  # Chuyển file pickle cũ (nếu có) trước khi nối
+                except FileNotFoundError:
+                    pass
+            gallery_size = append_store(embedding_filepath, embedding[None], [user_id], [user_name])
+        except Exception:
+            os.remove(photo_path)
+            if folder_created and not os.listdir(folder_path):
+                os.rmdir(folder_path)
+            raise
+
+        try:
+            compact_store(embedding_filepath)
+        except OSError as e:
+            # Hàng mới đã nằm trong nhật ký, load_store vẫn đọc được; lần thêm sau sẽ gộp lại
+            print(f"[Cảnh báo] Không thể gộp nhật ký vào store: {e}")
+
+        # Manifest cũng được đọc-sửa-ghi nên phải nằm trong khóa như store
+        try:
+            from CodeGenerator_facenet import record_enrolled_image
+            record_enrolled_image(photo_path, user_id, user_name, embedding)
+        except Exception as e:
+            # Manifest chỉ dùng để tăng tốc, lần tạo embeddings sau sẽ xử lý lại ảnh này
+            print(f"[Cảnh báo] Không thể cập nhật manifest: {e}")
+
+    print(f"Đã thêm {user_name} ({user_id}): {photo_path}")
+    return {'id': user_id, 'name': user_name, 'photo': photo_path, 'gallery_size': gallery_size}
+
+def enroll_face(image_bgr, user_name, detector, embedder, user_id=None, images_folder=IMAGES_FOLDER,
+                embedding_filepath=EMBEDDING_FILEPATH, progress=None):
+    """Thêm người dùng từ một ảnh BGR bằng model đã tải. progress(phần trăm, mô tả) được gọi giữa các bước.
+
+    Ném ValueError nếu tên không hợp lệ hoặc không tìm thấy khuôn mặt.
+    """
+    if not sanitize_user_name(user_name):
+        raise ValueError("Tên người dùng không hợp lệ.")
+    if progress:
+        progress(10, "Đang phát hiện khuôn mặt...")
+    embedding = embed_largest_face(detector, embedder, image_bgr)
+    if progress:
+        progress(60, "Đang lưu ảnh và dữ liệu nhận diện...")
+    result = save_enrollment(image_bgr, embedding, user_name, user_id, images_folder, embedding_filepath)
+    if progress:
+        progress(100, "Đã thêm người dùng.")
+    return result
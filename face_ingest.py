@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+from PIL import Image
+from model_registry import model_lock
+
+# Module này chỉ nhập các thư viện nhẹ để tiến trình con không phải tải FaceNet.
+REQUIRED_FACE_SIZE = (160, 160)
+
+_DETECTOR = None  # MTCNN riêng của từng tiến trình con
+
+def init_worker():
+    """Khởi tạo MTCNN cho tiến trình con trong pool."""
+    global _DETECTOR
+    from model_registry import get_detector
+    _DETECTOR = get_detector()
+
+def crop_largest_face(img_rgb, results):
+    """Cắt khuôn mặt lớn nhất trong kết quả detect_faces và resize về REQUIRED_FACE_SIZE. None nếu không cắt được.
+
+    Dùng chung cho việc tạo gallery từ dataset và thêm người dùng trực tiếp để hai đường cho cùng embedding.
+    """
+    # Lấy khuôn mặt lớn nhất nếu có nhiều khuôn mặt
+    if len(results) > 1:
+        best_face_idx = np.argmax([res['box'][2] * res['box'][3] for res in results])
+        face_data = results[best_face_idx]
+    else:
+        face_data = results[0]
+
+    x1, y1, width, height = face_data['box']
+    x1, y1 = abs(x1), abs(y1)
+    x2, y2 = x1 + width, y1 + height
+    face_pixels = img_rgb[y1:y2, x1:x2]
+
+    if face_pixels.size == 0:
+        return None
+
+    face_image = Image.fromarray(face_pixels).resize(REQUIRED_FACE_SIZE)
+    return np.asarray(face_image)
+
+def extract_face(detector, img_path, filename):
+    """Đọc ảnh, lấy khuôn mặt lớn nhất và resize về REQUIRED_FACE_SIZE.
+
+    Trả về (mảng khuôn mặt hoặc None, ok, thông báo lỗi hoặc None). ok là False khi gặp
+    lỗi bất ngờ, khi đó ảnh sẽ được thử lại ở lần chạy sau.
+    """
+    try:
+        img_bgr = cv2.imread(img_path)
+        if img_bgr is None:
+            return None, True, f"  [LỖI] Không thể đọc ảnh: {filename}"
+
+        img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+        with model_lock(detector):
+            results = detector.detect_faces(img_rgb)
+
+        if not results:
+            return None, True, f"  [!] Không phát hiện khuôn mặt: {filename}"
+
+        face_array = crop_largest_face(img_rgb, results)
+        if face_array is None:
+            return None, True, f"  [LỖI] Không thể cắt ảnh: {filename}"
+        return face_array, True, None
+
+    except Exception as e:
+        return None, False, f"  [LỖI] Khi xử lý ảnh {filename}: {e}"
+
+def extract_face_task(task):
+    """Hàm chạy trong pool: task là (đường dẫn ảnh, tên file)."""
+    img_path, filename = task
+    return extract_face(_DETECTOR, img_path, filename)
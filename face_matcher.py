@@ -0,0 +1,171 @@
+import numpy as np
+
+# Cấu hình
+RECOGNITION_THRESHOLD = 1.05  # Ngưỡng khoảng cách Euclid để chấp nhận một kết quả khớp
+IVF_MIN_GALLERY_SIZE = 100000  # Từ kích thước này 'auto' chuyển sang chỉ mục IVF
+IVF_DEFAULT_NPROBE = 8  # Số cụm được quét cho mỗi truy vấn
+IVF_TRAIN_ITERATIONS = 10
+IVF_TRAIN_POINTS_PER_LIST = 64
+ASSIGN_CHUNK_SIZE = 65536  # Số hàng xử lý mỗi lần khi gán cụm để giới hạn bộ nhớ
+
+def _squared_distances(queries, query_norms, vectors, vector_norms):
+    """Bình phương khoảng cách Euclid theo |q|^2 - 2 q.g + |g|^2, tính bằng một phép nhân ma trận."""
+    distances = queries @ vectors.T
+    distances *= -2.0
+    distances += query_norms[:, None]
+    distances += vector_norms[None, :]
+    np.maximum(distances, 0.0, out=distances)
+    return distances
+
+def _top_k(squared, k):
+    """Chọn k khoảng cách nhỏ nhất trên mỗi hàng, đã sắp xếp tăng dần."""
+    k = min(k, squared.shape[1])
+    if k < squared.shape[1]:
+        candidates = np.argpartition(squared, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(squared.shape[1]), squared.shape)
+    candidate_distances = np.take_along_axis(squared, candidates, axis=1)
+    order = np.argsort(candidate_distances, axis=1, kind='stable')
+    return np.take_along_axis(candidate_distances, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+def _prepare_queries(queries):
+    queries = np.asarray(queries, dtype=np.float32)
+    if queries.ndim == 1:
+        queries = queries[None, :]
+    return queries, np.einsum('ij,ij->i', queries, queries)
+
+class ExactMatcher:
+    """So khớp chính xác bằng BLAS, chuẩn của gallery được tính sẵn một lần."""
+
+    def __init__(self, embeddings, threshold=RECOGNITION_THRESHOLD):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.threshold = threshold
+        self._norms = np.einsum('ij,ij->i', self.embeddings, self.embeddings) if len(self.embeddings) else np.empty(0, np.float32)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, queries, k=1):
+        """Tìm k hàng gần nhất cho mỗi truy vấn.
+
+        Trả về (distances, indices) shape (số truy vấn, k). Chỉ số là -1 khi khoảng cách không
+        nhỏ hơn threshold hoặc gallery không đủ k hàng; khoảng cách vẫn được trả về để hiển thị.
+        """
+        queries, query_norms = _prepare_queries(queries)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        if len(queries) == 0 or len(self.embeddings) == 0:
+            return distances, indices
+
+        squared, nearest = _top_k(_squared_distances(queries, query_norms, self.embeddings, self._norms), k)
+        found = squared.shape[1]
+        distances[:, :found] = np.sqrt(squared)
+        indices[:, :found] = nearest
+        indices[distances >= self.threshold] = -1
+        return distances, indices
+
+class IVFMatcher:
+    """Chỉ mục IVF xấp xỉ cho gallery lớn.
+
+    Gallery được chia cụm bằng k-means; mỗi truy vấn chỉ quét nprobe cụm gần nhất nên thời gian
+    so khớp tăng theo căn bậc hai kích thước gallery thay vì tuyến tính.
+    """
+
+    def __init__(self, embeddings, threshold=RECOGNITION_THRESHOLD, nlist=None, nprobe=IVF_DEFAULT_NPROBE, seed=0):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.threshold = threshold
+        self.size = len(embeddings)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(self.size))
+        self.nlist = max(1, min(int(nlist), self.size))
+        self.nprobe = max(1, min(int(nprobe), self.nlist))
+
+        if self.size == 0:
+            self._centroids = np.empty((0, embeddings.shape[1] if embeddings.ndim == 2 else 0), np.float32)
+            self._centroid_norms = np.empty(0, np.float32)
+            self._vectors = self._centroids
+            self._norms = self._centroid_norms
+            self._row_ids = np.empty(0, np.int64)
+            self._offsets = np.zeros(1, np.int64)
+            return
+
+        self._centroids = self._train(embeddings, np.random.default_rng(seed))
+        self._centroid_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        assignments = self._assign(embeddings)
+
+        # Sắp các hàng theo cụm để mỗi danh sách đảo ngược là một đoạn liên tục
+        self._row_ids = np.argsort(assignments, kind='stable')
+        self._vectors = np.ascontiguousarray(embeddings[self._row_ids])
+        self._norms = np.einsum('ij,ij->i', self._vectors, self._vectors)
+        self._offsets = np.zeros(self.nlist + 1, np.int64)
+        self._offsets[1:] = np.cumsum(np.bincount(assignments, minlength=self.nlist))
+
+    def __len__(self):
+        return self.size
+
+    def _assign(self, vectors, centroids=None, centroid_norms=None):
+        """Gán mỗi hàng vào cụm gần nhất, xử lý theo khối để giới hạn bộ nhớ."""
+        if centroids is None:
+            centroids, centroid_norms = self._centroids, self._centroid_norms
+        assignments = np.empty(len(vectors), np.int64)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+            chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK_SIZE], dtype=np.float32)
+            chunk_norms = np.einsum('ij,ij->i', chunk, chunk)
+            squared = _squared_distances(chunk, chunk_norms, centroids, centroid_norms)
+            assignments[start:start + len(chunk)] = np.argmin(squared, axis=1)
+        return assignments
+
+    def _train(self, embeddings, rng):
+        """Huấn luyện tâm cụm bằng k-means (Lloyd) trên một mẫu của gallery."""
+        sample_size = min(self.size, self.nlist * IVF_TRAIN_POINTS_PER_LIST)
+        sample = embeddings[np.sort(rng.choice(self.size, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, self.nlist, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            norms = np.einsum('ij,ij->i', centroids, centroids)
+            assignments = self._assign(sample, centroids, norms)
+            counts = np.bincount(assignments, minlength=self.nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+            # Cụm rỗng được khởi tạo lại bằng một điểm ngẫu nhiên của mẫu
+            empty = np.flatnonzero(~non_empty)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        return centroids
+
+    def search(self, queries, k=1):
+        """Cùng giao diện với ExactMatcher.search; kết quả là xấp xỉ."""
+        queries, query_norms = _prepare_queries(queries)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        if len(queries) == 0 or self.size == 0:
+            return distances, indices
+
+        centroid_squared = _squared_distances(queries, query_norms, self._centroids, self._centroid_norms)
+        _, probes = _top_k(centroid_squared, self.nprobe)
+        for row, lists in enumerate(probes):
+            candidates = np.concatenate([np.arange(self._offsets[i], self._offsets[i + 1]) for i in lists])
+            if len(candidates) == 0:
+                continue
+            squared = _squared_distances(queries[row:row + 1], query_norms[row:row + 1],
+                                         self._vectors[candidates], self._norms[candidates])
+            squared, nearest = _top_k(squared, k)
+            found = squared.shape[1]
+            distances[row, :found] = np.sqrt(squared[0])
+            indices[row, :found] = self._row_ids[candidates[nearest[0]]]
+        indices[distances >= self.threshold] = -1
+        return distances, indices
+
+MATCHER_BACKENDS = {
+    'exact': ExactMatcher,
+    'ivf': IVFMatcher,
+}
+
+def create_matcher(embeddings, backend='auto', threshold=RECOGNITION_THRESHOLD, **kwargs):
+    """Tạo bộ so khớp theo tên backend ('auto', 'exact', 'ivf')."""
+    if backend == 'auto':
+        backend = 'ivf' if len(embeddings) >= IVF_MIN_GALLERY_SIZE else 'exact'
+    if backend not in MATCHER_BACKENDS:
+        raise ValueError(f"Backend so khớp không hợp lệ: {backend}")
+    return MATCHER_BACKENDS[backend](embeddings, threshold=threshold, **kwargs)
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+from PIL import Image
+from model_registry import model_lock
+from perf_metrics import NULL_METRICS
+
+# Các bước dùng chung cho vòng lặp nhận diện (GUI worker và main_facenet).
+REQUIRED_FACE_SIZE = (160, 160)
+DETECTION_SCALE = 1.0  # Tỉ lệ thu nhỏ khung hình trước khi phát hiện (vd. 0.5 cho ảnh 640x480)
+MIN_FACE_SIZE = None  # Kích thước khuôn mặt nhỏ nhất (pixel ở độ phân giải gốc); None = mặc định của MTCNN
+MTCNN_MIN_FACE_SIZE = 12  # Nhỏ hơn giá trị này MTCNN phải phóng to ảnh, chậm hơn nhiều
+
+def detect_faces_scaled(detector, frame_rgb, scale=DETECTION_SCALE, min_face_size=MIN_FACE_SIZE):
+    """Phát hiện khuôn mặt trên bản thu nhỏ của khung hình rồi đưa box và keypoints về độ phân giải gốc.
+
+    Kết quả có cùng cấu trúc với detector.detect_faces ('box', 'confidence', 'keypoints').
+    """
+    kwargs = {}
+    if min_face_size is not None:
+        kwargs['min_face_size'] = max(MTCNN_MIN_FACE_SIZE, int(round(min_face_size * min(scale, 1.0))))
+    if scale >= 1.0:
+        with model_lock(detector):
+            return detector.detect_faces(frame_rgb, **kwargs)
+
+    small = cv2.resize(frame_rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    with model_lock(detector):
+        faces = detector.detect_faces(small, **kwargs)
+    inverse = 1.0 / scale
+    for face in faces:
+        face['box'] = [int(round(value * inverse)) for value in face['box']]
+        if face.get('keypoints'):
+            face['keypoints'] = {
+                name: (int(round(x * inverse)), int(round(y * inverse)))
+                for name, (x, y) in face['keypoints'].items()
+            }
+    return faces
+
+def warm_up_models(detector, embedder, frame_size=(640, 480)):
+    """Chạy một lần phát hiện và tạo embedding trên dữ liệu giả để TensorFlow dựng đồ thị trước khung hình thật đầu tiên.
+
+    Ảnh nhiễu thường sinh ra vài ứng viên nên các tầng sau của MTCNN cũng được chạy thử.
+    """
+    width, height = frame_size
+    frame = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    with model_lock(detector):
+        detector.detect_faces(frame)
+    with model_lock(embedder):
+        embedder.embeddings(np.zeros((1, REQUIRED_FACE_SIZE[1], REQUIRED_FACE_SIZE[0], 3), np.uint8))
+
+def face_boxes(frame_rgb, faces):
+    """Chuyển box (x, y, w, h) của bộ phát hiện thành (x1, y1, x2, y2) đã giới hạn trong khung hình."""
+    boxes = []
+    for face in faces:
+        x1, y1, width, height = face['box']
+        x1, y1 = max(0, x1), max(0, y1)
+        x2 = min(frame_rgb.shape[1], x1 + width)
+        y2 = min(frame_rgb.shape[0], y1 + height)
+        if x2 > x1 and y2 > y1:
+            boxes.append((x1, y1, x2, y2))
+    return boxes
+
+def prepare_face_batch(frame_rgb, boxes, size=REQUIRED_FACE_SIZE):
+    """Cắt các khuôn mặt theo boxes (x1, y1, x2, y2), resize và gộp thành một lô (N, h, w, 3)."""
+    crops = [np.asarray(Image.fromarray(frame_rgb[y1:y2, x1:x2]).resize(size)) for x1, y1, x2, y2 in boxes]
+    if not crops:
+        return np.empty((0, size[1], size[0], 3), dtype=np.uint8)
+    return np.stack(crops)
+
+def match_faces(frame_rgb, boxes, embedder, matcher, metrics=NULL_METRICS):
+    """Tạo embedding cho mọi khuôn mặt trong khung hình bằng một lần gọi embedder và so khớp cả lô.
+
+    Trả về (distances, indices) như matcher.search với k=1, mỗi hàng tương ứng một box.
+    """
+    return match_face_batches([frame_rgb], [boxes], embedder, matcher, metrics)[0]
+
+def match_face_batches(frames_rgb, boxes_per_frame, embedder, matcher, metrics=NULL_METRICS):
+    """Như match_faces nhưng cho nhiều khung hình (vd. nhiều camera): mọi khuôn mặt được gộp vào
+    một lần gọi embedder và một lần so khớp, kết quả được tách lại theo từng khung hình.
+
+    Thời gian các bước crop, embed, match và kích thước lô được ghi vào metrics (PerfMetrics).
+    """
+    counts = [len(boxes) for boxes in boxes_per_frame]
+    if sum(counts) == 0:
+        return [(np.empty(0, np.float32), np.empty(0, np.int64)) for _ in counts]
+
+    with metrics.time('crop'):
+        batch = np.concatenate([
+            prepare_face_batch(frame_rgb, boxes)
+            for frame_rgb, boxes in zip(frames_rgb, boxes_per_frame) if boxes
+        ])
+    metrics.observe('embed_batch_size', len(batch))
+    with metrics.time('embed'), model_lock(embedder):
+        embeddings = embedder.embeddings(batch)
+    with metrics.time('match'):
+        distances, indices = matcher.search(embeddings, k=1)
+    split_points = np.cumsum(counts)[:-1]
+    return list(zip(np.split(distances[:, 0], split_points), np.split(indices[:, 0], split_points)))
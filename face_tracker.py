@@ -0,0 +1,266 @@
+import cv2
+import numpy as np
+import itertools
+
+# Cấu hình
+TRACK_IOU_THRESHOLD = 0.3  # IoU tối thiểu để coi hai box ở hai khung hình liên tiếp là cùng một người
+TRACK_MAX_MISSED = 5  # Số khung hình liên tiếp không thấy trước khi xóa track
+REEMBED_INTERVAL = 15  # Tạo lại embedding cho track sau số khung hình này
+REEMBED_IOU = 0.5  # Tạo lại embedding khi box lệch nhiều so với box lúc tạo embedding gần nhất
+
+def box_iou(box_a, box_b):
+    """IoU của hai box (x1, y1, x2, y2)."""
+    inter_w = min(box_a[2], box_b[2]) - max(box_a[0], box_b[0])
+    inter_h = min(box_a[3], box_b[3]) - max(box_a[1], box_b[1])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    intersection = inter_w * inter_h
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    return intersection / float(area_a + area_b - intersection)
+
+class Track:
+    """Một khuôn mặt được theo dõi qua nhiều khung hình cùng danh tính đã nhận diện gần nhất."""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.missed = 0
+        self.person = None  # {'id', 'name', ...} hoặc None nếu không nhận diện được
+        self.distance = float('inf')
+        self.embedded = False
+        self.embed_box = None
+        self.frames_since_embed = 0
+
+class FaceTracker:
+    """Gán ID ổn định cho các box qua các khung hình bằng ghép cặp IoU tham lam.
+
+    Danh tính của track được lưu lại và chỉ cần tạo embedding lại theo chu kỳ hoặc khi box thay đổi nhiều.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD, max_missed=TRACK_MAX_MISSED,
+                 reembed_interval=REEMBED_INTERVAL, reembed_iou=REEMBED_IOU):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reembed_interval = reembed_interval
+        self.reembed_iou = reembed_iou
+        self.tracks = []
+        self._next_id = itertools.count(1)
+
+    def reset(self):
+        """Xóa mọi track, ví dụ khi dữ liệu nhận diện thay đổi."""
+        self.tracks = []
+
+    def update(self, boxes):
+        """Cập nhật tracker với các box của khung hình mới, trả về danh sách track theo thứ tự boxes."""
+        pairs = []
+        for track_idx, track in enumerate(self.tracks):
+            for box_idx, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((iou, track_idx, box_idx))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for _, track_idx, box_idx in pairs:
+            if track_idx in used_tracks or assigned[box_idx] is not None:
+                continue
+            used_tracks.add(track_idx)
+            assigned[box_idx] = self.tracks[track_idx]
+
+        survivors = []
+        for track_idx, track in enumerate(self.tracks):
+            if track_idx in used_tracks:
+                continue
+            track.missed += 1
+            if track.missed <= self.max_missed:
+                survivors.append(track)
+
+        for box_idx, box in enumerate(boxes):
+            track = assigned[box_idx]
+            if track is None:
+                track = Track(next(self._next_id), box)
+                assigned[box_idx] = track
+            else:
+                track.box = box
+                track.missed = 0
+                track.frames_since_embed += 1
+            survivors.append(track)
+
+        self.tracks = survivors
+        return assigned
+
+    def needs_embedding(self, track):
+        """True nếu track chưa có danh tính, đến hạn làm mới hoặc box đã thay đổi nhiều."""
+        if not track.embedded:
+            return True
+        if track.frames_since_embed >= self.reembed_interval:
+            return True
+        return box_iou(track.embed_box, track.box) < self.reembed_iou
+
+    def set_identity(self, track, person, distance):
+        """Lưu kết quả nhận diện mới nhất cho track."""
+        track.person = person
+        track.distance = distance
+        track.embedded = True
+        track.embed_box = track.box
+        track.frames_since_embed = 0
+
+# Cấu hình chế độ phát hiện thưa (MTCNN chạy mỗi N khung hình, optical flow dời box ở giữa)
+TARGET_FPS = 15.0  # FPS mục tiêu để điều chỉnh N
+DETECT_INTERVAL_MIN = 1
+DETECT_INTERVAL_MAX = 10
+FLOW_MIN_CONFIDENCE = 0.5  # Tỉ lệ điểm theo dõi được tối thiểu; thấp hơn thì chạy lại MTCNN
+FLOW_MAX_CORNERS = 30
+FLOW_MIN_POINTS = 3
+FRAME_TIME_SMOOTHING = 0.2  # Hệ số EMA cho thời gian khung hình
+
+class BoxPropagator:
+    """Dời box giữa các lần phát hiện bằng optical flow Lucas-Kanade trên ảnh xám."""
+
+    def __init__(self, max_corners=FLOW_MAX_CORNERS, min_points=FLOW_MIN_POINTS):
+        self.max_corners = max_corners
+        self.min_points = min_points
+        self._gray = None
+        self._boxes = []
+        self._points = []
+
+    def reset(self, gray, boxes):
+        """Bắt đầu theo dõi các box vừa phát hiện trên khung hình xám gray."""
+        self._gray = gray
+        self._boxes = list(boxes)
+        self._points = []
+        for x1, y1, x2, y2 in self._boxes:
+            points = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], maxCorners=self.max_corners,
+                                             qualityLevel=0.01, minDistance=3)
+            if points is None:
+                points = np.empty((0, 1, 2), np.float32)
+            self._points.append((points + np.float32([x1, y1])).astype(np.float32))
+
+    def propagate(self, gray):
+        """Ước lượng vị trí mới của các box. Trả về (boxes, độ tin cậy trong [0, 1]).
+
+        Độ tin cậy là tỉ lệ điểm theo dõi được thấp nhất trong các box; box mất dấu bị bỏ và cho độ tin cậy 0.
+        """
+        if self._gray is None:
+            return [], 0.0
+        if not self._boxes:
+            self._gray = gray
+            return [], 1.0
+
+        counts = [len(points) for points in self._points]
+        if sum(counts) == 0:
+            return [], 0.0
+        old_points = np.concatenate(self._points)
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, old_points, None,
+                                                         winSize=(15, 15), maxLevel=2)
+        status = status.reshape(-1).astype(bool)
+        height, width = gray.shape[:2]
+
+        boxes, points, confidences = [], [], []
+        start = 0
+        for box, count in zip(self._boxes, counts):
+            ok = status[start:start + count]
+            old = old_points[start:start + count][ok].reshape(-1, 2)
+            new = new_points[start:start + count][ok].reshape(-1, 2)
+            start += count
+            if len(new) < self.min_points:
+                confidences.append(0.0)
+                continue
+
+            # Dịch theo trung vị chuyển động, co giãn theo độ phân tán của các điểm
+            shift = np.median(new - old, axis=0)
+            old_spread = np.median(np.linalg.norm(old - np.median(old, axis=0), axis=1))
+            new_spread = np.median(np.linalg.norm(new - np.median(new, axis=0), axis=1))
+            scale = new_spread / old_spread if old_spread > 1e-3 else 1.0
+
+            x1, y1, x2, y2 = box
+            cx, cy = (x1 + x2) / 2.0 + shift[0], (y1 + y2) / 2.0 + shift[1]
+            half_w, half_h = (x2 - x1) * scale / 2.0, (y2 - y1) * scale / 2.0
+            new_box = (max(0, int(round(cx - half_w))), max(0, int(round(cy - half_h))),
+                       min(width, int(round(cx + half_w))), min(height, int(round(cy + half_h))))
+            if new_box[2] <= new_box[0] or new_box[3] <= new_box[1]:
+                confidences.append(0.0)
+                continue
+
+            boxes.append(new_box)
+            points.append(new.reshape(-1, 1, 2).astype(np.float32))
+            confidences.append(len(new) / float(count))
+
+        self._gray = gray
+        self._boxes = boxes
+        self._points = points
+        return boxes, min(confidences)
+
+class DetectionScheduler:
+    """Quyết định khi nào chạy lại bộ phát hiện.
+
+    Phát hiện mỗi N khung hình hoặc khi độ tin cậy theo dõi giảm; N tăng khi thời gian khung hình
+    vượt ngân sách của FPS mục tiêu và giảm khi còn dư.
+    """
+
+    def __init__(self, target_fps=TARGET_FPS, min_interval=DETECT_INTERVAL_MIN,
+                 max_interval=DETECT_INTERVAL_MAX, min_confidence=FLOW_MIN_CONFIDENCE):
+        self.frame_budget = 1.0 / target_fps
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.min_confidence = min_confidence
+        self.interval = min_interval
+        self.frame_time = None
+        self._frames_since_detect = None
+
+    def due(self):
+        """True nếu đã đến lượt chạy bộ phát hiện."""
+        return self._frames_since_detect is None or self._frames_since_detect + 1 >= self.interval
+
+    def detected(self):
+        self._frames_since_detect = 0
+
+    def propagated(self):
+        self._frames_since_detect += 1
+
+    def reset(self):
+        self._frames_since_detect = None
+
+    def record(self, frame_time):
+        """Cập nhật thời gian khung hình (EMA) và điều chỉnh N."""
+        if self.frame_time is None:
+            self.frame_time = frame_time
+        else:
+            self.frame_time += FRAME_TIME_SMOOTHING * (frame_time - self.frame_time)
+        if self.frame_time > self.frame_budget:
+            self.interval = min(self.max_interval, self.interval + 1)
+        elif self.frame_time < 0.7 * self.frame_budget:
+            self.interval = max(self.min_interval, self.interval - 1)
+
+class AdaptiveFaceDetector:
+    """Chạy bộ phát hiện theo DetectionScheduler và dời box bằng BoxPropagator giữa các lần chạy.
+
+    detect_fn(frame_rgb) trả về danh sách box (x1, y1, x2, y2).
+    """
+
+    def __init__(self, detect_fn, target_fps=TARGET_FPS, **kwargs):
+        self.detect_fn = detect_fn
+        self.scheduler = DetectionScheduler(target_fps=target_fps, **kwargs)
+        self.propagator = BoxPropagator()
+
+    def reset(self):
+        self.scheduler.reset()
+
+    def boxes(self, frame_rgb):
+        """Trả về (boxes, True nếu vừa chạy bộ phát hiện)."""
+        gray = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY)
+        if not self.scheduler.due():
+            boxes, confidence = self.propagator.propagate(gray)
+            if confidence >= self.scheduler.min_confidence:
+                self.scheduler.propagated()
+                return boxes, False
+
+        boxes = self.detect_fn(frame_rgb)
+        self.propagator.reset(gray, boxes)
+        self.scheduler.detected()
+        return boxes, True
+
+    def record(self, frame_time):
+        self.scheduler.record(frame_time)
@@ -0,0 +1,138 @@
+import collections
+import threading
+import time
+import numpy as np
+
+# Hàng đợi và luồng dùng cho chế độ xử lý theo pipeline (đọc ảnh / phát hiện / nhận diện / hiển thị).
+
+class QueueClosed(Exception):
+    """Hàng đợi đã đóng và không còn phần tử."""
+
+class DropOldestQueue:
+    """Hàng đợi có giới hạn: khi đầy, phần tử cũ nhất bị bỏ để nhường chỗ cho phần tử mới.
+
+    Nhờ vậy bên đưa vào (vd. luồng đọc camera) không bao giờ bị chặn bởi bên xử lý chậm.
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = max(1, maxsize)
+        self.dropped = 0
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Lấy phần tử cũ nhất. Trả về None nếu hết thời gian chờ, ném QueueClosed nếu đã đóng."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self._items:
+                if self._closed:
+                    raise QueueClosed()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            return self._items.popleft()
+
+    def close(self):
+        """Đóng hàng đợi và đánh thức mọi luồng đang chờ."""
+        with self._condition:
+            self._closed = True
+            self._items.clear()
+            self._condition.notify_all()
+
+    def qsize(self):
+        with self._condition:
+            return len(self._items)
+
+class StageThread(threading.Thread):
+    """Luồng chạy một bước của pipeline: lấy từ input_queue, gọi func, đưa kết quả (nếu khác None) vào output_queue.
+
+    Lỗi trong func được chuyển cho on_error và luồng tiếp tục chạy; luồng dừng khi hàng đợi vào bị đóng.
+    """
+
+    def __init__(self, name, func, input_queue, output_queue=None, on_error=None):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.on_error = on_error
+
+    def run(self):
+        while True:
+            try:
+                item = self.input_queue.get(timeout=0.1)
+            except QueueClosed:
+                return
+            if item is None:
+                continue
+            try:
+                result = self.func(item)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(self.name, e)
+                continue
+            if result is not None and self.output_queue is not None:
+                self.output_queue.put(result)
+
+def fit_size(frame_shape, display_size):
+    """Kích thước (rộng, cao) lớn nhất vừa display_size mà giữ tỉ lệ khung hình; display_size None = giữ nguyên."""
+    height, width = frame_shape[:2]
+    if not display_size or display_size[0] <= 0 or display_size[1] <= 0:
+        return width, height
+    scale = min(display_size[0] / width, display_size[1] / height)
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+class FramePool:
+    """Bộ đệm khung hình hiển thị dùng lại giữa các khung thay vì cấp phát mảng mới mỗi khung.
+
+    acquire() trả về (slot, buffer) của một bộ đệm rảnh, hoặc (None, None) nếu mọi bộ đệm còn đang được
+    bên nhận (giao diện) giữ; khi đó khung hình nên được bỏ qua thay vì xếp hàng. Bên nhận gọi
+    release(slot) khi đã dùng xong buffer, nên bộ đệm không bao giờ bị ghi hay giải phóng khi còn được đọc.
+    Bộ đệm chỉ được cấp phát lại khi kích thước hiển thị thay đổi.
+    """
+
+    def __init__(self, size=3):
+        self._buffers = [None] * max(1, size)
+        self._in_use = [False] * len(self._buffers)
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.exhausted = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        with self._lock:
+            for slot, in_use in enumerate(self._in_use):
+                if in_use:
+                    continue
+                buffer = self._buffers[slot]
+                if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+                    buffer = np.empty(shape, dtype=dtype)
+                    self._buffers[slot] = buffer
+                    self.allocations += 1
+                self._in_use[slot] = True
+                return slot, buffer
+            self.exhausted += 1
+            return None, None
+
+    def release(self, slot):
+        with self._lock:
+            if slot is not None and 0 <= slot < len(self._in_use):
+                self._in_use[slot] = False
+
+    def release_all(self):
+        with self._lock:
+            self._in_use = [False] * len(self._in_use)
+
+    def in_use(self):
+        with self._lock:
+            return sum(self._in_use)
@@ -0,0 +1,152 @@
+import os
+import threading
+from embedding_store import journal_path, load_gallery
+from face_matcher import RECOGNITION_THRESHOLD, create_matcher
+
+# Gallery là ảnh chụp bất biến (store + matcher + số phiên bản). Nơi nhận diện đọc tham chiếu gallery
+# một lần cho mỗi khung hình rồi chỉ dùng bản đó, còn GalleryWatcher dựng bản mới ở luồng nền khi file
+# store thay đổi và thay tham chiếu trong một phép gán, nên không cần dừng nhận diện hay khóa khi tải lại.
+GALLERY_POLL_INTERVAL = 1.0  # Giây giữa hai lần kiểm tra file store
+MATCHER_BACKEND = 'auto'
+
+class GallerySnapshot:
+    """Dữ liệu nhận diện tại một thời điểm. Không sửa sau khi tạo; muốn đổi thì tạo bản mới."""
+
+    __slots__ = ('store', 'matcher', 'version', 'signature')
+
+    def __init__(self, store=(), matcher=None, version=0, signature=None):
+        object.__setattr__(self, 'store', store)
+        object.__setattr__(self, 'matcher', matcher)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'signature', signature)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GallerySnapshot là bất biến.")
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def kind(self):
+        """'prototype' nếu store là gallery prototype (xem gallery_prototypes), ngược lại 'image'.
+
+        So khớp giống nhau cho cả hai kiểu; giá trị này dùng cho báo cáo (thanh trạng thái, /metrics).
+        """
+        header = getattr(self.store, 'header', None) or {}
+        return header.get('gallery', 'image')
+
+    @property
+    def ready(self):
+        """Có thể so khớp (đã có matcher và ít nhất một embedding)."""
+        return self.matcher is not None and len(self.matcher) > 0
+
+    def person(self, index):
+        """{'id', 'name', 'embedding'} của hàng index, None nếu index < 0 (không nhận diện được)."""
+        return self.store[index] if index >= 0 else None
+
+EMPTY_GALLERY = GallerySnapshot()
+
+def _stat_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+def file_signature(path):
+    """(mtime_ns, size, inode) của store và của nhật ký đi kèm; save_store thay file bằng os.replace và
+    append_store ghi nối nhật ký nên mỗi lần ghi đổi chữ ký. None nếu chưa có store."""
+    signature = _stat_signature(path)
+    if signature is None:
+        return None
+    return signature, _stat_signature(journal_path(path))
+
+def load_snapshot(path, matcher_backend=MATCHER_BACKEND, threshold=RECOGNITION_THRESHOLD, version=0):
+    """Đọc store vào RAM và dựng matcher thành một GallerySnapshot. Ném FileNotFoundError nếu chưa có store.
+
+    Snapshot sống suốt phiên nhận diện nên không giữ memmap: file phải thay được khi có người được thêm.
+    """
+    signature = file_signature(path)
+    store = load_gallery(path, in_memory=True)
+    if signature is None:
+        signature = file_signature(path)  # load_gallery vừa chuyển đổi từ file pickle cũ
+    matcher = create_matcher(store.embeddings, matcher_backend, threshold) if len(store) else None
+    return GallerySnapshot(store, matcher, version, signature)
+
+class GalleryWatcher:
+    """Theo dõi file store và công bố GallerySnapshot mới khi file thay đổi.
+
+    snapshot luôn là bản đầy đủ gần nhất; bản mới chỉ được gán sau khi đã dựng xong matcher.
+    on_update(snapshot, count) được gọi từ luồng đã tải (luồng nền hoặc luồng gọi refresh), count
+    là số embedding, 0 nếu chưa có file và -1 nếu tải lỗi (khi đó bản cũ vẫn được giữ).
+    """
+
+    def __init__(self, path, matcher_backend=MATCHER_BACKEND, threshold=RECOGNITION_THRESHOLD,
+                 on_update=None, interval=GALLERY_POLL_INTERVAL):
+        self.path = path
+        self.matcher_backend = matcher_backend
+        self.threshold = threshold
+        self.on_update = on_update
+        self.interval = interval
+        self.snapshot = EMPTY_GALLERY
+        self._refresh_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._checked_signature = None
+        self._checked = False
+
+    def refresh(self, force=False):
+        """Tải lại nếu file đã đổi (hoặc force=True) và công bố bản mới. Trả về snapshot hiện tại."""
+        with self._refresh_lock:
+            signature = file_signature(self.path)
+            if self._checked and not force and signature == self._checked_signature:
+                return self.snapshot
+            self._checked = True
+            self._checked_signature = signature
+            version = self.snapshot.version + 1
+            try:
+                snapshot = load_snapshot(self.path, self.matcher_backend, self.threshold, version)
+            except FileNotFoundError:
+                snapshot = GallerySnapshot(version=version)
+                count = 0
+            except Exception as e:
+                # Giữ bản cũ; lần kiểm tra sau sẽ thử lại vì chữ ký chưa được ghi nhận
+                print(f"[LỖI] Không thể tải file embedding: {e}")
+                self._checked_signature = None
+                snapshot = self.snapshot
+                count = -1
+            else:
+                count = len(snapshot)
+            self.snapshot = snapshot
+        if self.on_update:
+            self.on_update(snapshot, count)
+        return snapshot
+
+    def request_refresh(self):
+        """Yêu cầu luồng nền kiểm tra file ngay, không chờ hết chu kỳ (không chặn luồng gọi)."""
+        self._wake_event.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            self.refresh()
+
+    def start(self):
+        """Bắt đầu luồng theo dõi (có thể gọi lại sau stop())."""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="gallery-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
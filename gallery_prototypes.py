@@ -0,0 +1,161 @@
+import argparse
+import json
+import numpy as np
+from embedding_store import load_gallery, save_store
+from face_matcher import RECOGNITION_THRESHOLD
+
+# Gallery dạng prototype: thay các hàng (một hàng mỗi ảnh) của cùng một người bằng vài vector đại diện,
+# nên ma trận mà mỗi khuôn mặt phải quét nhỏ đi nhiều lần với người có nhiều ảnh đăng ký.
+#   'mean'    : một vector trung bình mỗi người, hướng trung bình và độ dài bằng độ dài trung bình của các ảnh
+#   'medoids' : tối đa max_prototypes ảnh tiêu biểu (k-medoids), giữ được các kiểu ảnh khác nhau (kính, góc nghiêng)
+# Ảnh cách ảnh trung tâm (medoid) của chính người đó xa hơn outlier_threshold bị đánh dấu ngoại lai và không
+# được dùng để dựng prototype. Mỗi hàng vẫn mang id và tên nên matcher và nơi nhận diện dùng như gallery thường;
+# header của store ghi 'gallery': 'prototype' (gallery mỗi ảnh một hàng không có khóa này).
+PROTOTYPE_METHODS = ('mean', 'medoids')
+MAX_PROTOTYPES_PER_PERSON = 3  # Số prototype tối đa mỗi người với 'medoids'
+OUTLIER_THRESHOLD = RECOGNITION_THRESHOLD  # Ảnh không khớp được với chính người đó bị coi là ngoại lai
+MIN_IMAGES_FOR_OUTLIERS = 3  # Với ít ảnh hơn không xác định được đâu là ảnh lạc
+MEDOID_ITERATIONS = 10
+
+def _distances(a, b):
+    squared = (a ** 2).sum(1)[:, None] - 2.0 * a @ b.T + (b ** 2).sum(1)[None, :]
+    return np.sqrt(np.maximum(squared, 0.0))
+
+def normalized_mean(vectors):
+    """Trung bình của các vector, đưa về độ dài bằng độ dài trung bình của chúng (giữ thang đo của gallery)."""
+    mean = vectors.mean(axis=0)
+    length = np.linalg.norm(mean)
+    if length == 0:
+        return mean
+    return mean * (np.linalg.norm(vectors, axis=1).mean() / length)
+
+def k_medoids(vectors, k, iterations=MEDOID_ITERATIONS):
+    """Chỉ số k medoid của vectors. Khởi tạo tất định: medoid chung rồi lần lượt điểm xa nhất.
+
+    k không vượt số vector khác nhau (ảnh trùng lặp cho ra ít medoid hơn); cụm rỗng giữ medoid cũ.
+    """
+    distances = _distances(vectors, vectors)
+    k = min(k, len(np.unique(vectors, axis=0)))
+    medoids = [int(distances.sum(axis=1).argmin())]
+    while len(medoids) < k:
+        nearest = distances[:, medoids].min(axis=1)
+        if nearest.max() <= 0:
+            break
+        medoids.append(int(nearest.argmax()))
+
+    for _ in range(iterations):
+        assignment = distances[:, medoids].argmin(axis=1)
+        updated = []
+        for cluster, medoid in enumerate(medoids):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members) == 0:
+                updated.append(medoid)
+                continue
+            within = distances[np.ix_(members, members)].sum(axis=1)
+            updated.append(int(members[within.argmin()]))
+        if updated == medoids:
+            break
+        medoids = updated
+    return medoids
+
+def find_outliers(vectors, threshold=OUTLIER_THRESHOLD):
+    """Chỉ số và khoảng cách tới medoid của các ảnh ngoại lai. Không đánh dấu nếu quá ít ảnh hoặc mọi ảnh đều lạc."""
+    if len(vectors) < MIN_IMAGES_FOR_OUTLIERS:
+        return [], []
+    distances = _distances(vectors, vectors)
+    center_distances = distances[distances.sum(axis=1).argmin()]
+    outliers = np.flatnonzero(center_distances >= threshold)
+    if len(outliers) == len(vectors):
+        return [], []
+    return outliers.tolist(), center_distances[outliers].tolist()
+
+def condense_identity(vectors, method='mean', max_prototypes=MAX_PROTOTYPES_PER_PERSON, outlier_threshold=OUTLIER_THRESHOLD):
+    """Prototype của một người từ các embedding vectors. Trả về (ma trận prototype, chỉ số ngoại lai, khoảng cách)."""
+    if method not in PROTOTYPE_METHODS:
+        raise ValueError(f"Kiểu prototype không hợp lệ: {method} (hỗ trợ: {', '.join(PROTOTYPE_METHODS)})")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    outliers, outlier_distances = find_outliers(vectors, outlier_threshold)
+    inliers = np.delete(vectors, outliers, axis=0) if outliers else vectors
+    if method == 'mean':
+        prototypes = normalized_mean(inliers)[None]
+    else:
+        prototypes = inliers[k_medoids(inliers, max(1, max_prototypes))]
+    return prototypes.astype(np.float32), outliers, outlier_distances
+
+def build_prototypes(embeddings, ids, names, method='mean', max_prototypes=MAX_PROTOTYPES_PER_PERSON,
+                     outlier_threshold=OUTLIER_THRESHOLD, labels=None):
+    """Gộp các hàng theo id thành prototype, giữ thứ tự xuất hiện đầu tiên của mỗi người.
+
+    labels (vd. đường dẫn ảnh của từng hàng) chỉ dùng để báo cáo ảnh ngoại lai.
+    Trả về (embeddings, ids, names, báo cáo) với báo cáo gồm số hàng trước/sau và danh sách ngoại lai.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rows_by_id = {}
+    for row, user_id in enumerate(ids):
+        rows_by_id.setdefault(user_id, []).append(row)
+
+    prototype_blocks, prototype_ids, prototype_names, outliers = [], [], [], []
+    for user_id, rows in rows_by_id.items():
+        prototypes, person_outliers, distances = condense_identity(embeddings[rows], method, max_prototypes, outlier_threshold)
+        prototype_blocks.append(prototypes)
+        prototype_ids.extend([user_id] * len(prototypes))
+        prototype_names.extend([names[rows[0]]] * len(prototypes))
+        for local_index, distance in zip(person_outliers, distances):
+            row = rows[local_index]
+            outliers.append({'row': row, 'id': user_id, 'name': names[row], 'distance': float(distance),
+                             'label': labels[row] if labels is not None else None})
+
+    dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+    prototype_embeddings = np.concatenate(prototype_blocks) if prototype_blocks else np.empty((0, dim), np.float32)
+    report = {
+        'method': method,
+        'max_prototypes': max_prototypes if method == 'medoids' else 1,
+        'people': len(rows_by_id),
+        'source_count': len(embeddings),
+        'prototype_count': len(prototype_embeddings),
+        'outliers': outliers,
+    }
+    return prototype_embeddings, prototype_ids, prototype_names, report
+
+def prototype_metadata(report):
+    """Các khóa ghi vào header store cho gallery prototype."""
+    return {'gallery': 'prototype', 'prototype_method': report['method'],
+            'max_prototypes': report['max_prototypes'], 'source_count': report['source_count']}
+
+def print_report(report):
+    for outlier in report['outliers']:
+        source = outlier['label'] if outlier['label'] is not None else f"hàng {outlier['row']}"
+        print(f"[Cảnh báo] Ảnh ngoại lai của {outlier['name']} ({outlier['id']}): {source}, "
+              f"khoảng cách {outlier['distance']:.3f}")
+    ratio = report['source_count'] / report['prototype_count'] if report['prototype_count'] else 0.0
+    print(f"Prototype '{report['method']}': {report['source_count']} hàng -> {report['prototype_count']} hàng "
+          f"({report['people']} người, nhỏ hơn {ratio:.1f} lần), {len(report['outliers'])} ảnh ngoại lai.")
+
+def condense_store(input_path, output_path, method='mean', max_prototypes=MAX_PROTOTYPES_PER_PERSON,
+                   outlier_threshold=OUTLIER_THRESHOLD):
+    """Tạo store prototype từ một store mỗi ảnh một hàng. Trả về báo cáo."""
+    store = load_gallery(input_path)
+    if store.header.get('gallery') == 'prototype':
+        raise ValueError(f"{input_path} đã là gallery prototype.")
+    embeddings, ids, names, report = build_prototypes(
+        store.embeddings, store.ids.tolist(), store.names.tolist(), method, max_prototypes, outlier_threshold)
+    metadata = {key: value for key, value in store.header.items() if key == 'embedder'}
+    metadata.update(prototype_metadata(report))
+    save_store(output_path, embeddings, ids, names, metadata)
+    print_report(report)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gộp gallery mỗi ảnh một hàng thành gallery prototype.")
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--method", choices=PROTOTYPE_METHODS, default='mean')
+    parser.add_argument("--max-prototypes", type=int, default=MAX_PROTOTYPES_PER_PERSON)
+    parser.add_argument("--outlier-threshold", type=float, default=OUTLIER_THRESHOLD)
+    parser.add_argument("--report", help="Ghi báo cáo JSON (gồm danh sách ảnh ngoại lai) vào file.")
+    args = parser.parse_args()
+
+    report = condense_store(args.input_path, args.output_path, args.method, args.max_prototypes, args.outlier_threshold)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
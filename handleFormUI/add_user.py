@@ -1,35 +1,41 @@
 import cv2
-import sys
-import os
-import random
-import numpy as np
 import traceback
 from PyQt5.QtWidgets import QDialog, QMessageBox
 from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import QTimer, Qt, pyqtSignal
+from PyQt5.QtCore import QTimer, Qt, pyqtSignal, pyqtSlot
 from ui_form_ChupAnh import Ui_Form
+from enrollment import EMBEDDING_FILEPATH, IMAGES_FOLDER, sanitize_user_name
 
 try:
-    from CodeGenerator_facenet import generate_and_save_embeddings
+    from handleFormUI.enrollment_worker import EnrollmentWorker
 except ImportError:
-    print("[LỖI] Không thể import 'generate_and_save_embeddings'")
-    generate_and_save_embeddings = None
-
-IMAGES_FOLDER = "dataset"
+    from enrollment_worker import EnrollmentWorker
 
 class AddUserDialog(QDialog, Ui_Form):
-    user_added = pyqtSignal()
+    user_added = pyqtSignal(dict)  # {'id', 'name', 'photo', 'gallery_size'}
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, frame_source=None, detector=None, embedder=None,
+                 embedding_filepath=EMBEDDING_FILEPATH, images_folder=IMAGES_FOLDER):
         super().__init__(parent)
         self.setupUi(self)
         self.setWindowTitle("Thêm Người Dùng Mới")
 
+        # frame_source() trả về khung BGR mới nhất của worker nhận diện (hoặc None), nên cửa sổ không
+        # phải mở camera lần hai; chỉ khi không có mới tự mở camera như trước
+        self.frame_source = frame_source
+        self.detector = detector
+        self.embedder = embedder
+        self.embedding_filepath = embedding_filepath
+        self.images_folder = images_folder
+        self.enrollment_worker = None
         self.capture = None
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_preview)
         self.captured_image = None
 
+        self.progressBar.setRange(0, 100)  # progressBar nằm trong form_ChupAnh.ui, chỉ hiện khi đang thêm
+        self.progressBar.hide()
+
         self.btnChupAnh.clicked.connect(self.capture_image_action)
         self.btnDongY.clicked.connect(self.confirm_action)
         self.btnHuy.clicked.connect(self.cancel_action)
@@ -38,6 +44,10 @@ class AddUserDialog(QDialog, Ui_Form):
         self.reset_ui_to_capture_mode()
 
     def init_camera(self):
+        if self.frame_source is not None:
+            self.timer.start(30)
+            self.btnChupAnh.setEnabled(True)
+            return
         try:
             self.capture = cv2.VideoCapture(0)
             if not self.capture or not self.capture.isOpened():
@@ -55,9 +65,19 @@ class AddUserDialog(QDialog, Ui_Form):
             self.btnChupAnh.setEnabled(False)
             self.capture = None
 
+    def _camera_ready(self):
+        return self.frame_source is not None or (self.capture is not None and self.capture.isOpened())
+
+    def _read_frame(self):
+        """Đọc khung BGR mới nhất từ worker nhận diện hoặc từ camera riêng. Trả về (ret, frame)."""
+        if self.frame_source is not None:
+            frame_bgr = self.frame_source()
+            return frame_bgr is not None, frame_bgr
+        return self.capture.read()
+
     def update_preview(self):
-        if self.capture and self.capture.isOpened() and self.timer.isActive():
-            ret, frame_bgr = self.capture.read()
+        if self._camera_ready() and self.timer.isActive():
+            ret, frame_bgr = self._read_frame()
             if ret:
                 try:
                     frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
@@ -77,16 +97,17 @@ class AddUserDialog(QDialog, Ui_Form):
         self.labelCamera.setText("(Hướng camera vào mặt và nhấn Chụp Ảnh)")
         self.captured_image = None
         self.txtTenNguoiMoi.clear()
+        self.progressBar.hide()
 
         self.btnChupAnh.show()
-        self.btnChupAnh.setEnabled(self.capture is not None and self.capture.isOpened())
+        self.btnChupAnh.setEnabled(self._camera_ready())
 
-        if self.capture and self.capture.isOpened() and not self.timer.isActive():
+        if self._camera_ready() and not self.timer.isActive():
             self.timer.start(30)
 
     def capture_image_action(self):
-        if self.capture and self.capture.isOpened():
-            ret, frame_bgr = self.capture.read()
+        if self._camera_ready():
+            ret, frame_bgr = self._read_frame()
             if ret and frame_bgr is not None:
                 self.timer.stop()
                 self.captured_image = frame_bgr.copy()
@@ -116,9 +137,7 @@ class AddUserDialog(QDialog, Ui_Form):
             self.reset_ui_to_capture_mode()
 
     def confirm_action(self):
-        user_name_raw = self.txtTenNguoiMoi.text()
-        user_name = ''.join(c for c in user_name_raw if c.isalnum() or c in [' ', '_', '-']).strip()
-        user_name = '_'.join(user_name.split())
+        user_name = sanitize_user_name(self.txtTenNguoiMoi.text())
 
         if not user_name:
             QMessageBox.warning(self, "Thiếu Thông Tin", "Vui lòng nhập tên hợp lệ.")
@@ -129,50 +148,56 @@ class AddUserDialog(QDialog, Ui_Form):
             self.reset_ui_to_capture_mode()
             return
 
-        if not generate_and_save_embeddings:
-            QMessageBox.critical(self, "Lỗi Hệ Thống", "Hàm generate_and_save_embeddings không khả dụng.")
-            return
-
-        # Tạo thư mục tên duy nhất
-        new_id_str = ""
-        folder_name = ""
-        for _ in range(100):
-            temp_id = random.randint(100, 999)
-            formatted_id = f"{temp_id:03d}"
-            potential_folder_name = f"{formatted_id}_{user_name}"
-            potential_folder_path = os.path.join(IMAGES_FOLDER, potential_folder_name)
-
-            if not os.path.exists(potential_folder_path):
-                new_id_str = formatted_id
-                folder_name = potential_folder_name
-                break
-
-        if not new_id_str:
-            QMessageBox.critical(self, "Lỗi", "Không thể tạo thư mục duy nhất.")
-            self.reset_ui_to_capture_mode()
-            return
+        # Chỉ tạo embedding cho khuôn mặt vừa chụp, trên luồng nền để giao diện không bị treo
+        self.txtTenNguoiMoi.setEnabled(False)
+        self.btnDongY.setEnabled(False)
+        self.btnHuy.setEnabled(False)
+        self.progressBar.setValue(0)
+        self.progressBar.show()
+        self.enrollment_worker = EnrollmentWorker(self.captured_image, user_name, self.detector, self.embedder,
+                                                  self.embedding_filepath, self.images_folder, parent=self)
+        self.enrollment_worker.progress.connect(self.update_enroll_progress)
+        self.enrollment_worker.enrolled.connect(self.handle_enrolled)
+        self.enrollment_worker.failed.connect(self.handle_enroll_failed)
+        self.enrollment_worker.start()
+
+    @pyqtSlot(int, str)
+    def update_enroll_progress(self, percent, message):
+        self.progressBar.setValue(percent)
+        self.progressBar.setFormat(f"{message} %p%")
+
+    @pyqtSlot(dict)
+    def handle_enrolled(self, result):
+        self._finish_enrollment()
+        QMessageBox.information(self, "Thành công", f"Người dùng {result['name']} (ID {result['id']}) đã được thêm.")
+        self.user_added.emit(result)
+        self.close()
+
+    @pyqtSlot(str)
+    def handle_enroll_failed(self, error_message):
+        self._finish_enrollment()
+        QMessageBox.critical(self, "Lỗi", f"Có lỗi khi lưu ảnh hoặc tạo embedding: {error_message}")
+        self.reset_ui_to_capture_mode()
 
-        folder_path = os.path.join(IMAGES_FOLDER, folder_name)
-        image_filename = f"{folder_name}.png"
-        save_path = os.path.join(folder_path, image_filename)
-
-        try:
-            os.makedirs(folder_path, exist_ok=True)
-            success = cv2.imwrite(save_path, self.captured_image)
-            if not success:
-                raise IOError(f"Lưu ảnh thất bại tại '{save_path}'")
-            print(f"Đã lưu ảnh: {save_path}")
-
-            print("Đang cập nhật embeddings...")
-            generate_and_save_embeddings()
-            QMessageBox.information(self, "Thành công", "Người dùng đã được thêm.")
-            self.user_added.emit()
-            self.close()
-
-        except Exception as e:
-            QMessageBox.critical(self, "Lỗi", f"Có lỗi khi lưu ảnh hoặc tạo embedding: {e}")
-            traceback.print_exc()
-            self.reset_ui_to_capture_mode()
+    def _finish_enrollment(self):
+        self.progressBar.hide()
+        self.txtTenNguoiMoi.setEnabled(True)
+        self.btnDongY.setEnabled(True)
+        self.btnHuy.setEnabled(True)
+        if self.enrollment_worker is not None:
+            self.enrollment_worker.wait()
+            self.enrollment_worker.deleteLater()
+            self.enrollment_worker = None
 
     def cancel_action(self):
         self.reset_ui_to_capture_mode()
+
+    def done(self, result):
+        """Đóng cửa sổ: chờ lần thêm đang chạy xong và giải phóng camera riêng (nếu có)."""
+        if self.enrollment_worker is not None and self.enrollment_worker.isRunning():
+            self.enrollment_worker.wait()
+        self.timer.stop()
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+        super().done(result)
@@ -1,3 +1,6 @@
+import time
+APP_START = time.perf_counter()  # Mốc đo thời gian khởi động lạnh đến khung hình đầu tiên
+
 import sys
 import os
 
@@ -11,7 +14,7 @@ if project_root not in sys.path:
 
 import cv2
 import numpy as np
-from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QLabel, QDialog
+from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QLabel, QDialog, QProgressBar
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtCore import Qt, pyqtSlot
 from ui_form_FaceRecognition import Ui_MainWindow
@@ -20,10 +23,14 @@ from ui_form_FaceRecognition import Ui_MainWindow
 try:
     from handleFormUI.worker import RecognitionWorker
     from handleFormUI.add_user import AddUserDialog
+    from handleFormUI.model_loader import ModelLoader
+    from handleFormUI.photo_index import PhotoIndex, ThumbnailCache
 except ImportError:
     try:
         from worker import RecognitionWorker
         from add_user import AddUserDialog
+        from model_loader import ModelLoader
+        from photo_index import PhotoIndex, ThumbnailCache
     except ImportError as e:
         print(f"[LỖI] Không thể nhập RecognitionWorker hoặc AddUserDialog: {e}")
         sys.exit(1)
@@ -38,81 +45,115 @@ if not os.path.isdir(dataset_folder):
     except Exception as e:
         print(f"[LỖI] Không thể tạo thư mục dataset: {e}")
 
-# Khởi tạo model MTCNN và FaceNet
-models_loaded = False
-detector = None
-embedder = None
-try:
-    from mtcnn.mtcnn import MTCNN
-    from keras_facenet import FaceNet
-    detector = MTCNN()
-    embedder = FaceNet()
-    models_loaded = True
-except Exception as e:
-    print(f"[LỖI] Không thể khởi tạo model: {e}")
-
 # Xác định đường dẫn file embedding
 embedding_folder = os.path.join(project_root, 'EmbeddingPicture')
-embedding_file = os.path.join(embedding_folder, 'Embeddings_Facenet.p')
-
-# Tạo file embedding nếu chưa tồn tại và model đã tải
-if models_loaded and not os.path.exists(embedding_file):
-    try:
-        from CodeGenerator_facenet import generate_and_save_embeddings
-        if generate_and_save_embeddings():
-            print("Tạo file embedding ban đầu thành công.")
-        else:
-            print("[CẢNH BÁO] Không thể tạo file embedding ban đầu.")
-    except Exception as e:
-        print(f"[LỖI] Lỗi khi tạo file embedding: {e}")
+embedding_file = os.path.join(embedding_folder, 'Embeddings_Facenet.emb')
 
 class FaceRecognitionApp(QMainWindow, Ui_MainWindow):
-    def __init__(self, detector, embedder, parent=None):
+    def __init__(self, parent=None):
         super().__init__(parent)
         self.setupUi(self)
         self.setWindowTitle("Ứng dụng Nhận Diện Khuôn Mặt (FaceNet + MTCNN)")
 
-        self.detector = detector
-        self.embedder = embedder
+        self.detector = None
+        self.embedder = None
+        self.models_loaded = False
+        self.model_timings = {}
+        self.cold_start_seconds = None
         self.recognition_worker = None
         self.add_user_dialog = None
+        self.photo_index = PhotoIndex(dataset_folder)
+        self.thumbnails = ThumbnailCache()
+        self.displayed_person_id = None
 
-        # Xử lý khi model không tải được
-        if not models_loaded:
-            self.labelCamera.setText("LỖI:\nKhông thể tải model MTCNN hoặc FaceNet.\nVui lòng kiểm tra cài đặt.")
-            self.labelCamera.setAlignment(Qt.AlignCenter)
-            self.labelCamera.setStyleSheet("QLabel { color: red; font-weight: bold; }")
-            self.btnAddPerson.setEnabled(False)
-            self.statusBar().showMessage("Lỗi khởi tạo model!")
-            QMessageBox.critical(self, "Lỗi Model", "Không thể khởi tạo model MTCNN/FaceNet. Kiểm tra console để biết chi tiết.")
-        else:
-            # Khởi động worker nhận diện nếu model tải thành công
-            self.recognition_worker = RecognitionWorker(self.detector, self.embedder, embedding_file, parent=self)
-            self.recognition_worker.signals.frame_ready.connect(self.update_camera_feed)
-            self.recognition_worker.signals.recognition_result.connect(self.update_recognition_info)
-            self.recognition_worker.signals.no_recognition.connect(self.clear_recognition_info)
-            self.recognition_worker.signals.error.connect(self.show_worker_error)
-            self.recognition_worker.signals.embeddings_loaded.connect(self.update_status_bar)
-            self.recognition_worker.start()
-            self.statusBar().showMessage("Đang khởi động worker và tải embedding...")
+        # Số liệu hiệu năng hiển thị cố định ở góc phải thanh trạng thái
+        self.labelPerf = QLabel()
+        self.statusBar().addPermanentWidget(self.labelPerf)
+
+        # Tải model trên luồng nền, cửa sổ hiển thị ngay trong lúc chờ
+        self.loadProgress = QProgressBar()
+        self.loadProgress.setMaximumWidth(200)
+        self.statusBar().addPermanentWidget(self.loadProgress)
+        self.labelCamera.setAlignment(Qt.AlignCenter)
+        self.labelCamera.setScaledContents(False)  # Worker đã thu khung hình về đúng kích thước hiển thị
+        self.labelCamera.setText("Đang tải model nhận diện...")
+        self.btnAddPerson.setEnabled(False)
+        self.model_loader = ModelLoader(embedding_file, parent=self)
+        self.model_loader.progress.connect(self.update_load_progress)
+        self.model_loader.loaded.connect(self.handle_models_loaded)
+        self.model_loader.failed.connect(self.handle_models_failed)
+        self.model_loader.start()
 
         # Thiết lập giao diện ban đầu
         self.btnAddPerson.clicked.connect(self.open_add_user_dialog)
         self.labelPicturePerson.setAlignment(Qt.AlignCenter)
+        self.labelPicturePerson.setScaledContents(False)  # Ảnh thu nhỏ đã đúng kích thước
         self.labelPicturePerson.setText("(Chưa nhận diện)")
         self.txt_name_person.setReadOnly(True)
         self.txt_id_person.setReadOnly(True)
         self.clear_recognition_info()
 
-    @pyqtSlot(QImage)
-    def update_camera_feed(self, qt_image):
-        # Cập nhật khung hình camera
-        if hasattr(self, 'labelCamera') and models_loaded:
-            try:
-                pixmap = QPixmap.fromImage(qt_image)
-                self.labelCamera.setPixmap(pixmap.scaled(self.labelCamera.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
-            except Exception as e:
-                print(f"Lỗi khi cập nhật khung hình camera: {e}")
+    @pyqtSlot(int, str)
+    def update_load_progress(self, percent, message):
+        self.loadProgress.setValue(percent)
+        self.statusBar().showMessage(message)
+
+    @pyqtSlot(str)
+    def handle_models_failed(self, error_message):
+        """Xử lý khi model không tải được."""
+        self.loadProgress.hide()
+        self.labelCamera.setText("LỖI:\nKhông thể tải model MTCNN hoặc FaceNet.\nVui lòng kiểm tra cài đặt.")
+        self.labelCamera.setStyleSheet("QLabel { color: red; font-weight: bold; }")
+        self.statusBar().showMessage("Lỗi khởi tạo model!")
+        QMessageBox.critical(self, "Lỗi Model", f"Không thể khởi tạo model MTCNN/FaceNet.\nChi tiết: {error_message}")
+
+    @pyqtSlot(object, object, dict)
+    def handle_models_loaded(self, detector, embedder, timings):
+        """Khởi động worker nhận diện khi model đã tải và chạy thử xong."""
+        self.detector = detector
+        self.embedder = embedder
+        self.models_loaded = True
+        self.model_timings = timings
+        self.loadProgress.hide()
+        self.btnAddPerson.setEnabled(True)
+        self.labelCamera.setText("Đang mở camera...")
+        print("Thời gian tải model: " + ", ".join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+
+        self.recognition_worker = RecognitionWorker(self.detector, self.embedder, embedding_file, parent=self)
+        for step, seconds in timings.items():
+            self.recognition_worker.metrics.set_gauge('startup_seconds', seconds, step)
+        self.recognition_worker.set_display_size(self.labelCamera.width(), self.labelCamera.height())
+        self.recognition_worker.signals.display_frame.connect(self.update_camera_feed)
+        self.recognition_worker.signals.recognition_result.connect(self.update_recognition_info)
+        self.recognition_worker.signals.no_recognition.connect(self.clear_recognition_info)
+        self.recognition_worker.signals.error.connect(self.show_worker_error)
+        self.recognition_worker.signals.embeddings_loaded.connect(self.update_status_bar)
+        self.recognition_worker.signals.metrics_updated.connect(self.update_perf_metrics)
+        self.recognition_worker.start()
+        self.statusBar().showMessage("Đang khởi động worker và tải embedding...")
+
+    @pyqtSlot(QImage, int)
+    def update_camera_feed(self, qt_image, slot):
+        # Cập nhật khung hình camera; ảnh đã ở kích thước hiển thị nên không cần scale trên luồng giao diện
+        started = time.perf_counter()
+        if self.cold_start_seconds is None:
+            self.cold_start_seconds = started - APP_START
+            print(f"Khởi động lạnh đến khung hình đầu tiên: {self.cold_start_seconds:.2f}s")
+            self.recognition_worker.metrics.set_gauge('startup_seconds', self.cold_start_seconds, 'first_frame')
+        try:
+            if hasattr(self, 'labelCamera') and self.models_loaded:
+                # QPixmap.fromImage sao chép dữ liệu nên bộ đệm được trả lại ngay trong finally
+                self.labelCamera.setPixmap(QPixmap.fromImage(qt_image))
+        except Exception as e:
+            print(f"Lỗi khi cập nhật khung hình camera: {e}")
+        finally:
+            self.recognition_worker.release_frame(slot)
+            self.recognition_worker.metrics.observe('stage_seconds', time.perf_counter() - started, 'display')
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.recognition_worker:
+            self.recognition_worker.set_display_size(self.labelCamera.width(), self.labelCamera.height())
 
     @pyqtSlot(np.ndarray, str, str)
     def update_recognition_info(self, face_crop_bgr, name, id_):
@@ -120,30 +161,16 @@ class FaceRecognitionApp(QMainWindow, Ui_MainWindow):
         self.txt_name_person.setText(name)
         self.txt_id_person.setText(id_)
 
-        # Tìm thư mục và ảnh của người dùng
-        photo_path = None
-        person_folder = None
-
-        if os.path.isdir(dataset_folder):
-            folder_prefix = f"{id_}_"
-            try:
-                for item in os.listdir(dataset_folder):
-                    item_path = os.path.join(dataset_folder, item)
-                    if os.path.isdir(item_path) and item.startswith(folder_prefix):
-                        person_folder = item_path
-                        for file in os.listdir(person_folder):
-                            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-                                photo_path = os.path.join(person_folder, file)
-                                break
-                        break
-            except Exception as e:
-                print(f"[LỖI] Lỗi khi tìm ảnh cho ID {id_}: {e}")
-
-        # Hiển thị ảnh nếu tìm thấy
-        if photo_path and os.path.exists(photo_path):
-            pixmap = QPixmap(photo_path)
+        if id_ == self.displayed_person_id:
+            return  # Cùng người (kết quả gửi lại định kỳ), ảnh đang hiển thị vẫn đúng
+        self.displayed_person_id = id_
+
+        # Tra chỉ mục và bộ nhớ đệm ảnh thu nhỏ thay vì duyệt dataset/ và giải mã ảnh gốc mỗi lần
+        person_folder, photo_path = self.photo_index.lookup(id_)
+        if photo_path:
+            pixmap = self.thumbnails.get(photo_path, self.labelPicturePerson.size())
             if not pixmap.isNull():
-                self.labelPicturePerson.setPixmap(pixmap.scaled(self.labelPicturePerson.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+                self.labelPicturePerson.setPixmap(pixmap)
             else:
                 self.labelPicturePerson.setText("Ảnh không hợp lệ")
         elif person_folder:
@@ -154,6 +181,7 @@ class FaceRecognitionApp(QMainWindow, Ui_MainWindow):
     @pyqtSlot()
     def clear_recognition_info(self):
         """Xóa thông tin người dùng khỏi giao diện khi không nhận diện được."""
+        self.displayed_person_id = None
         if self.txt_id_person.toPlainText():
             self.txt_name_person.clear()
             self.txt_id_person.clear()
@@ -169,58 +197,67 @@ class FaceRecognitionApp(QMainWindow, Ui_MainWindow):
     @pyqtSlot(int)
     def update_status_bar(self, count):
         # Cập nhật thanh trạng thái
-        if not models_loaded:
+        if not self.models_loaded:
             self.statusBar().showMessage("LỖI KHỞI TẠO MODEL!")
             return
-        if count > 0:
+        if count > 0 and self.recognition_worker is not None and self.recognition_worker.gallery.kind == 'prototype':
+            self.statusBar().showMessage(f"Sẵn sàng nhận diện ({count} prototype)")
+        elif count > 0:
             self.statusBar().showMessage(f"Sẵn sàng nhận diện ({count} người đã biết)")
         elif count == 0:
             self.statusBar().showMessage("Chưa có dữ liệu nhận diện. Vui lòng thêm người dùng.")
         else:
             self.statusBar().showMessage("Lỗi tải dữ liệu nhận diện.")
 
+    @pyqtSlot(dict)
+    def update_perf_metrics(self, snapshot):
+        """Hiển thị FPS và độ trễ gần đây của các bước chính trên thanh trạng thái."""
+        stages = snapshot.get('stages', {})
+        parts = [f"FPS {snapshot.get('fps', 0.0):.1f}"]
+        for stage in ('detect', 'embed', 'match', 'render'):
+            if stage in stages:
+                parts.append(f"{stage} {stages[stage]['recent_ms']:.0f}ms")
+        parts.append(f"mặt/khung {snapshot.get('faces_per_frame', 0.0):.1f}")
+        self.labelPerf.setText(" | ".join(parts))
+
     def open_add_user_dialog(self):
-        """Mở cửa sổ thêm người dùng, tạm dừng worker nếu đang chạy."""
-        if not models_loaded:
+        """Mở cửa sổ thêm người dùng; cửa sổ dùng khung hình của worker nên nhận diện vẫn chạy."""
+        if not self.models_loaded:
             QMessageBox.critical(self, "Lỗi", "Model chưa tải. Không thể thêm người dùng.")
             return
         if not self.recognition_worker:
             QMessageBox.critical(self, "Lỗi", "Worker nhận diện chưa khởi tạo.")
             return
 
-        worker_was_running = False
-        if self.recognition_worker.isRunning():
-            self.recognition_worker.stop()
-            worker_was_running = True
-
-        self.add_user_dialog = AddUserDialog(self)
+        frame_source = self.recognition_worker.latest_frame if self.recognition_worker.isRunning() else None
+        self.add_user_dialog = AddUserDialog(self, frame_source, self.detector, self.embedder,
+                                             embedding_file, dataset_folder)
         self.add_user_dialog.user_added.connect(self.handle_user_added)
-        result = self.add_user_dialog.exec_()
-
-        if worker_was_running and not self.recognition_worker.isRunning():
-            self.recognition_worker.start()
-            self.statusBar().showMessage("Đang khởi động lại worker nhận diện...")
+        self.add_user_dialog.exec_()
 
         self.add_user_dialog.deleteLater()
         self.add_user_dialog = None
 
-    @pyqtSlot()
-    def handle_user_added(self):
-        """Xử lý khi thêm người dùng thành công và tải lại embedding."""
+    @pyqtSlot(dict)
+    def handle_user_added(self, result):
+        """Xử lý khi thêm người dùng thành công: worker tự tải bản gallery mới ở nền."""
+        self.photo_index.add(result['id'], result['photo'])
         if self.recognition_worker:
             self.recognition_worker.reload_embeddings()
-            self.statusBar().showMessage("Đã thêm người dùng. Đang cập nhật dữ liệu nhận diện...")
+            self.statusBar().showMessage(f"Đã thêm {result['name']}. Đang cập nhật dữ liệu nhận diện...")
 
     def closeEvent(self, event):
         """Dọn dẹp trước khi đóng ứng dụng."""
         if self.recognition_worker and self.recognition_worker.isRunning():
             self.recognition_worker.stop()
+        if self.model_loader.isRunning():
+            self.model_loader.wait()
         if self.add_user_dialog and self.add_user_dialog.isVisible():
             self.add_user_dialog.reject()
         event.accept()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    main_window = FaceRecognitionApp(detector, embedder)
+    main_window = FaceRecognitionApp()
     main_window.show()
     sys.exit(app.exec_())
\ No newline at end of file
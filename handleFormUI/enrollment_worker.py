@@ -0,0 +1,35 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+from enrollment import EMBEDDING_FILEPATH, IMAGES_FOLDER, enroll_face
+
+# Thêm người dùng trên luồng nền: phát hiện, tạo embedding và ghi store không chặn giao diện.
+
+class EnrollmentWorker(QThread):
+    progress = pyqtSignal(int, str)  # Phần trăm, mô tả bước đang chạy
+    enrolled = pyqtSignal(dict)  # {'id', 'name', 'photo', 'gallery_size'}
+    failed = pyqtSignal(str)
+
+    def __init__(self, image_bgr, user_name, detector=None, embedder=None, embedding_filepath=EMBEDDING_FILEPATH,
+                 images_folder=IMAGES_FOLDER, parent=None):
+        super().__init__(parent)
+        self.image_bgr = image_bgr
+        self.user_name = user_name
+        self.detector = detector
+        self.embedder = embedder
+        self.embedding_filepath = embedding_filepath
+        self.images_folder = images_folder
+
+    def run(self):
+        try:
+            detector, embedder = self.detector, self.embedder
+            if detector is None or embedder is None:
+                # model_registry trả về đúng model giao diện đã tải
+                from model_registry import get_detector, get_embedder
+                detector, embedder = get_detector(), get_embedder()
+            result = enroll_face(self.image_bgr, self.user_name, detector, embedder,
+                                 images_folder=self.images_folder, embedding_filepath=self.embedding_filepath,
+                                 progress=self.progress.emit)
+        except Exception as e:
+            print(f"[LỖI] Không thể thêm người dùng: {e}")
+            self.failed.emit(str(e))
+            return
+        self.enrolled.emit(result)
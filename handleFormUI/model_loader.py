@@ -0,0 +1,58 @@
+import os
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+from face_pipeline import warm_up_models
+from model_registry import get_detector, get_embedder
+
+# Tải MTCNN/FaceNet trên luồng nền để cửa sổ hiện ngay khi khởi động.
+# TensorFlow chỉ được nhập khi model_registry tạo model trong run(), không nằm trên đường import của giao diện.
+
+class ModelLoader(QThread):
+    progress = pyqtSignal(int, str)  # Phần trăm, mô tả bước đang chạy
+    loaded = pyqtSignal(object, object, dict)  # detector, embedder, thời gian từng bước (giây)
+    failed = pyqtSignal(str)
+
+    def __init__(self, embedding_file=None, parent=None):
+        super().__init__(parent)
+        self.embedding_file = embedding_file
+
+    def run(self):
+        timings = {}
+        try:
+            started = time.perf_counter()
+            self.progress.emit(5, "Đang khởi tạo MTCNN...")
+            detector = get_detector()
+            timings['detector_load'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            self.progress.emit(40, "Đang nạp FaceNet...")
+            embedder = get_embedder()
+            timings['embedder_load'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            self.progress.emit(70, "Đang chạy thử mô hình...")
+            warm_up_models(detector, embedder)
+            timings['warm_up'] = time.perf_counter() - started
+        except Exception as e:
+            print(f"[LỖI] Không thể khởi tạo model: {e}")
+            self.failed.emit(str(e))
+            return
+
+        # Tạo file embedding nếu chưa tồn tại (kể cả bản pickle cũ)
+        if self.embedding_file:
+            legacy_file = os.path.splitext(self.embedding_file)[0] + '.p'
+            if not os.path.exists(self.embedding_file) and not os.path.exists(legacy_file):
+                self.progress.emit(85, "Đang tạo dữ liệu nhận diện ban đầu...")
+                started = time.perf_counter()
+                try:
+                    from CodeGenerator_facenet import generate_and_save_embeddings
+                    if generate_and_save_embeddings():
+                        print("Tạo file embedding ban đầu thành công.")
+                    else:
+                        print("[CẢNH BÁO] Không thể tạo file embedding ban đầu.")
+                except Exception as e:
+                    print(f"[LỖI] Lỗi khi tạo file embedding: {e}")
+                timings['initial_embeddings'] = time.perf_counter() - started
+
+        self.progress.emit(100, "Mô hình đã sẵn sàng.")
+        self.loaded.emit(detector, embedder, timings)
@@ -0,0 +1,98 @@
+import collections
+import os
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImageReader, QPixmap
+
+# Ảnh đại diện cho khung thông tin người được nhận diện: chỉ mục ID -> ảnh và bộ nhớ đệm ảnh thu nhỏ,
+# để mỗi lần có kết quả nhận diện không phải duyệt lại dataset/ và giải mã lại ảnh gốc.
+PHOTO_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+THUMBNAIL_CACHE_SIZE = 64  # Số ảnh thu nhỏ giữ trong bộ nhớ
+
+class PhotoIndex:
+    """Chỉ mục ID người dùng -> (thư mục, ảnh đầu tiên) trong dataset/<id>_<tên>/.
+
+    Danh sách thư mục được đọc một lần khi tạo; ảnh trong thư mục của một ID chỉ được tìm ở lần tra cứu
+    đầu tiên của ID đó. Người dùng mới được thêm bằng add() khi đăng ký, không cần quét lại.
+    """
+
+    def __init__(self, dataset_folder):
+        self.dataset_folder = dataset_folder
+        self._folders = {}  # id -> đường dẫn thư mục
+        self._photos = {}  # id -> đường dẫn ảnh hoặc None (đã tìm, không có ảnh)
+        self.rebuild()
+
+    def rebuild(self):
+        """Đọc lại danh sách thư mục người dùng (một lần os.listdir)."""
+        self._folders = {}
+        self._photos = {}
+        if not os.path.isdir(self.dataset_folder):
+            return
+        try:
+            for item in sorted(os.listdir(self.dataset_folder)):
+                user_id, sep, _ = item.partition('_')
+                item_path = os.path.join(self.dataset_folder, item)
+                if sep and user_id not in self._folders and os.path.isdir(item_path):
+                    self._folders[user_id] = item_path
+        except OSError as e:
+            print(f"[LỖI] Không thể đọc thư mục dataset: {e}")
+
+    def add(self, user_id, photo_path):
+        """Ghi nhận ảnh của người dùng vừa đăng ký (giữ ảnh cũ nếu ID đã có ảnh)."""
+        self._folders.setdefault(user_id, os.path.dirname(photo_path))
+        if self._photos.get(user_id) is None:
+            self._photos[user_id] = photo_path
+
+    def lookup(self, user_id):
+        """Trả về (thư mục, ảnh) của ID; phần tử là None nếu không có."""
+        folder = self._folders.get(user_id)
+        if folder is None:
+            return None, None
+        if user_id not in self._photos:
+            photo_path = None
+            try:
+                for file in sorted(os.listdir(folder)):
+                    if file.lower().endswith(PHOTO_EXTENSIONS):
+                        photo_path = os.path.join(folder, file)
+                        break
+            except OSError as e:
+                print(f"[LỖI] Lỗi khi tìm ảnh cho ID {user_id}: {e}")
+            self._photos[user_id] = photo_path
+        return folder, self._photos[user_id]
+
+class ThumbnailCache:
+    """Bộ nhớ đệm LRU các QPixmap đã thu về kích thước hiển thị, khóa theo (đường dẫn, rộng, cao)."""
+
+    def __init__(self, capacity=THUMBNAIL_CACHE_SIZE):
+        self.capacity = max(1, capacity)
+        self._items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, size):
+        """QPixmap của path vừa size (QSize, giữ tỉ lệ); QPixmap rỗng nếu ảnh không đọc được."""
+        key = (path, size.width(), size.height())
+        pixmap = self._items.get(key)
+        if pixmap is not None:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return pixmap
+
+        self.misses += 1
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        source_size = reader.size()
+        if source_size.isValid():
+            # Bộ giải mã (vd. JPEG) có thể giải mã thẳng ở kích thước nhỏ
+            reader.setScaledSize(source_size.scaled(size, Qt.KeepAspectRatio))
+        image = reader.read()
+        pixmap = QPixmap.fromImage(image) if not image.isNull() else QPixmap()
+        if pixmap.isNull():
+            return pixmap  # Không lưu ảnh lỗi để lần sau thử lại
+        self._items[key] = pixmap
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+        return pixmap
+
+    def discard(self, path):
+        for key in [key for key in self._items if key[0] == path]:
+            del self._items[key]
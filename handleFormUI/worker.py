@@ -1,56 +1,83 @@
 import cv2
 import numpy as np
+import threading
 import time
 import os
-import pickle
 from PyQt5.QtCore import QThread, pyqtSignal, QObject
 from PyQt5.QtGui import QImage
-try:
-    from mtcnn.mtcnn import MTCNN
-    from keras_facenet import FaceNet
-    MODELS_AVAILABLE = True
-except ImportError as e:
-    print(f"[LỖI] Không thể nhập MTCNN hoặc FaceNet: {e}")
-    MODELS_AVAILABLE = False
-    class MTCNN: pass
-    class FaceNet: pass
-
-from PIL import Image
-try:
-    from sklearn.metrics.pairwise import euclidean_distances
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    print("[LỖI] Không thể nhập sklearn. Vui lòng cài đặt scikit-learn.")
-    SKLEARN_AVAILABLE = False
+
+# Worker không nhập TensorFlow/MTCNN/FaceNet; các model đã tạo sẵn (xem model_loader) được truyền vào.
+from camera_stream import LatestFrameGrabber, open_capture
+from gallery import EMPTY_GALLERY, GalleryWatcher
+from face_pipeline import DETECTION_SCALE, MIN_FACE_SIZE, detect_faces_scaled, face_boxes, match_faces
+from face_tracker import AdaptiveFaceDetector, FaceTracker, TARGET_FPS
+from frame_pipeline import DropOldestQueue, FramePool, QueueClosed, StageThread, fit_size
+from perf_metrics import PerfMetrics, PrometheusFileWriter
 
 # Cấu hình
 RECOGNITION_THRESHOLD = 1.05  # Ngưỡng nhận diện khuôn mặt
-REQUIRED_FACE_SIZE = (160, 160)  # Kích thước ảnh khuôn mặt
+MATCHER_BACKEND = 'auto'  # 'exact', 'ivf' hoặc 'auto' (chọn theo kích thước gallery)
 VALID_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+TRACKING_ENABLED = True  # Theo dõi khuôn mặt để không tạo lại embedding mỗi khung hình
+RESULT_RESEND_INTERVAL = 1.0  # Gửi lại kết quả nhận diện sau số giây này
+ADAPTIVE_DETECTION = False  # Chạy MTCNN mỗi N khung hình, dời box bằng optical flow ở giữa
+PIPELINED = False  # Chạy đọc ảnh / phát hiện / nhận diện / hiển thị trên các luồng riêng
+CAMERA_SOURCES = (0, 1)  # Thử lần lượt các camera này
+LATEST_FRAME_CAPTURE = True  # Đọc camera trên luồng riêng và chỉ giữ khung mới nhất
+PIPELINE_QUEUE_SIZE = 1  # Sức chứa mỗi hàng đợi giữa các bước (bỏ khung cũ nhất khi đầy)
+PERF_METRICS_ENABLED = True  # Đo độ trễ từng bước, FPS, số khuôn mặt, kích thước lô và hàng đợi
+METRICS_EMIT_INTERVAL = 1.0  # Gửi tín hiệu metrics_updated sau mỗi số giây này
+PROMETHEUS_FILE = os.environ.get('FACE_RECOGNITION_PROM_FILE')  # File .prom cho node exporter (None = không ghi)
+DISPLAY_POOL_SIZE = 3  # Số bộ đệm khung hình hiển thị dùng lại; hết bộ đệm rảnh thì bỏ khung thay vì xếp hàng
 
 # Tín hiệu giao tiếp với giao diện
 class RecognitionSignals(QObject):
-    frame_ready = pyqtSignal(QImage)  # Gửi khung hình
+    frame_ready = pyqtSignal(QImage)  # Khung hình đã ở kích thước hiển thị (bản sao riêng, chỉ gửi khi có nơi nhận)
+    display_frame = pyqtSignal(QImage, int)  # Như frame_ready nhưng trỏ vào bộ đệm slot, trả lại bằng release_frame
     recognition_result = pyqtSignal(np.ndarray, str, str)  # Kết quả nhận diện
     no_recognition = pyqtSignal()  # Không nhận diện được
     error = pyqtSignal(str)  # Lỗi
     embeddings_loaded = pyqtSignal(int)  # Số lượng embedding đã tải
+    metrics_updated = pyqtSignal(dict)  # Số liệu hiệu năng (PerfMetrics.snapshot)
 
 # Luồng xử lý nhận diện khuôn mặt
 class RecognitionWorker(QThread):
-    def __init__(self, detector: MTCNN, embedder: FaceNet, embedding_filepath: str, parent=None):
+    def __init__(self, detector, embedder, embedding_filepath: str, parent=None,
+                 matcher_backend: str = MATCHER_BACKEND, tracking: bool = TRACKING_ENABLED,
+                 adaptive_detection: bool = ADAPTIVE_DETECTION, target_fps: float = TARGET_FPS,
+                 detection_scale: float = DETECTION_SCALE, min_face_size: int = MIN_FACE_SIZE,
+                 pipelined: bool = PIPELINED, latest_frame: bool = LATEST_FRAME_CAPTURE,
+                 perf_metrics: bool = PERF_METRICS_ENABLED, metrics_file: str = PROMETHEUS_FILE):
         super().__init__(parent)
+        self.metrics = PerfMetrics(perf_metrics)
+        self.metrics_file = metrics_file if perf_metrics else None
+        self._last_metrics_emit = 0.0
+        self.pipelined = pipelined
+        self.latest_frame = latest_frame
+        self._pipeline_queues = []
+        self._latest_results = []
+        self._latest_frame = None  # Khung BGR mới nhất từ camera, xem latest_frame()
+        self._frame_lock = threading.Lock()  # Giữ khi latest_frame() sao chép và khi thay _latest_frame
+        self._display_size = None  # (rộng, cao) của vùng hiển thị, xem set_display_size()
+        self.frame_pool = FramePool(DISPLAY_POOL_SIZE)
+        self.detection_scale = detection_scale
+        self.min_face_size = min_face_size
+        self.matcher_backend = matcher_backend
+        self.gallery = EMPTY_GALLERY  # GallerySnapshot hiện tại, chỉ được thay bằng một phép gán
+        self.gallery_watcher = None
+        self._tracker_gallery_version = None
+        self.tracker = FaceTracker() if tracking else None
+        self.adaptive_detector = AdaptiveFaceDetector(self._detect_boxes, target_fps) if adaptive_detection else None
+        self._tracks_stale = False
 
         # Kiểm tra thư viện cần thiết
-        if not MODELS_AVAILABLE or not SKLEARN_AVAILABLE:
+        if detector is None or embedder is None:
             self.signals = RecognitionSignals()
             self.running = False
-            print("[LỖI] Thiếu thư viện MTCNN/FaceNet hoặc scikit-learn.")
+            print("[LỖI] Chưa có model MTCNN/FaceNet.")
             self.detector = None
             self.embedder = None
             self.embedding_file = None
-            self.known_people = []
-            self.known_embeddings = np.array([])
             self._prevent_run = True
             return
         else:
@@ -61,53 +88,215 @@ class RecognitionWorker(QThread):
         self.embedding_file = embedding_filepath
         self.signals = RecognitionSignals()
         self.running = False
-        self.known_people = []
-        self.known_embeddings = np.array([])
-        self._load_embeddings()  # Tải dữ liệu embedding khi khởi tạo
-
-    def _load_embeddings(self):
-        """Tải dữ liệu embedding từ file."""
         if not self.embedding_file or not isinstance(self.embedding_file, str):
             print("[LỖI] Đường dẫn file embedding không hợp lệ.")
-            self.known_people = []
-            self.known_embeddings = np.array([])
             self.signals.embeddings_loaded.emit(0)
             return
 
-        try:
-            if os.path.exists(self.embedding_file) and os.path.getsize(self.embedding_file) > 0:
-                with open(self.embedding_file, 'rb') as file:
-                    data = pickle.load(file)
-
-                if isinstance(data, list):
-                    valid_data = [
-                        item for item in data
-                        if isinstance(item, dict) and 'id' in item and 'name' in item and 'embedding' in item
-                        and isinstance(item['embedding'], np.ndarray)
-                    ]
-                    self.known_people = valid_data
-                    self.known_embeddings = np.array([person['embedding'] for person in valid_data]) if valid_data else np.array([])
-                else:
-                    print("[LỖI] File embedding không đúng định dạng.")
-                    self.known_people = []
-                    self.known_embeddings = np.array([])
+        # Tải gallery lần đầu ngay (store được memmap nên gần như tức thì); các lần sau do luồng
+        # theo dõi trong run() tải lại ở nền khi file store thay đổi
+        self.gallery_watcher = GalleryWatcher(self.embedding_file, self.matcher_backend, RECOGNITION_THRESHOLD,
+                                              on_update=self._on_gallery_update)
+        self.gallery_watcher.refresh()
+
+    def _on_gallery_update(self, snapshot, count):
+        """Gọi từ GalleryWatcher khi đã có bản gallery mới (hoặc tải lỗi, count = -1)."""
+        if count == 0:
+            print("[CẢNH BÁO] Không tìm thấy file embedding.")
+        self.gallery = snapshot
+        self.signals.embeddings_loaded.emit(count)
+
+    @property
+    def known_people(self):
+        return self.gallery.store
+
+    @property
+    def matcher(self):
+        return self.gallery.matcher
+
+    def _detect_boxes(self, frame_rgb):
+        """Chạy bộ phát hiện (trên bản thu nhỏ nếu detection_scale < 1) và trả về box (x1, y1, x2, y2)."""
+        faces = detect_faces_scaled(self.detector, frame_rgb, self.detection_scale, self.min_face_size)
+        return face_boxes(frame_rgb, faces)
+
+    def _detect(self, frame_rgb):
+        """Bước phát hiện: trả về box (x1, y1, x2, y2), dùng chế độ phát hiện thưa nếu được bật."""
+        with self.metrics.time('detect'):
+            if self.adaptive_detector is not None:
+                boxes, _ = self.adaptive_detector.boxes(frame_rgb)
+                return boxes
+            return self._detect_boxes(frame_rgb)
+
+    def _identify(self, frame_rgb, boxes, gallery):
+        """Bước nhận diện: gán danh tính cho các box bằng một bản gallery cố định trong suốt khung hình.
+
+        Trả về danh sách {'box', 'person', 'distance', 'track_id'}; person là None nếu không nhận diện được.
+        Khi bật theo dõi, chỉ các track mới hoặc đến hạn mới được tạo lại embedding.
+        """
+        if self.tracker is None:
+            # Tạo embedding cho mọi khuôn mặt bằng một lần gọi và so khớp cả lô
+            # (chỉ số -1 nếu vượt ngưỡng nhận diện)
+            distances, indices = match_faces(frame_rgb, boxes, self.embedder, gallery.matcher, self.metrics)
+            return [
+                {'box': box, 'person': gallery.person(idx), 'distance': distance, 'track_id': None}
+                for box, idx, distance in zip(boxes, indices, distances)
+            ]
+
+        # Danh tính lưu trong các track thuộc về bản gallery cũ, xóa khi gallery đổi phiên bản
+        if self._tracks_stale or gallery.version != self._tracker_gallery_version:
+            self.tracker.reset()
+            self._tracks_stale = False
+            self._tracker_gallery_version = gallery.version
+        tracks = self.tracker.update(boxes)
+        pending = [i for i, track in enumerate(tracks) if self.tracker.needs_embedding(track)]
+        distances, indices = match_faces(frame_rgb, [boxes[i] for i in pending], self.embedder, gallery.matcher, self.metrics)
+        for i, idx, distance in zip(pending, indices, distances):
+            self.tracker.set_identity(tracks[i], gallery.person(idx), distance)
+
+        return [
+            {'box': box, 'person': track.person, 'distance': track.distance, 'track_id': track.track_id}
+            for box, track in zip(boxes, tracks)
+        ]
+
+    def _can_recognize(self, gallery):
+        return gallery.ready and self.detector and self.embedder
+
+    @staticmethod
+    def _draw_results(frame_rgb, results, scale=1.0):
+        """Vẽ khung và tên lên ảnh RGB đã thu nhỏ theo scale (box tính theo khung hình gốc)."""
+        for result in results:
+            x1, y1, x2, y2 = (int(round(value * scale)) for value in result['box'])
+            color = (255, 0, 0)
+            text = "Unknown"
+            if result['person'] is not None:
+                color = (0, 255, 0)
+                text = result['person']['name']
+
+            cv2.rectangle(frame_rgb, (x1, y1), (x2, y2), color, 2)
+            text_y = y1 - 10 if y1 > 20 else y1 + 15
+            cv2.putText(frame_rgb, text, (x1, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+
+    def _emit_recognition(self, frame_bgr, results):
+        """Gửi tín hiệu nhận diện: khi đổi người, đổi track hoặc sau RESULT_RESEND_INTERVAL giây."""
+        best = None
+        for result in results:
+            if result['person'] is not None and (best is None or result['distance'] < best['distance']):
+                best = result
+
+        now = time.time()
+        if best is not None:
+            person = best['person']
+            if (person['id'] != self._last_sent_id or best['track_id'] != self._last_sent_track
+                    or (now - self._last_recognition_time) > RESULT_RESEND_INTERVAL):
+                x1, y1, x2, y2 = best['box']
+                self.signals.recognition_result.emit(frame_bgr[y1:y2, x1:x2].copy(), person['name'], person['id'])
+                self._last_recognition_time = now
+                self._last_sent_id = person['id']
+                self._last_sent_track = best['track_id']
+        elif self._last_sent_id is not None or (now - self._last_recognition_time) > RESULT_RESEND_INTERVAL:
+            self.signals.no_recognition.emit()
+            self._last_recognition_time = now
+            self._last_sent_id = None
+            self._last_sent_track = None
+
+    def _emit_frame(self, frame, results, bgr=False):
+        """Thu khung hình về kích thước hiển thị vào một bộ đệm của frame_pool, vẽ kết quả rồi gửi cho giao diện.
+
+        Chỉ một lần resize (kết hợp với sao chép vào bộ đệm) và không cấp phát mảng mới mỗi khung. QImage của
+        display_frame trỏ thẳng vào bộ đệm nên nơi nhận phải gọi release_frame(slot) sau khi đã chuyển sang
+        QPixmap; frame_ready nhận một bản sao riêng (chỉ tạo khi tín hiệu có nơi nhận).
+        """
+        signals = self.signals
+        pooled = signals.receivers(signals.display_frame) > 0
+        if not pooled and signals.receivers(signals.frame_ready) == 0:
+            return
+        width, height = fit_size(frame.shape, self._display_size)
+        slot, buffer = self.frame_pool.acquire((height, width, 3))
+        if buffer is None:
+            # Giao diện chưa xử lý kịp các khung trước, bỏ khung này
+            self.metrics.increment('display_frames_skipped')
+            return
+        if (width, height) == (frame.shape[1], frame.shape[0]):
+            np.copyto(buffer, frame)
+        else:
+            cv2.resize(frame, (width, height), dst=buffer, interpolation=cv2.INTER_LINEAR)
+        if bgr:
+            cv2.cvtColor(buffer, cv2.COLOR_BGR2RGB, dst=buffer)
+        self._draw_results(buffer, results, width / frame.shape[1])
+        qt_image = QImage(buffer.data, width, height, 3 * width, QImage.Format_RGB888)
+        if signals.receivers(signals.frame_ready) > 0:
+            signals.frame_ready.emit(qt_image.copy())
+        if pooled:
+            signals.display_frame.emit(qt_image, slot)
+        else:
+            self.frame_pool.release(slot)
 
-            else:
-                print("[CẢNH BÁO] Không tìm thấy file embedding.")
-                self.known_people = []
-                self.known_embeddings = np.array([])
+    def set_display_size(self, width, height):
+        """Kích thước vùng hiển thị (vd. labelCamera); khung hình được thu về vừa kích thước này, giữ tỉ lệ."""
+        self._display_size = (int(width), int(height))
+
+    def release_frame(self, slot):
+        """Trả bộ đệm của khung hình display_frame đã hiển thị về frame_pool (gọi từ giao diện)."""
+        self.frame_pool.release(slot)
+
+    def _publish_metrics(self, cap, queues=()):
+        """Cập nhật độ dài hàng đợi và gửi metrics_updated, tối đa một lần mỗi METRICS_EMIT_INTERVAL giây."""
+        if not self.metrics.enabled:
+            return
+        now = time.time()
+        if now - self._last_metrics_emit < METRICS_EMIT_INTERVAL:
+            return
+        self._last_metrics_emit = now
+        for name, queue in queues:
+            self.metrics.set_gauge('queue_depth', queue.qsize(), name)
+            self.metrics.set_gauge('queue_dropped', queue.dropped, name)
+        if isinstance(cap, LatestFrameGrabber):
+            self.metrics.set_gauge('capture_dropped_frames', cap.dropped_frames)
+        self.metrics.set_gauge('display_buffer_allocations', self.frame_pool.allocations)
+        self.metrics.set_gauge('display_buffer_exhausted', self.frame_pool.exhausted)
+        self.signals.metrics_updated.emit(self.metrics.snapshot())
+
+    def _open_camera(self):
+        """Mở camera đầu tiên dùng được trong CAMERA_SOURCES. Trả về None và gửi tín hiệu lỗi nếu thất bại.
+
+        Khi bật latest_frame, camera được bọc trong LatestFrameGrabber để luôn xử lý khung mới nhất.
+        """
+        cap = None
+        try:
+            for source in CAMERA_SOURCES:
+                cap = open_capture(source, 640, 480)
+                if cap.isOpened():
+                    break
+                cap.release()
+                cap = None
+            if cap is None:
+                raise IOError("Không thể mở camera.")
 
-            self.signals.embeddings_loaded.emit(len(self.known_people))
+            if self.latest_frame:
+                cap = LatestFrameGrabber(cap).start()
+            return cap
 
         except Exception as e:
-            print(f"[LỖI] Không thể tải file embedding: {e}")
-            self.known_people = []
-            self.known_embeddings = np.array([])
-            self.signals.embeddings_loaded.emit(-1)
+            print(f"[LỖI] Không thể mở camera: {e}")
+            self.signals.error.emit(f"Lỗi camera: {e}")
+            if cap:
+                cap.release()
+            return None
+
+    def latest_frame(self):
+        """Bản sao khung BGR mới nhất worker đọc được (None nếu chưa có), để nơi khác dùng chung luồng camera."""
+        with self._frame_lock:
+            frame_bgr = self._latest_frame
+            return frame_bgr.copy() if frame_bgr is not None else None
 
     def reload_embeddings(self):
-        """Tải lại dữ liệu embedding."""
-        self._load_embeddings()
+        """Yêu cầu kiểm tra lại file embedding ngay; bản mới được tải ở nền, nhận diện không bị dừng."""
+        if self.gallery_watcher is None:
+            return
+        if self.isRunning():
+            self.gallery_watcher.request_refresh()
+        else:
+            self.gallery_watcher.refresh()
 
     def run(self):
         """Xử lý camera và nhận diện khuôn mặt."""
@@ -116,103 +305,78 @@ class RecognitionWorker(QThread):
             return
 
         self.running = True
-        cap = None
-        try:
-            cap = cv2.VideoCapture(0)
-            if not cap.isOpened():
-                cap = cv2.VideoCapture(1)
-                if not cap.isOpened():
-                    raise IOError("Không thể mở camera.")
-
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-        except Exception as e:
-            print(f"[LỖI] Không thể mở camera: {e}")
-            self.signals.error.emit(f"Lỗi camera: {e}")
+        cap = self._open_camera()
+        if cap is None:
             self.running = False
-            if cap:
-                cap.release()
             return
 
-        last_recognition_time = time.time()
-        last_sent_id = None
+        self._last_recognition_time = time.time()
+        self._last_sent_id = None
+        self._last_sent_track = None
+        self._tracks_stale = True
+        if self.adaptive_detector is not None:
+            self.adaptive_detector.reset()
+        metrics_writer = None
+        if self.metrics_file:
+            metrics_writer = PrometheusFileWriter(self.metrics, self.metrics_file)
+            metrics_writer.start()
+        if self.gallery_watcher is not None:
+            self.gallery_watcher.refresh()  # File có thể đã đổi trong lúc worker dừng
+            self.gallery_watcher.start()
 
+        try:
+            if self.pipelined:
+                self._run_pipelined(cap)
+            else:
+                self._run_serial(cap)
+        finally:
+            # Giải phóng camera
+            cap.release()
+            with self._frame_lock:
+                self._latest_frame = None
+            if self.gallery_watcher is not None:
+                self.gallery_watcher.stop()
+            if metrics_writer is not None:
+                metrics_writer.stop()
+
+    def _run_serial(self, cap):
+        """Đọc, nhận diện, vẽ và gửi khung hình tuần tự trong luồng này.
+
+        Khung được đọc luân phiên vào hai bộ đệm (read(out)) thay vì cấp phát mỗi khung: bộ đệm đang là
+        _latest_frame không bị ghi, nên latest_frame() sao chép an toàn từ luồng khác.
+        """
+        spare = None
         while self.running:
             try:
-                ret, frame_bgr = cap.read()
+                ret, frame_bgr = cap.read(spare) if spare is not None else cap.read()
                 if not ret:
                     time.sleep(0.05)
                     continue
-
-                frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-                processed_frame = frame_bgr.copy()
-                found_person = False
-                best_match = None
-                min_distance = float('inf')
-
-                # Nhận diện nếu có dữ liệu embedding
-                if self.known_embeddings.size > 0 and self.detector and self.embedder:
-                    faces = self.detector.detect_faces(frame_rgb)
-                    for face in faces:
-                        x1, y1, width, height = face['box']
-                        x1, y1 = max(0, x1), max(0, y1)
-                        x2 = min(frame_rgb.shape[1], x1 + width)
-                        y2 = min(frame_rgb.shape[0], y1 + height)
-
-                        if x2 <= x1 or y2 <= y1:
-                            continue
-
-                        face_pixels = frame_rgb[y1:y2, x1:x2]
-                        if face_pixels.size == 0:
-                            continue
-
-                        # Tạo embedding từ khuôn mặt
-                        face_image = Image.fromarray(face_pixels).resize(REQUIRED_FACE_SIZE)
-                        face_array = np.asarray(face_image)
-                        samples = np.expand_dims(face_array, axis=0)
-                        live_embedding = self.embedder.embeddings(samples)[0]
-
-                        # Tìm người khớp nhất
-                        distances = euclidean_distances([live_embedding], self.known_embeddings)[0]
-                        min_distance_idx = np.argmin(distances)
-                        distance = distances[min_distance_idx]
-
-                        color = (0, 0, 255)
-                        text = "Unknown"
-
-                        if distance < RECOGNITION_THRESHOLD:
-                            color = (0, 255, 0)
-                            person = self.known_people[min_distance_idx]
-                            text = person['name']
-                            if distance < min_distance:
-                                min_distance = distance
-                                best_match = (frame_bgr[y1:y2, x1:x2].copy(), person['name'], person['id'])
-                                found_person = True
-
-                        # Vẽ khung và tên lên ảnh
-                        cv2.rectangle(processed_frame, (x1, y1), (x2, y2), color, 2)
-                        text_y = y1 - 10 if y1 > 20 else y1 + 15
-                        cv2.putText(processed_frame, text, (x1, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
-
-                # Gửi tín hiệu nhận diện
-                now = time.time()
-                if best_match:
-                    face_crop, name, id_ = best_match
-                    if id_ != last_sent_id or (now - last_recognition_time) > 1.0:
-                        self.signals.recognition_result.emit(face_crop, name, id_)
-                        last_recognition_time = now
-                        last_sent_id = id_
-                elif not found_person and (last_sent_id is not None or (now - last_recognition_time) > 1.0):
-                    self.signals.no_recognition.emit()
-                    last_recognition_time = now
-                    last_sent_id = None
-
-                # Gửi khung hình cho giao diện
-                processed_rgb = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = processed_rgb.shape
-                qt_image = QImage(processed_rgb.data, w, h, ch * w, QImage.Format_RGB888)
-                self.signals.frame_ready.emit(qt_image.copy())
+                frame_start = time.time()
+                with self._frame_lock:
+                    spare, self._latest_frame = self._latest_frame, frame_bgr
+
+                with self.metrics.time('convert'):
+                    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+                results = []
+
+                # Nhận diện nếu có dữ liệu embedding; đọc tham chiếu gallery một lần cho cả khung hình
+                gallery = self.gallery
+                if self._can_recognize(gallery):
+                    boxes = self._detect(frame_rgb)
+                    with self.metrics.time('identify'):
+                        results = self._identify(frame_rgb, boxes, gallery)
+
+                with self.metrics.time('render'):
+                    # Nhận diện đã xong với frame_rgb, khung hiển thị được tạo từ chính ảnh RGB này
+                    self._emit_recognition(frame_bgr, results)
+                    self._emit_frame(frame_rgb, results)
+
+                if self.adaptive_detector is not None:
+                    self.adaptive_detector.record(time.time() - frame_start)
+                self.metrics.observe('stage_seconds', time.time() - frame_start, 'frame')
+                self.metrics.frame(len(results))
+                self._publish_metrics(cap)
 
                 time.sleep(0.01)
 
@@ -221,10 +385,91 @@ class RecognitionWorker(QThread):
                 self.signals.error.emit(f"Lỗi xử lý: {e}")
                 time.sleep(0.5)
 
-        # Giải phóng camera
-        if cap and cap.isOpened():
-            cap.release()
+    def _run_pipelined(self, cap):
+        """Chạy các bước đọc ảnh, phát hiện, nhận diện và hiển thị trên các luồng riêng.
+
+        Các bước nối với nhau bằng hàng đợi có giới hạn bỏ phần tử cũ nhất, nên việc đọc camera không
+        bao giờ chờ suy luận và khung hình hiển thị luôn là khung mới nhất; lớp vẽ dùng kết quả nhận
+        diện gần nhất. Luồng này đảm nhận bước hiển thị.
+        """
+        display_queue = DropOldestQueue(PIPELINE_QUEUE_SIZE)
+        detect_queue = DropOldestQueue(PIPELINE_QUEUE_SIZE)
+        identify_queue = DropOldestQueue(PIPELINE_QUEUE_SIZE)
+        self._pipeline_queues = [display_queue, detect_queue, identify_queue]
+        queue_names = (('display', display_queue), ('detect', detect_queue), ('identify', identify_queue))
+        self._latest_results = []
+
+        def capture_loop():
+            while self.running:
+                # Khung còn nằm trong hàng đợi của các bước sau nên mỗi lần đọc cần mảng mới
+                ret, frame_bgr = cap.read()
+                if not ret:
+                    time.sleep(0.05)
+                    continue
+                with self._frame_lock:
+                    self._latest_frame = frame_bgr
+                display_queue.put(frame_bgr)
+                detect_queue.put(frame_bgr)
+
+        def detect_step(frame_bgr):
+            gallery = self.gallery
+            if not self._can_recognize(gallery):
+                self._latest_results = []
+                return None
+            started = time.time()
+            with self.metrics.time('convert'):
+                frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+            return frame_bgr, frame_rgb, self._detect(frame_rgb), gallery, started
+
+        def identify_step(item):
+            frame_bgr, frame_rgb, boxes, gallery, started = item
+            with self.metrics.time('identify'):
+                results = self._identify(frame_rgb, boxes, gallery)
+            self._latest_results = results
+            self.metrics.observe('faces_per_frame', len(results))
+            self.metrics.observe('stage_seconds', time.time() - started, 'frame')
+            self._emit_recognition(frame_bgr, results)
+            if self.adaptive_detector is not None:
+                self.adaptive_detector.record(time.time() - started)
+
+        def on_error(stage, e):
+            print(f"[LỖI] Lỗi trong bước {stage}: {e}")
+            self.signals.error.emit(f"Lỗi xử lý: {e}")
+            time.sleep(0.5)
+
+        threads = [
+            threading.Thread(target=capture_loop, name="capture", daemon=True),
+            StageThread("detect", detect_step, detect_queue, identify_queue, on_error),
+            StageThread("identify", identify_step, identify_queue, on_error=on_error),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while self.running:
+                try:
+                    frame_bgr = display_queue.get(timeout=0.1)
+                except QueueClosed:
+                    break
+                if frame_bgr is None:
+                    continue
+                try:
+                    with self.metrics.time('render'):
+                        self._emit_frame(frame_bgr, self._latest_results, bgr=True)
+                    self.metrics.frame()
+                    self._publish_metrics(cap, queue_names)
+                except Exception as e:
+                    on_error("render", e)
+        finally:
+            self.running = False
+            for queue in self._pipeline_queues:
+                queue.close()
+            for thread in threads:
+                thread.join(timeout=2.0)
+            self._pipeline_queues = []
 
     def stop(self):
-        """Dừng luồng xử lý."""
-        self.running = False
\ No newline at end of file
+        """Dừng luồng xử lý (và các luồng của pipeline nếu có)."""
+        self.running = False
+        for queue in self._pipeline_queues:
+            queue.close()
@@ -1,25 +1,41 @@
+import argparse
 import cv2
 import numpy as np
 import os
-import pickle
 import time
 import traceback  
-from mtcnn.mtcnn import MTCNN
-from keras_facenet import FaceNet
-from sklearn.metrics.pairwise import euclidean_distances
-from PIL import Image
+from camera_stream import LatestFrameGrabber, open_capture
+from embedding_store import load_gallery
+from face_matcher import create_matcher
+from face_pipeline import DETECTION_SCALE, MIN_FACE_SIZE, detect_faces_scaled, match_faces
+from face_tracker import AdaptiveFaceDetector, TARGET_FPS
+from model_registry import get_detector, get_embedder
 
 # --- Hằng số ---
 EMBEDDING_FOLDER = "EmbeddingPicture"
-EMBEDDING_FILENAME = "Embeddings_Facenet.p"
+EMBEDDING_FILENAME = "Embeddings_Facenet.emb"
 EMBEDDING_FILEPATH = os.path.join(EMBEDDING_FOLDER, EMBEDDING_FILENAME)
 RECOGNITION_THRESHOLD = 1.05  
-REQUIRED_FACE_SIZE = (160, 160)
+MATCHER_BACKEND = 'auto'  # 'exact', 'ivf' hoặc 'auto' (chọn theo kích thước gallery)
+ADAPTIVE_DETECTION = False  # Chạy MTCNN mỗi N khung hình, dời box bằng optical flow ở giữa
+LATEST_FRAME_CAPTURE = True  # Đọc camera trên luồng riêng và chỉ giữ khung mới nhất
+
+parser = argparse.ArgumentParser(description="Nhận diện khuôn mặt qua webcam (FaceNet + MTCNN).")
+parser.add_argument("--adaptive-detection", action="store_true", default=ADAPTIVE_DETECTION,
+                    help="Chỉ chạy MTCNN mỗi N khung hình, N tự điều chỉnh theo FPS mục tiêu.")
+parser.add_argument("--target-fps", type=float, default=TARGET_FPS, help="FPS mục tiêu cho chế độ phát hiện thưa.")
+parser.add_argument("--detection-scale", type=float, default=DETECTION_SCALE,
+                    help="Thu nhỏ khung hình theo tỉ lệ này trước khi chạy MTCNN (vd. 0.5).")
+parser.add_argument("--min-face-size", type=int, default=MIN_FACE_SIZE,
+                    help="Kích thước khuôn mặt nhỏ nhất cần phát hiện, tính theo pixel của khung hình gốc.")
+parser.add_argument("--buffered-capture", dest="latest_frame", action="store_false", default=LATEST_FRAME_CAPTURE,
+                    help="Đọc tuần tự từ bộ đệm camera thay vì chỉ lấy khung mới nhất.")
+args = parser.parse_args()
 
 print("Khởi tạo mô hình...")
 try:
-    detector = MTCNN()
-    embedder = FaceNet()
+    detector = get_detector()
+    embedder = get_embedder()
     print("Mô hình đã sẵn sàng.")
 except Exception as e:
     print(f"[LỖI] Không thể khởi tạo MTCNN hoặc FaceNet: {e}")
@@ -30,29 +46,16 @@ known_people_data = []  # Danh sách chứa thông tin người đã biết
 known_embeddings_np = np.array([])
 print(f"Đang tải dữ liệu embeddings từ {EMBEDDING_FILEPATH}...")
 try:
-    if os.path.exists(EMBEDDING_FILEPATH):
-        with open(EMBEDDING_FILEPATH, 'rb') as file:
-            loaded_data = pickle.load(file)
-            # Kiểm tra định dạng dữ liệu
-            if isinstance(loaded_data, list):
-                if all(isinstance(item, dict) and 'id' in item and 'name' in item and 'embedding' in item for item in loaded_data):
-                    known_people_data = loaded_data
-                    if known_people_data:  # Nếu danh sách không rỗng
-                        known_embeddings_np = np.array([person['embedding'] for person in known_people_data])
-                        print(f"Đã tải thành công {len(known_people_data)} embeddings.")
-                    else:
-                        print("  - Cảnh báo: File embeddings rỗng (chứa danh sách trống).")
-                elif not loaded_data:
-                    print("  - Cảnh báo: File embeddings rỗng.")
-                else:
-                    print("  - Lỗi: File embeddings không đúng định dạng (phải là danh sách các từ điển chứa 'id', 'name', 'embedding').")
-                    known_people_data = []  
-            else:
-                print("  - Lỗi: File embeddings không chứa danh sách.")
-                known_people_data = []  
+    # Store được memmap; known_people_data[i] trả về {'id', 'name', 'embedding'} như trước
+    store = load_gallery(EMBEDDING_FILEPATH)
+    if len(store) > 0:
+        known_people_data = store
+        known_embeddings_np = store.embeddings
+        print(f"Đã tải thành công {len(known_people_data)} embeddings.")
     else:
-        print(f"  - Lỗi: Không tìm thấy file embeddings tại {EMBEDDING_FILEPATH}.")
-
+        print("  - Cảnh báo: File embeddings rỗng.")
+except FileNotFoundError:
+    print(f"  - Lỗi: Không tìm thấy file embeddings tại {EMBEDDING_FILEPATH}.")
 except Exception as e:
     print(f"[LỖI] Không thể tải hoặc phân tích file embeddings: {e}")
     known_people_data = []  # Đặt lại nếu lỗi
@@ -61,14 +64,32 @@ if not known_people_data:
     print("Không có dữ liệu nhận diện hợp lệ. Không thể tiếp tục nhận diện.")
     exit() 
 
+matcher = create_matcher(known_embeddings_np, MATCHER_BACKEND, RECOGNITION_THRESHOLD)
+
+def detect_boxes(frame_rgb):
+    """Phát hiện khuôn mặt và trả về box (x1, y1, x2, y2)."""
+    boxes = []
+    for face in detect_faces_scaled(detector, frame_rgb, args.detection_scale, args.min_face_size):
+        # Trích xuất khuôn mặt
+        x1, y1, width, height = face['box']
+        x1, y1 = abs(x1), abs(y1)  
+        x2, y2 = x1 + width, y1 + height
+
+        if frame_rgb[y1:y2, x1:x2].size == 0:
+            continue  # Bỏ qua khuôn mặt này nếu không có dữ liệu
+        boxes.append((x1, y1, x2, y2))
+    return boxes
+
+adaptive_detector = AdaptiveFaceDetector(detect_boxes, args.target_fps) if args.adaptive_detection else None
+
 # --- Mở webcam ---
 print("Đang mở webcam...")
-cam = cv2.VideoCapture(0)
+cam = open_capture(0, 640, 480)
 if not cam.isOpened():
     print("[LỖI] Không thể mở webcam.")
     exit()
-cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+if args.latest_frame:
+    cam = LatestFrameGrabber(cam).start()
 frame_width = int(cam.get(cv2.CAP_PROP_FRAME_WIDTH))
 frame_height = int(cam.get(cv2.CAP_PROP_FRAME_HEIGHT))
 print(f"Webcam đã mở thành công: {frame_width}x{frame_height}")
@@ -79,65 +100,54 @@ else:
     print("\nChỉ hiển thị camera (Không có dữ liệu nhận diện)...")
 
 # --- Vòng lặp chính để nhận diện ---
+frame_buffer = None  # Khung được đọc vào cùng một bộ đệm, không cấp phát mỗi khung
 while True:
-    ret, frame_bgr = cam.read()
+    ret, frame_bgr = cam.read(frame_buffer) if frame_buffer is not None else cam.read()
     if not ret:
         print("[LỖI] Không thể đọc khung hình từ webcam.")
         time.sleep(0.1)  
         continue
+    frame_buffer = frame_bgr
+    frame_start = time.time()
 
     frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
     processed_frame = frame_bgr.copy()  
 
     if known_people_data:
         try:
-            faces = detector.detect_faces(frame_rgb)
-
-            for face in faces:
-                # Trích xuất khuôn mặt
-                x1, y1, width, height = face['box']
-                x1, y1 = abs(x1), abs(y1)  
-                x2, y2 = x1 + width, y1 + height
-
-                face_pixels = frame_rgb[y1:y2, x1:x2]
-
-                if face_pixels.size == 0:
-                    continue  # Bỏ qua khuôn mặt này nếu không có dữ liệu
-
-                try:
-                    # Resize và chuẩn bị để tạo embedding
-                    face_image = Image.fromarray(face_pixels).resize(REQUIRED_FACE_SIZE)
-                    face_array = np.asarray(face_image)
-                    samples = np.expand_dims(face_array, axis=0)  
-
-                    # Tạo embedding cho khuôn mặt
-                    live_embedding = embedder.embeddings(samples)[0]
-
-                    # So sánh với embeddings đã biết
-                    distances = euclidean_distances([live_embedding], known_embeddings_np)[0]
-                    min_distance_index = np.argmin(distances)
-                    min_distance = distances[min_distance_index]
-
-                    # Nhận diện người
-                    if min_distance < RECOGNITION_THRESHOLD:
-                        person_info = known_people_data[min_distance_index]
-                        rec_id = person_info['id']
-                        rec_name = person_info['name']
-                        display_text = f"{rec_name} ({rec_id})"
-                        color = (0, 255, 0)  # Màu xanh lá
-                    else:
-                        display_text = "Unknow"
-                        color = (0, 255, 255)  # Màu vàng
-
-                    # Vẽ khung và hiển thị thông tin
-                    cv2.rectangle(processed_frame, (x1, y1), (x2, y2), color, 2)
-                    text_y = y1 - 10 if y1 > 20 else y1 + 15  
-                    cv2.putText(processed_frame, display_text, (x1, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                    cv2.putText(processed_frame, f"d:{min_distance:.2f}", (x2 - 60, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-
-                except Exception as face_proc_e:
-                    print(f"[Cảnh báo] Lỗi khi xử lý khuôn mặt: {face_proc_e}")
+            if adaptive_detector is not None:
+                boxes, _ = adaptive_detector.boxes(frame_rgb)
+            else:
+                boxes = detect_boxes(frame_rgb)
+
+            try:
+                # Tạo embedding cho mọi khuôn mặt bằng một lần gọi và so khớp cả lô
+                # (chỉ số -1 nếu vượt ngưỡng nhận diện)
+                distances, indices = match_faces(frame_rgb, boxes, embedder, matcher)
+            except Exception as face_proc_e:
+                print(f"[Cảnh báo] Lỗi khi xử lý khuôn mặt: {face_proc_e}")
+                for x1, y1, x2, y2 in boxes:
                     cv2.rectangle(processed_frame, (x1, y1), (x2, y2), (0, 0, 255), 1)
+                boxes = []
+                distances, indices = [], []
+
+            for (x1, y1, x2, y2), min_distance_index, min_distance in zip(boxes, indices, distances):
+                # Nhận diện người
+                if min_distance_index >= 0:
+                    person_info = known_people_data[min_distance_index]
+                    rec_id = person_info['id']
+                    rec_name = person_info['name']
+                    display_text = f"{rec_name} ({rec_id})"
+                    color = (0, 255, 0)  # Màu xanh lá
+                else:
+                    display_text = "Unknow"
+                    color = (0, 255, 255)  # Màu vàng
+
+                # Vẽ khung và hiển thị thông tin
+                cv2.rectangle(processed_frame, (x1, y1), (x2, y2), color, 2)
+                text_y = y1 - 10 if y1 > 20 else y1 + 15  
+                cv2.putText(processed_frame, display_text, (x1, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+                cv2.putText(processed_frame, f"d:{min_distance:.2f}", (x2 - 60, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
 
         except Exception as loop_e:
             print(f"[LỖI] Lỗi trong vòng lặp nhận diện: {loop_e}")
@@ -146,6 +156,8 @@ while True:
 
     # --- Hiển thị khung hình kết quả ---
     cv2.imshow("Nhan dien khuon mat", processed_frame)
+    if adaptive_detector is not None:
+        adaptive_detector.record(time.time() - frame_start)
 
 
     key = cv2.waitKey(1) & 0xFF
@@ -153,6 +165,8 @@ while True:
         print("\nĐã nhấn ESC, thoát...")
         break
 
+if args.latest_frame:
+    print(f"Số khung hình bị bỏ qua để giữ độ trễ thấp: {cam.dropped_frames}")
 print("Đang giải phóng webcam và đóng cửa sổ...")
 cam.release()
 cv2.destroyAllWindows()
@@ -0,0 +1,94 @@
+import os
+import threading
+import weakref
+
+# Nơi duy nhất tạo MTCNN/FaceNet trong một tiến trình: mọi entry point (giao diện, main_facenet,
+# CodeGenerator, dịch vụ HTTP...) lấy model qua get_detector()/get_embedder() nên mỗi cấu hình
+# chỉ được tải một lần. Thư viện nặng (TensorFlow) chỉ được nhập khi model được yêu cầu lần đầu.
+# MTCNN và model Keras không an toàn khi nhiều luồng cùng gọi; mọi lần gọi model dùng chung giữ
+# model_lock(model) (face_pipeline, enrollment, CodeGenerator đã làm sẵn).
+DEFAULT_DETECTOR = os.environ.get('FACE_DETECTOR_BACKEND', 'mtcnn')  # Xem detector_backends
+DEFAULT_EMBEDDER = os.environ.get('FACE_EMBEDDER_BACKEND', 'keras')  # Xem embedder_backends
+
+def _create_mtcnn(**options):
+    from mtcnn.mtcnn import MTCNN
+    return MTCNN(**options)
+
+def _embedder_factory(name):
+    def create(**options):
+        import embedder_backends
+        return getattr(embedder_backends, name)(**options)
+    return create
+
+def _detector_factory(name):
+    def create(**options):
+        import detector_backends
+        return getattr(detector_backends, name)(**options)
+    return create
+
+DETECTOR_FACTORIES = {
+    'mtcnn': _create_mtcnn,
+    'yunet': _detector_factory('YuNetDetector'),
+    'ssd': _detector_factory('SSDDetector'),
+    'haar': _detector_factory('HaarDetector'),
+}
+EMBEDDER_FACTORIES = {
+    'keras': _embedder_factory('create_keras_embedder'),
+    'graph': _embedder_factory('create_graph_embedder'),
+    'tflite-fp16': _embedder_factory('create_tflite_fp16_embedder'),
+    'tflite-int8': _embedder_factory('create_tflite_int8_embedder'),
+}
+
+_instances = {}  # (loại, backend, tùy chọn) -> model
+_key_locks = {}  # Khóa riêng cho từng khóa để tải model khác nhau song song
+_registry_lock = threading.Lock()
+_model_locks = weakref.WeakKeyDictionary()  # model -> khóa gọi model, mất theo model
+
+def _config_key(kind, backend, options):
+    return kind, backend, tuple(sorted(options.items()))
+
+def _get(kind, factories, backend, options):
+    if backend not in factories:
+        raise ValueError(f"Backend {kind} không hợp lệ: {backend} (hỗ trợ: {', '.join(factories)})")
+    key = _config_key(kind, backend, options)
+    with _registry_lock:
+        model = _instances.get(key)
+        if model is not None:
+            return model
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Luồng đến sau chờ luồng đang tải xong rồi dùng chung model đó
+    with key_lock:
+        model = _instances.get(key)
+        if model is None:
+            model = factories[backend](**options)
+            with _registry_lock:
+                _instances[key] = model
+    return model
+
+def get_detector(backend=DEFAULT_DETECTOR, **options):
+    """Trả về bộ phát hiện khuôn mặt dùng chung cho cấu hình này, tạo ở lần gọi đầu tiên."""
+    return _get('detector', DETECTOR_FACTORIES, backend, options)
+
+def get_embedder(backend=DEFAULT_EMBEDDER, **options):
+    """Trả về embedder dùng chung cho cấu hình này, tạo ở lần gọi đầu tiên."""
+    return _get('embedder', EMBEDDER_FACTORIES, backend, options)
+
+def model_lock(model):
+    """Khóa (RLock) dùng chung cho mọi lần gọi model này, dù model lấy từ registry hay tạo riêng."""
+    with _registry_lock:
+        lock = _model_locks.get(model)
+        if lock is None:
+            lock = _model_locks[model] = threading.RLock()
+        return lock
+
+def loaded_models():
+    """Danh sách khóa (loại, backend, tùy chọn) của các model đã tải."""
+    with _registry_lock:
+        return list(_instances)
+
+def clear():
+    """Bỏ tham chiếu tới mọi model đã tải (bộ nhớ được giải phóng khi không còn nơi nào dùng)."""
+    with _registry_lock:
+        _instances.clear()
+        _key_locks.clear()
@@ -0,0 +1,184 @@
+import argparse
+import os
+import threading
+import time
+import cv2
+from camera_stream import LatestFrameGrabber
+from face_matcher import RECOGNITION_THRESHOLD, create_matcher
+from face_pipeline import DETECTION_SCALE, MIN_FACE_SIZE, detect_faces_scaled, face_boxes, match_face_batches
+from face_tracker import FaceTracker
+
+# Cấu hình
+EMBEDDING_FILEPATH = os.path.join("EmbeddingPicture", "Embeddings_Facenet.emb")
+IDLE_WAIT = 0.005  # Chờ khi chưa camera nào có khung hình mới
+
+class CameraStream:
+    """Một nguồn video cùng tracker riêng của nó."""
+
+    def __init__(self, index, source, grabber, tracking=True):
+        self.index = index
+        self.source = source
+        self.grabber = grabber
+        self.tracker = FaceTracker() if tracking else None
+        self.frames_processed = 0
+        self.frame_buffer = None  # Bộ đệm khung hình dùng lại cho grabber.read(out)
+
+class MultiCameraRecognizer:
+    """Nhận diện trên nhiều nguồn video bằng một bộ phát hiện và một embedder dùng chung.
+
+    Mỗi vòng lặp lấy khung mới nhất của từng nguồn, phát hiện khuôn mặt trên từng khung, rồi gộp
+    khuôn mặt của mọi nguồn vào một lần gọi embedder và một lần so khớp. Kết quả được trả về theo
+    từng nguồn qua on_result(stream_index, frame_bgr, results), với results giống RecognitionWorker:
+    danh sách {'box', 'person', 'distance', 'track_id'}. frame_bgr được dùng lại cho khung sau của nguồn đó,
+    on_result cần sao chép nếu muốn giữ lại.
+    """
+
+    def __init__(self, sources, detector, embedder, matcher, known_people, on_result=None,
+                 detection_scale=DETECTION_SCALE, min_face_size=MIN_FACE_SIZE, tracking=True):
+        self.sources = list(sources)
+        self.detector = detector
+        self.embedder = embedder
+        self.matcher = matcher
+        self.known_people = known_people
+        self.on_result = on_result
+        self.detection_scale = detection_scale
+        self.min_face_size = min_face_size
+        self.tracking = tracking
+        self.streams = []
+        self.running = False
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Mở mọi nguồn video. Nguồn không mở được bị bỏ qua kèm cảnh báo; trả về số nguồn đã mở."""
+        for index, source in enumerate(self.sources):
+            grabber = LatestFrameGrabber.open(source)
+            if grabber is None:
+                print(f"[CẢNH BÁO] Không thể mở nguồn video {index}: {source}")
+                continue
+            self.streams.append(CameraStream(index, source, grabber, self.tracking))
+        return len(self.streams)
+
+    def step(self, timeout=0.0):
+        """Xử lý khung mới nhất của mọi nguồn có khung mới. Trả về số khung đã xử lý."""
+        batch = []
+        for stream in self.streams:
+            ret, frame_bgr = stream.grabber.read(stream.frame_buffer, timeout=timeout)
+            if ret:
+                stream.frame_buffer = frame_bgr
+                batch.append((stream, frame_bgr, cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)))
+        if not batch:
+            return 0
+
+        with self._lock:
+            matcher, known_people = self.matcher, self.known_people
+
+        # Phát hiện trên từng khung, chỉ tạo embedding cho track mới hoặc đến hạn
+        frames_rgb, pending_boxes, tracks_per_frame, boxes_per_frame = [], [], [], []
+        for stream, _, frame_rgb in batch:
+            faces = detect_faces_scaled(self.detector, frame_rgb, self.detection_scale, self.min_face_size)
+            boxes = face_boxes(frame_rgb, faces)
+            tracks = stream.tracker.update(boxes) if stream.tracker else [None] * len(boxes)
+            pending = [box for box, track in zip(boxes, tracks)
+                       if track is None or stream.tracker.needs_embedding(track)]
+            frames_rgb.append(frame_rgb)
+            pending_boxes.append(pending)
+            tracks_per_frame.append(tracks)
+            boxes_per_frame.append(boxes)
+
+        # Một lần gọi embedder và một lần so khớp cho khuôn mặt của mọi nguồn
+        matches = match_face_batches(frames_rgb, pending_boxes, self.embedder, matcher)
+
+        for (stream, frame_bgr, _), boxes, tracks, (distances, indices) in zip(batch, boxes_per_frame, tracks_per_frame, matches):
+            results = []
+            match_iter = iter(zip(indices, distances))
+            for box, track in zip(boxes, tracks):
+                if track is None:
+                    idx, distance = next(match_iter)
+                    person = known_people[idx] if idx >= 0 else None
+                    results.append({'box': box, 'person': person, 'distance': distance, 'track_id': None})
+                    continue
+                if stream.tracker.needs_embedding(track):
+                    idx, distance = next(match_iter)
+                    stream.tracker.set_identity(track, known_people[idx] if idx >= 0 else None, distance)
+                results.append({'box': box, 'person': track.person, 'distance': track.distance, 'track_id': track.track_id})
+
+            stream.frames_processed += 1
+            if self.on_result:
+                self.on_result(stream.index, frame_bgr, results)
+        return len(batch)
+
+    def run(self):
+        """Xử lý liên tục cho đến khi stop() hoặc mọi nguồn đã kết thúc."""
+        self.running = True
+        while self.running and any(not stream.grabber.finished for stream in self.streams):
+            if self.step() == 0:
+                time.sleep(IDLE_WAIT)
+        self.running = False
+
+    def update_gallery(self, matcher, known_people):
+        """Thay dữ liệu nhận diện; các track được xóa vì danh tính đã lưu có thể không còn đúng."""
+        with self._lock:
+            self.matcher, self.known_people = matcher, known_people
+            for stream in self.streams:
+                if stream.tracker:
+                    stream.tracker.reset()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        """Dừng và giải phóng mọi nguồn video."""
+        self.stop()
+        for stream in self.streams:
+            stream.grabber.release()
+        self.streams = []
+
+def _draw(frame_bgr, results):
+    for result in results:
+        x1, y1, x2, y2 = result['box']
+        person = result['person']
+        color = (0, 255, 0) if person is not None else (0, 0, 255)
+        text = f"{person['name']} ({person['id']})" if person is not None else "Unknown"
+        cv2.rectangle(frame_bgr, (x1, y1), (x2, y2), color, 2)
+        text_y = y1 - 10 if y1 > 20 else y1 + 15
+        cv2.putText(frame_bgr, text, (x1, text_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+
+if __name__ == "__main__":
+    from embedding_store import load_gallery
+    from model_registry import get_detector, get_embedder
+
+    parser = argparse.ArgumentParser(description="Nhận diện khuôn mặt trên nhiều camera với một mô hình dùng chung.")
+    parser.add_argument("--source", action="append", required=True,
+                        help="Chỉ số camera, đường dẫn file video hoặc URL; lặp lại cho mỗi nguồn.")
+    parser.add_argument("--embeddings", default=EMBEDDING_FILEPATH)
+    parser.add_argument("--detection-scale", type=float, default=DETECTION_SCALE)
+    parser.add_argument("--headless", action="store_true", help="Không mở cửa sổ, chỉ in kết quả.")
+    args = parser.parse_args()
+
+    store = load_gallery(args.embeddings)
+    recognizer = MultiCameraRecognizer(
+        args.source, get_detector(), get_embedder(), create_matcher(store.embeddings, threshold=RECOGNITION_THRESHOLD), store,
+        detection_scale=args.detection_scale)
+    if recognizer.open() == 0:
+        print("[LỖI] Không mở được nguồn video nào.")
+        raise SystemExit(1)
+
+    def show_result(stream_index, frame_bgr, results):
+        names = [r['person']['name'] if r['person'] is not None else "Unknown" for r in results]
+        if args.headless:
+            if names:
+                print(f"[Nguồn {stream_index}] {', '.join(names)}")
+            return
+        _draw(frame_bgr, results)
+        cv2.imshow(f"Camera {stream_index}", frame_bgr)
+        if cv2.waitKey(1) & 0xFF == 27:
+            recognizer.stop()
+
+    recognizer.on_result = show_result
+    try:
+        recognizer.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recognizer.close()
+        cv2.destroyAllWindows()
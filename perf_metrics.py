@@ -0,0 +1,234 @@
+import bisect
+import os
+import threading
+import time
+
+# Đo hiệu năng cho vòng lặp nhận diện: histogram độ trễ từng bước, FPS, số khuôn mặt mỗi khung,
+# kích thước lô embedding và độ dài hàng đợi. Khi tắt, PerfMetrics trả về các đối tượng rỗng nên
+# chi phí chỉ còn một lần gọi hàm cho mỗi điểm đo.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)  # giây
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 16, 32, 64)
+HISTOGRAM_BUCKETS = {
+    'stage_seconds': LATENCY_BUCKETS,
+    'faces_per_frame': COUNT_BUCKETS,
+    'embed_batch_size': COUNT_BUCKETS,
+}
+LABEL_NAMES = {'stage_seconds': 'stage', 'queue_depth': 'queue', 'queue_dropped': 'queue', 'startup_seconds': 'step'}  # Tên nhãn mặc định là 'name'
+RECENT_SMOOTHING = 0.1  # Hệ số EMA cho giá trị gần đây hiển thị trên giao diện
+METRIC_PREFIX = "face_recognition_"
+PROMETHEUS_WRITE_INTERVAL = 15.0  # giây
+
+class Histogram:
+    """Histogram với các ngưỡng cố định kiểu Prometheus, kèm EMA của giá trị gần đây."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Phần tử cuối cho giá trị lớn hơn ngưỡng cuối (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent = value if self.recent is None else self.recent + RECENT_SMOOTHING * (value - self.recent)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Ước lượng phân vị bằng nội suy tuyến tính trong bucket, như histogram_quantile của Prometheus."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count > 0:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+class _StageTimer:
+    __slots__ = ('_metrics', '_stage', '_start')
+
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._metrics.observe('stage_seconds', time.perf_counter() - self._start, self._stage)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class PerfMetrics:
+    """Bộ đếm hiệu năng an toàn luồng.
+
+    Dùng `with metrics.time('detect'):` để đo một bước, observe()/set_gauge()/increment() cho các
+    giá trị khác và frame() sau mỗi khung hình để tính FPS.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started = time.time()
+        self.frames = 0
+        self.fps = 0.0
+        self._last_frame_time = None
+        self._histograms = {}  # (tên, nhãn) -> Histogram
+        self._gauges = {}  # (tên, nhãn) -> giá trị
+        self._counters = {}  # (tên, nhãn) -> giá trị
+        self._lock = threading.Lock()
+
+    def time(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def observe(self, name, value, label=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get((name, label))
+            if histogram is None:
+                histogram = self._histograms[(name, label)] = Histogram(HISTOGRAM_BUCKETS.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def set_gauge(self, name, value, label=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, label)] = value
+
+    def increment(self, name, value=1, label=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(name, label)] = self._counters.get((name, label), 0) + value
+
+    def frame(self, faces=None):
+        """Ghi nhận một khung hình đã hiển thị (và số khuôn mặt nếu có) để tính FPS."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self.frames += 1
+            if self._last_frame_time is not None:
+                interval = now - self._last_frame_time
+                if interval > 0:
+                    fps = 1.0 / interval
+                    self.fps = fps if self.fps == 0.0 else self.fps + RECENT_SMOOTHING * (fps - self.fps)
+            self._last_frame_time = now
+        if faces is not None:
+            self.observe('faces_per_frame', faces)
+
+    def snapshot(self):
+        """Tóm tắt các giá trị gần đây cho giao diện: FPS, độ trễ từng bước (ms), số khuôn mặt, hàng đợi."""
+        with self._lock:
+            stages = {
+                label: {'recent_ms': h.recent * 1000.0, 'mean_ms': h.mean * 1000.0, 'p95_ms': h.quantile(0.95) * 1000.0}
+                for (name, label), h in self._histograms.items() if name == 'stage_seconds'
+            }
+            faces = self._histograms.get(('faces_per_frame', None))
+            batches = self._histograms.get(('embed_batch_size', None))
+            return {
+                'fps': self.fps,
+                'frames': self.frames,
+                'stages': stages,
+                'faces_per_frame': faces.recent if faces else 0.0,
+                'embed_batch_size': batches.mean if batches else 0.0,
+                'gauges': {self._key(name, label): value for (name, label), value in self._gauges.items()},
+                'counters': {self._key(name, label): value for (name, label), value in self._counters.items()},
+            }
+
+    @staticmethod
+    def _key(name, label):
+        return name if label is None else f"{name}.{label}"
+
+    def to_prometheus(self):
+        """Xuất toàn bộ số liệu theo định dạng văn bản của Prometheus."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: (item[0][0], str(item[0][1])))
+            written = set()
+            for (name, label), histogram in histograms:
+                metric = METRIC_PREFIX + name
+                if name not in written:
+                    lines.append(f"# TYPE {metric} histogram")
+                    written.add(name)
+                labels = f'{LABEL_NAMES.get(name, "name")}="{label}",' if label is not None else ""
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{labels}le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{labels}le="+Inf"}} {histogram.count}')
+                suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{metric}_sum{suffix} {histogram.sum}")
+                lines.append(f"{metric}_count{suffix} {histogram.count}")
+
+            for kind, values in (('gauge', self._gauges), ('counter', self._counters)):
+                written = set()
+                for (name, label), value in sorted(values.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                    metric = METRIC_PREFIX + name
+                    if name not in written:
+                        lines.append(f"# TYPE {metric} {kind}")
+                        written.add(name)
+                    suffix = f'{{{LABEL_NAMES.get(name, "name")}="{label}"}}' if label is not None else ""
+                    lines.append(f"{metric}{suffix} {value}")
+
+            lines.append(f"# TYPE {METRIC_PREFIX}fps gauge")
+            lines.append(f"{METRIC_PREFIX}fps {self.fps}")
+            lines.append(f"# TYPE {METRIC_PREFIX}frames_total counter")
+            lines.append(f"{METRIC_PREFIX}frames_total {self.frames}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Ghi file .prom ra file tạm rồi thay thế để node exporter không đọc phải file ghi dở."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+class PrometheusFileWriter(threading.Thread):
+    """Luồng nền ghi số liệu ra file định kỳ (dùng cho textfile collector của node exporter)."""
+
+    def __init__(self, metrics, path, interval=PROMETHEUS_WRITE_INTERVAL):
+        super().__init__(name="prometheus-writer", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self._write()
+        self._write()
+
+    def _write(self):
+        try:
+            self.metrics.write_prometheus(self.path)
+        except OSError as e:
+            print(f"[Cảnh báo] Không thể ghi file số liệu {self.path}: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=2.0)
+
+NULL_METRICS = PerfMetrics(enabled=False)
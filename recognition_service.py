@@ -0,0 +1,373 @@
+import argparse
+import collections
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import cv2
+import numpy as np
+from enrollment import IMAGES_FOLDER, GalleryNotReadyError, sanitize_user_name, save_enrollment, validate_user_id
+from face_matcher import RECOGNITION_THRESHOLD
+from gallery import EMPTY_GALLERY, load_snapshot
+from face_ingest import crop_largest_face
+from face_pipeline import DETECTION_SCALE, MIN_FACE_SIZE, detect_faces_scaled, face_boxes, prepare_face_batch
+from model_registry import model_lock
+
+# Cấu hình
+EMBEDDING_FILEPATH = os.path.join("EmbeddingPicture", "Embeddings_Facenet.emb")
+MATCHER_BACKEND = 'auto'
+SERVICE_HOST = "127.0.0.1"  # Chỉ nghe trên máy cục bộ
+SERVICE_PORT = 8000
+MAX_BATCH_SIZE = 32  # Số khuôn mặt tối đa gộp vào một lần gọi embedder
+MAX_BATCH_WAIT = 0.01  # Thời gian tối đa (giây) chờ thêm yêu cầu sau yêu cầu đầu tiên của lô
+MAX_UPLOAD_SIZE = 16 * 1024 * 1024
+LATENCY_WINDOW = 1000  # Số yêu cầu gần nhất dùng để tính phân vị độ trễ
+
+class MicroBatchScheduler:
+    """Gộp các yêu cầu tạo embedding đồng thời thành một lần gọi embed_fn.
+
+    submit(faces) trả về Future cho embedding của faces. Luồng nền lấy yêu cầu đầu tiên, chờ thêm tối đa
+    max_wait giây hoặc đến khi đủ max_batch_size khuôn mặt, gọi embed_fn một lần cho cả lô rồi tách kết quả.
+    Chỉ luồng nền gọi embed_fn nên mô hình không cần an toàn luồng.
+    """
+
+    def __init__(self, embed_fn, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.batches = 0
+        self.batched_faces = 0
+        self.batch_sizes = collections.Counter()
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="embed-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, faces):
+        future = Future()
+        if len(faces) == 0:
+            future.set_result(np.empty((0, 0), np.float32))
+            return future
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Scheduler đã dừng.")
+            self._pending.append((faces, future))
+            self._condition.notify()
+        return future
+
+    def _next_batch(self):
+        """Chờ và lấy các yêu cầu cho lô tiếp theo. Trả về None khi scheduler dừng."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending or not self._running)
+            if not self._pending:
+                return None
+            deadline = time.monotonic() + self.max_wait
+            while sum(len(faces) for faces, _ in self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._condition.wait(remaining)
+
+            batch, count = [], 0
+            while self._pending:
+                faces, future = self._pending[0]
+                # Một yêu cầu lớn hơn max_batch_size vẫn được xử lý nguyên vẹn trong lô riêng
+                if batch and count + len(faces) > self.max_batch_size:
+                    break
+                self._pending.popleft()
+                batch.append((faces, future))
+                count += len(faces)
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [(faces, future) for faces, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                embeddings = np.asarray(self.embed_fn(np.concatenate([faces for faces, _ in batch])), dtype=np.float32)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.batched_faces += len(embeddings)
+            self.batch_sizes[len(embeddings)] += 1
+            start = 0
+            for faces, future in batch:
+                future.set_result(embeddings[start:start + len(faces)])
+                start += len(faces)
+
+    def close(self):
+        """Dừng luồng nền; các yêu cầu còn chờ vẫn được xử lý xong."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=5.0)
+
+class ServiceMetrics:
+    """Đếm yêu cầu, lỗi và độ trễ theo từng endpoint."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._requests = collections.Counter()
+        self._errors = collections.Counter()
+        self._faces = collections.Counter()
+        self._latencies = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self._timestamps = collections.defaultdict(lambda: collections.deque(maxlen=window))
+
+    def record(self, endpoint, latency, faces=0, error=False):
+        now = time.time()
+        with self._lock:
+            self._requests[endpoint] += 1
+            self._faces[endpoint] += faces
+            if error:
+                self._errors[endpoint] += 1
+            self._latencies[endpoint].append(latency)
+            self._timestamps[endpoint].append(now)
+
+    def snapshot(self):
+        now = time.time()
+        endpoints = {}
+        with self._lock:
+            for endpoint, count in self._requests.items():
+                latencies = np.array(self._latencies[endpoint]) * 1000.0
+                timestamps = self._timestamps[endpoint]
+                span = now - timestamps[0] if len(timestamps) > 1 else 0.0
+                endpoints[endpoint] = {
+                    'requests': count,
+                    'errors': self._errors[endpoint],
+                    'faces': self._faces[endpoint],
+                    'throughput_rps': len(timestamps) / span if span > 0 else 0.0,
+                    'latency_ms': {
+                        'mean': float(latencies.mean()),
+                        'p50': float(np.percentile(latencies, 50)),
+                        'p95': float(np.percentile(latencies, 95)),
+                        'p99': float(np.percentile(latencies, 99)),
+                        'max': float(latencies.max()),
+                    },
+                }
+        return {'uptime_s': now - self.started, 'endpoints': endpoints}
+
+class RecognitionService:
+    """Nhận diện và thêm người dùng không cần giao diện; mô hình được tải một lần và dùng chung cho mọi yêu cầu."""
+
+    def __init__(self, detector, embedder, embedding_filepath=EMBEDDING_FILEPATH, images_folder=IMAGES_FOLDER,
+                 threshold=RECOGNITION_THRESHOLD, matcher_backend=MATCHER_BACKEND,
+                 max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT,
+                 detection_scale=DETECTION_SCALE, min_face_size=MIN_FACE_SIZE):
+        self.detector = detector
+        self.embedding_filepath = embedding_filepath
+        self.images_folder = images_folder
+        self.threshold = threshold
+        self.matcher_backend = matcher_backend
+        self.detection_scale = detection_scale
+        self.min_face_size = min_face_size
+        self.scheduler = MicroBatchScheduler(self._embed, max_batch_size, max_wait)
+        self.embedder = embedder
+        self.metrics = ServiceMetrics()
+        self._enroll_lock = threading.Lock()
+        self._gallery = EMPTY_GALLERY  # GallerySnapshot, thay bằng một phép gán khi tải lại
+        self._load_gallery()
+
+    def _load_gallery(self):
+        version = self._gallery.version + 1
+        try:
+            self._gallery = load_snapshot(self.embedding_filepath, self.matcher_backend, self.threshold, version)
+        except FileNotFoundError:
+            print(f"[CẢNH BÁO] Chưa có file embeddings tại {self.embedding_filepath}.")
+            return
+        print(f"Đã tải {len(self._gallery)} embeddings.")
+
+    def _embed(self, faces):
+        with model_lock(self.embedder):  # Model có thể dùng chung với luồng khác trong cùng tiến trình
+            return self.embedder.embeddings(faces)
+
+    def _detect_raw(self, image_rgb):
+        # detect_faces_scaled giữ model_lock của detector: MTCNN không an toàn khi gọi từ nhiều luồng
+        return detect_faces_scaled(self.detector, image_rgb, self.detection_scale, self.min_face_size)
+
+    def _detect(self, image_rgb):
+        return face_boxes(image_rgb, self._detect_raw(image_rgb))
+
+    def identify(self, image_rgb):
+        """Nhận diện mọi khuôn mặt trong ảnh. Trả về danh sách {'box', 'id', 'name', 'distance'}."""
+        boxes = self._detect(image_rgb)
+        if not boxes:
+            return []
+        embeddings = self.scheduler.submit(prepare_face_batch(image_rgb, boxes)).result()
+        gallery = self._gallery
+        if not gallery.ready:
+            distances = np.full(len(boxes), np.inf)
+            indices = np.full(len(boxes), -1)
+        else:
+            distances, indices = gallery.matcher.search(embeddings, k=1)
+            distances, indices = distances[:, 0], indices[:, 0]
+
+        results = []
+        for box, idx, distance in zip(boxes, indices, distances):
+            person = gallery.person(idx)
+            results.append({
+                'box': [int(value) for value in box],
+                'id': person['id'] if person is not None else None,
+                'name': person['name'] if person is not None else None,
+                'distance': float(distance) if np.isfinite(distance) else None,
+            })
+        return results
+
+    def enroll(self, image_bgr, user_name, user_id=None):
+        """Thêm người dùng từ ảnh chứa một khuôn mặt (lấy khuôn mặt lớn nhất nếu có nhiều).
+
+        Ảnh và embedding được lưu bằng enrollment.save_enrollment như khi thêm từ giao diện.
+        Trả về {'id', 'name', 'photo', 'gallery_size'}; ném ValueError nếu dữ liệu không hợp lệ
+        và GalleryNotReadyError nếu dataset đã có ảnh mà chưa có store.
+        """
+        if not sanitize_user_name(user_name):
+            raise ValueError("Tên người dùng không hợp lệ.")
+        if user_id is not None:
+            validate_user_id(user_id)
+        image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+        faces = self._detect_raw(image_rgb)
+        face_array = crop_largest_face(image_rgb, faces) if faces else None
+        if face_array is None:
+            raise ValueError("Không tìm thấy khuôn mặt trong ảnh.")
+        embedding = self.scheduler.submit(face_array[None]).result()[0]
+
+        with self._enroll_lock:
+            result = save_enrollment(image_bgr, embedding, user_name, user_id, self.images_folder, self.embedding_filepath)
+            self._load_gallery()
+        return result
+
+    def metrics_snapshot(self):
+        snapshot = self.metrics.snapshot()
+        scheduler = self.scheduler
+        snapshot['embedder'] = {
+            'batches': scheduler.batches,
+            'faces': scheduler.batched_faces,
+            'mean_batch_size': scheduler.batched_faces / scheduler.batches if scheduler.batches else 0.0,
+            'batch_sizes': {str(size): count for size, count in sorted(scheduler.batch_sizes.items())},
+            'max_batch_size': scheduler.max_batch_size,
+            'max_wait_ms': scheduler.max_wait * 1000.0,
+        }
+        snapshot['gallery_size'] = len(self._gallery)
+        snapshot['gallery_version'] = self._gallery.version
+        snapshot['gallery_kind'] = self._gallery.kind
+        return snapshot
+
+    def close(self):
+        self.scheduler.close()
+
+def _decode_image(body):
+    image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR) if body else None
+    if image is None:
+        raise ValueError("Nội dung yêu cầu không phải ảnh hợp lệ.")
+    return image
+
+class RecognitionRequestHandler(BaseHTTPRequestHandler):
+    """POST /identify và POST /enroll?name=...[&id=...] nhận ảnh (JPEG/PNG) trong thân yêu cầu;
+    GET /metrics và GET /health trả về JSON. /enroll trả 409 khi dataset đã có ảnh nhưng chưa có store.
+    """
+
+    service = None  # Được gán bởi make_server
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_UPLOAD_SIZE:
+            raise ValueError("Ảnh quá lớn.")
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/metrics':
+            self._send_json(200, self.service.metrics_snapshot())
+        elif path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'Không tìm thấy endpoint.'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path not in ('/identify', '/enroll'):
+            self._send_json(404, {'error': 'Không tìm thấy endpoint.'})
+            return
+
+        start = time.perf_counter()
+        faces = 0
+        try:
+            image_bgr = _decode_image(self._read_body())
+            if url.path == '/identify':
+                results = self.service.identify(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB))
+                faces = len(results)
+                status, payload = 200, {'faces': results}
+            else:
+                query = parse_qs(url.query)
+                user = self.service.enroll(image_bgr, query.get('name', [''])[0], query.get('id', [None])[0])
+                faces = 1
+                status, payload = 200, user
+        except ValueError as e:
+            status, payload = 400, {'error': str(e)}
+        except GalleryNotReadyError as e:
+            status, payload = 409, {'error': str(e)}
+        except Exception as e:
+            status, payload = 500, {'error': str(e)}
+
+        elapsed = time.perf_counter() - start
+        payload['elapsed_ms'] = elapsed * 1000.0
+        self.service.metrics.record(url.path, elapsed, faces, error=status != 200)
+        self._send_json(status, payload)
+
+    def log_message(self, format, *args):
+        pass  # Không in một dòng cho mỗi yêu cầu
+
+def make_server(service, host=SERVICE_HOST, port=SERVICE_PORT):
+    """Tạo HTTP server cho service; port=0 chọn cổng trống (dùng server.server_address để lấy cổng)."""
+    handler = type('BoundRecognitionRequestHandler', (RecognitionRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP nhận diện khuôn mặt (không giao diện).")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--embeddings", default=EMBEDDING_FILEPATH)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help="Số khuôn mặt tối đa trong một lần gọi FaceNet.")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_BATCH_WAIT * 1000.0,
+                        help="Thời gian tối đa chờ gộp thêm yêu cầu vào lô.")
+    parser.add_argument("--detection-scale", type=float, default=DETECTION_SCALE)
+    args = parser.parse_args()
+
+    from model_registry import get_detector, get_embedder
+
+    print("Khởi tạo mô hình...")
+    service = RecognitionService(get_detector(), get_embedder(), args.embeddings,
+                                 max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000.0,
+                                 detection_scale=args.detection_scale)
+    server = make_server(service, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Dịch vụ đang chạy tại http://{host}:{port} (POST /identify, POST /enroll?name=..., GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
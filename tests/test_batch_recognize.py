@@ -0,0 +1,34 @@
+import json
+import numpy as np
+import pytest
+from batch_recognize import last_processed_frame, recognize
+from embedding_store import save_store
+
+def test_last_processed_frame_missing_file(tmp_path):
+    assert last_processed_frame(str(tmp_path / "results.jsonl")) == -1
+
+def test_last_processed_frame_truncates_partial_line(tmp_path):
+    output_path = tmp_path / "results.jsonl"
+    complete = "".join(json.dumps({'frame': frame, 'faces': []}) + "\n" for frame in (0, 5, 10))
+    output_path.write_bytes(complete.encode('utf-8') + b'{"frame": 15, "fa')  # Dừng giữa lúc ghi
+
+    assert last_processed_frame(str(output_path)) == 10
+    assert output_path.read_bytes() == complete.encode('utf-8')
+    assert last_processed_frame(str(output_path)) == 10  # Gọi lại không cắt thêm
+
+def test_last_processed_frame_unterminated_last_line(tmp_path):
+    output_path = tmp_path / "results.jsonl"
+    output_path.write_text(json.dumps({'frame': 0}) + "\n" + json.dumps({'frame': 1}), encoding='utf-8')
+    assert last_processed_frame(str(output_path)) == 0  # Dòng không có xuống dòng chưa ghi xong
+
+@pytest.mark.parametrize('resume', [False, True])
+def test_unreadable_video_leaves_output_untouched(tmp_path, resume):
+    store_path = str(tmp_path / "gallery.emb")
+    save_store(store_path, np.zeros((0, 4), np.float32), [], [])
+    output_path = tmp_path / "results.jsonl"
+    previous = (json.dumps({'frame': 0, 'faces': []}) + "\n").encode('utf-8') + b'{"frame": 1'
+    output_path.write_bytes(previous)
+
+    with pytest.raises(IOError):
+        recognize(str(tmp_path / "missing.mp4"), str(output_path), store_path, resume=resume)
+    assert output_path.read_bytes() == previous
@@ -0,0 +1,135 @@
+import json
+import os
+import pickle
+import numpy as np
+import pytest
+import embedding_store
+from embedding_store import (HEADER_SIZE, append_store, compact_store, journal_path, load_gallery, load_store,
+                             read_header, save_store)
+
+def _rows(count, dim=4, seed=0):
+    embeddings = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return embeddings, [f"{i:03d}" for i in range(count)], [f"Người {i}" for i in range(count)]
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "gallery.emb")
+
+@pytest.mark.parametrize('in_memory', [False, True])
+def test_round_trip(store_path, in_memory):
+    embeddings, ids, names = _rows(5)
+    save_store(store_path, embeddings, ids, names, {'embedder': 'keras'})
+
+    store = load_store(store_path, verify=True, in_memory=in_memory)
+    assert len(store) == 5 and store.dim == 4
+    np.testing.assert_array_equal(store.embeddings, embeddings)
+    assert store.ids.tolist() == ids
+    assert store.names.tolist() == names  # Chuỗi UTF-8
+    assert store[2]['name'] == "Người 2"
+    assert store.header['embedder'] == 'keras'
+    assert isinstance(store.embeddings, np.memmap) != in_memory
+
+def test_empty_store(store_path):
+    save_store(store_path, np.empty((0, 0), np.float32), [], [])
+    store = load_store(store_path, verify=True)
+    assert len(store) == 0 and store.ids.tolist() == []
+
+def test_checksum_detects_corruption(store_path):
+    embeddings, ids, names = _rows(3)
+    save_store(store_path, embeddings, ids, names)
+    offset = read_header(store_path)['embeddings_offset']
+    with open(store_path, 'r+b') as file:
+        file.seek(offset)
+        byte = file.read(1)
+        file.seek(offset)
+        file.write(bytes([byte[0] ^ 0xFF]))
+
+    load_store(store_path)  # Không kiểm tra checksum thì vẫn mở được
+    with pytest.raises(ValueError, match="Checksum"):
+        load_store(store_path, verify=True)
+
+def test_truncated_file(store_path):
+    embeddings, ids, names = _rows(3)
+    save_store(store_path, embeddings, ids, names)
+    header = read_header(store_path)
+    with open(store_path, 'r+b') as file:
+        file.truncate(header['name_blob_offset'] + 1)
+
+    with pytest.raises(ValueError, match="cắt cụt"):
+        load_store(store_path, verify=True)
+    with pytest.raises(ValueError, match="cắt cụt"):
+        load_store(store_path, in_memory=True)
+
+def test_rejects_other_files(store_path):
+    with open(store_path, 'wb') as file:
+        file.write(b"x" * HEADER_SIZE)
+    with pytest.raises(ValueError):
+        read_header(store_path)
+
+def test_append_uses_journal_then_compacts(store_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, 'JOURNAL_COMPACT_ROWS', 2)
+    embeddings, ids, names = _rows(5)
+    assert append_store(store_path, embeddings[:2], ids[:2], names[:2]) == 2  # Chưa có store: tạo mới
+    header = read_header(store_path)
+
+    assert append_store(store_path, embeddings[2:3], ids[2:3], names[2:3]) == 3
+    assert append_store(store_path, embeddings[3:4], ids[3:4], names[3:4]) == 4
+    assert read_header(store_path) == header  # Store gốc không bị ghi lại
+    store = load_store(store_path, verify=True)
+    assert store.ids.tolist() == ids[:4] and store.header['journal_rows'] == 2
+    np.testing.assert_array_equal(store.embeddings, embeddings[:4])
+
+    assert append_store(store_path, embeddings[4:], ids[4:], names[4:]) == 5  # Vượt giới hạn: gộp
+    assert read_header(store_path)['count'] == 5
+    assert not os.path.exists(journal_path(store_path))
+    store = load_store(store_path, verify=True)
+    assert store.names.tolist() == names and 'journal_rows' not in store.header
+
+def test_compact_store_keeps_metadata_and_memmaps_again(store_path):
+    embeddings, ids, names = _rows(4)
+    save_store(store_path, embeddings[:2], ids[:2], names[:2], {'source_count': 2})
+    append_store(store_path, embeddings[2:], ids[2:], names[2:])
+    assert not isinstance(load_store(store_path).embeddings, np.memmap)
+
+    assert compact_store(store_path) == 2
+    assert compact_store(store_path) == 0
+    assert not os.path.exists(journal_path(store_path))
+    store = load_store(store_path, verify=True)
+    assert isinstance(store.embeddings, np.memmap)
+    assert store.ids.tolist() == ids and store.names.tolist() == names
+    assert store.header['source_count'] == 4
+    np.testing.assert_array_equal(store.embeddings, embeddings)
+
+def test_append_rejects_dimension_mismatch(store_path):
+    embeddings, ids, names = _rows(2)
+    save_store(store_path, embeddings, ids, names)
+    with pytest.raises(ValueError, match="không khớp"):
+        append_store(store_path, np.zeros((1, 8)), ['x'], ['x'])
+
+def test_torn_and_stale_journal_lines_are_ignored(store_path):
+    embeddings, ids, names = _rows(3)
+    save_store(store_path, embeddings[:1], ids[:1], names[:1])
+    append_store(store_path, embeddings[1:2], ids[1:2], names[1:2])
+    with open(journal_path(store_path), 'ab') as file:
+        file.write(b'{"base": ')  # Dòng ghi dở
+    assert len(load_store(store_path)) == 2
+
+    assert append_store(store_path, embeddings[2:], ids[2:], names[2:]) == 3  # Dòng ghi dở bị cắt bỏ
+    assert load_store(store_path).ids.tolist() == ids
+
+    stale = open(journal_path(store_path), 'rb').read()
+    save_store(store_path, embeddings[:1], ids[:1], ['khác'])  # Ghi lại store, xóa nhật ký
+    with open(journal_path(store_path), 'wb') as file:
+        file.write(stale)  # Nhật ký của store cũ
+    assert len(load_store(store_path)) == 1
+
+def test_load_gallery_converts_legacy_pickle(tmp_path):
+    embeddings, ids, names = _rows(2)
+    with open(tmp_path / "gallery.p", 'wb') as file:
+        pickle.dump([{'id': i, 'name': n, 'embedding': e} for e, i, n in zip(embeddings, ids, names)] + ["hỏng"], file)
+
+    store = load_gallery(str(tmp_path / "gallery.emb"))
+    assert store.ids.tolist() == ids
+    assert json.loads(json.dumps(store.header))['count'] == 2
+    with pytest.raises(FileNotFoundError):
+        load_gallery(str(tmp_path / "missing.emb"))
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from face_matcher import ExactMatcher, IVFMatcher, create_matcher
+
+def _gallery(count=200, dim=16, seed=0):
+    rows = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+def _brute_force(gallery, queries):
+    distances = np.linalg.norm(queries[:, None, :] - gallery[None, :, :], axis=2)
+    return distances.min(axis=1), distances.argmin(axis=1)
+
+@pytest.mark.parametrize('backend, options', [('exact', {}), ('ivf', {'nlist': 8, 'nprobe': 8})])
+def test_nearest_row_and_distance(backend, options):
+    gallery = _gallery()
+    queries = gallery[[3, 50, 199]] + 0.01
+    distances, indices = create_matcher(gallery, backend, threshold=10.0, **options).search(queries)
+
+    expected_distances, expected_indices = _brute_force(gallery, queries)
+    assert distances.shape == indices.shape == (3, 1)
+    np.testing.assert_array_equal(indices[:, 0], expected_indices)
+    np.testing.assert_allclose(distances[:, 0], expected_distances, atol=1e-4)
+
+@pytest.mark.parametrize('matcher_class', [ExactMatcher, IVFMatcher])
+def test_threshold_marks_unknown_with_minus_one(matcher_class):
+    gallery = _gallery()
+    near, far = gallery[7] + 0.001, -gallery[7] * 3.0
+    distances, indices = matcher_class(gallery, threshold=0.5).search(np.stack([near, far]))
+
+    assert indices[0, 0] == 7
+    assert indices[1, 0] == -1
+    assert np.isfinite(distances[1, 0]) and distances[1, 0] >= 0.5  # Khoảng cách vẫn được trả về
+
+def test_distance_equal_to_threshold_is_rejected():
+    gallery = np.array([[0.0, 0.0]], np.float32)
+    distances, indices = ExactMatcher(gallery, threshold=1.0).search(np.array([[1.0, 0.0]], np.float32))
+    assert distances[0, 0] == pytest.approx(1.0)
+    assert indices[0, 0] == -1
+
+def test_k_larger_than_gallery_pads_with_minus_one():
+    gallery = _gallery(count=2)
+    distances, indices = ExactMatcher(gallery, threshold=10.0).search(gallery[0], k=4)
+    assert indices.shape == (1, 4)
+    assert indices[0, 0] == 0 and sorted(indices[0, :2]) == [0, 1]
+    assert (indices[0, 2:] == -1).all() and np.isinf(distances[0, 2:]).all()
+
+@pytest.mark.parametrize('matcher_class', [ExactMatcher, IVFMatcher])
+def test_empty_gallery_and_empty_queries(matcher_class):
+    matcher = matcher_class(np.empty((0, 16), np.float32))
+    assert len(matcher) == 0
+    distances, indices = matcher.search(_gallery(count=2))
+    assert (indices == -1).all() and np.isinf(distances).all()
+
+    distances, indices = matcher_class(_gallery()).search(np.empty((0, 16), np.float32))
+    assert distances.shape == indices.shape == (0, 1)
+
+def test_create_matcher_backends():
+    gallery = _gallery(count=10)
+    assert isinstance(create_matcher(gallery), ExactMatcher)
+    assert isinstance(create_matcher(gallery, 'ivf', nlist=2), IVFMatcher)
+    with pytest.raises(ValueError):
+        create_matcher(gallery, 'faiss')
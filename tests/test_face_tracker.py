@@ -0,0 +1,58 @@
+import pytest
+from face_tracker import FaceTracker, box_iou
+
+def test_box_iou():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == pytest.approx(1.0)
+    assert box_iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(50 / 150)
+    assert box_iou((0, 0, 10, 10), (10, 0, 20, 10)) == 0.0  # Chỉ chạm cạnh
+
+def test_tracks_follow_overlapping_boxes():
+    tracker = FaceTracker(iou_threshold=0.3)
+    first = tracker.update([(0, 0, 100, 100), (200, 0, 300, 100)])
+    second = tracker.update([(205, 5, 305, 105), (5, 0, 105, 100)])  # Đổi thứ tự, dịch nhẹ
+    assert [t.track_id for t in second] == [first[1].track_id, first[0].track_id]
+    assert second[0].box == (205, 5, 305, 105)
+
+def test_low_iou_starts_new_track():
+    tracker = FaceTracker(iou_threshold=0.3)
+    first = tracker.update([(0, 0, 100, 100)])[0]
+    second = tracker.update([(80, 0, 180, 100)])[0]  # IoU = 20 / 180
+    assert second.track_id != first.track_id
+    assert len(tracker.tracks) == 2  # Track cũ còn giữ trong max_missed khung
+
+def test_greedy_matching_prefers_highest_iou():
+    tracker = FaceTracker(iou_threshold=0.1)
+    track = tracker.update([(0, 0, 100, 100)])[0]
+    partial, exact = tracker.update([(40, 0, 140, 100), (2, 0, 102, 100)])
+    assert exact is track and partial.track_id != track.track_id
+
+def test_missed_tracks_expire():
+    tracker = FaceTracker(max_missed=2)
+    tracker.update([(0, 0, 10, 10)])
+    tracker.update([])
+    tracker.update([])
+    assert len(tracker.tracks) == 1
+    tracker.update([])
+    assert tracker.tracks == []
+
+def test_needs_embedding_until_identified_and_on_schedule():
+    tracker = FaceTracker(reembed_interval=3)
+    track = tracker.update([(0, 0, 100, 100)])[0]
+    assert tracker.needs_embedding(track)
+    tracker.set_identity(track, {'id': '001', 'name': 'An'}, 0.4)
+    assert not tracker.needs_embedding(track)
+
+    for _ in range(2):
+        assert tracker.update([(0, 0, 100, 100)])[0] is track
+        assert not tracker.needs_embedding(track)
+    tracker.update([(0, 0, 100, 100)])
+    assert tracker.needs_embedding(track)  # Đến hạn làm mới
+
+def test_needs_embedding_when_box_drifts():
+    tracker = FaceTracker(iou_threshold=0.3, reembed_iou=0.5)
+    track = tracker.update([(0, 0, 100, 100)])[0]
+    tracker.set_identity(track, None, 2.0)
+    assert tracker.update([(30, 0, 130, 100)])[0] is track  # IoU với box lúc nhận diện ~0.54
+    assert not tracker.needs_embedding(track)
+    assert tracker.update([(60, 0, 160, 100)])[0] is track  # Vẫn cùng track, nhưng IoU 0.25
+    assert tracker.needs_embedding(track)
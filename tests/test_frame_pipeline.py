@@ -0,0 +1,87 @@
+import threading
+import time
+import pytest
+from frame_pipeline import DropOldestQueue, FramePool, QueueClosed, StageThread, fit_size
+
+def test_drop_oldest_when_full():
+    queue = DropOldestQueue(maxsize=2)
+    for item in range(5):
+        queue.put(item)
+    assert queue.qsize() == 2
+    assert queue.dropped == 3
+    assert [queue.get(), queue.get()] == [3, 4]  # Chỉ còn phần tử mới nhất, theo thứ tự
+    assert queue.get(timeout=0.01) is None
+
+def test_put_never_blocks_and_maxsize_is_at_least_one():
+    queue = DropOldestQueue(maxsize=0)
+    queue.put('a')
+    queue.put('b')
+    assert queue.maxsize == 1 and queue.get() == 'b'
+
+def test_close_wakes_waiting_consumer():
+    queue = DropOldestQueue()
+    errors = []
+
+    def consume():
+        try:
+            queue.get()
+        except QueueClosed as e:
+            errors.append(e)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    time.sleep(0.05)
+    queue.close()
+    consumer.join(timeout=1.0)
+    assert not consumer.is_alive() and len(errors) == 1
+
+    queue.put('ignored')  # Hàng đợi đã đóng bỏ qua phần tử mới
+    with pytest.raises(QueueClosed):
+        queue.get(timeout=0.01)
+
+def test_stage_thread_forwards_results_and_reports_errors():
+    input_queue, output_queue = DropOldestQueue(8), DropOldestQueue(8)
+    errors = []
+
+    def step(item):
+        if item == 'bad':
+            raise ValueError(item)
+        return None if item == 'skip' else item * 2
+
+    stage = StageThread("test", step, input_queue, output_queue, lambda name, e: errors.append((name, str(e))))
+    stage.start()
+    for item in (1, 'bad', 'skip', 3):
+        input_queue.put(item)
+    assert [output_queue.get(timeout=1.0), output_queue.get(timeout=1.0)] == [2, 6]
+    input_queue.close()
+    stage.join(timeout=1.0)
+    assert not stage.is_alive()
+    assert errors == [('test', 'bad')]
+
+def test_fit_size_keeps_aspect_ratio():
+    assert fit_size((480, 640, 3), (381, 351)) == (381, 286)
+    assert fit_size((480, 640, 3), None) == (640, 480)
+    assert fit_size((480, 640, 3), (0, 0)) == (640, 480)
+
+def test_frame_pool_reuses_buffers_and_drops_when_exhausted():
+    pool = FramePool(size=2)
+    slot_a, buffer_a = pool.acquire((4, 4, 3))
+    slot_b, _ = pool.acquire((4, 4, 3))
+    assert slot_a != slot_b and pool.in_use() == 2
+
+    # Bên nhận vẫn giữ mọi bộ đệm: không ghi đè, khung bị bỏ
+    assert pool.acquire((4, 4, 3)) == (None, None)
+    assert pool.exhausted == 1
+
+    pool.release(slot_a)
+    slot, buffer = pool.acquire((4, 4, 3))
+    assert slot == slot_a and buffer is buffer_a
+    assert pool.allocations == 2
+
+def test_frame_pool_reallocates_on_resize():
+    pool = FramePool(size=1)
+    _, small = pool.acquire((2, 2, 3))
+    pool.release_all()
+    _, large = pool.acquire((4, 4, 3))
+    assert large.shape == (4, 4, 3) and large is not small
+    assert pool.allocations == 2
@@ -0,0 +1,66 @@
+import threading
+import numpy as np
+import pytest
+from embedding_store import append_store, save_store
+from gallery import EMPTY_GALLERY, GallerySnapshot, GalleryWatcher, load_snapshot
+
+def _save(path, count, dim=4, seed=0):
+    embeddings = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    save_store(path, embeddings, [f"{i:03d}" for i in range(count)], [f"P{i}" for i in range(count)])
+    return embeddings
+
+def test_snapshot_is_immutable_and_in_memory(tmp_path):
+    path = str(tmp_path / "gallery.emb")
+    embeddings = _save(path, 3)
+    snapshot = load_snapshot(path, version=4)
+    assert snapshot.ready and len(snapshot) == 3 and snapshot.version == 4 and snapshot.kind == 'image'
+    assert not isinstance(snapshot.store.embeddings, np.memmap)  # File thay được khi đang dùng
+    assert snapshot.person(-1) is None and snapshot.person(1)['id'] == '001'
+    with pytest.raises(AttributeError):
+        snapshot.version = 5
+
+    distances, indices = snapshot.matcher.search(embeddings[2])
+    assert indices[0, 0] == 2
+    assert not EMPTY_GALLERY.ready and not GallerySnapshot(version=1).ready
+
+def test_watcher_publishes_new_versions(tmp_path):
+    path = str(tmp_path / "gallery.emb")
+    updates = []
+    watcher = GalleryWatcher(path, on_update=lambda snapshot, count: updates.append((snapshot.version, count)))
+
+    assert watcher.refresh() is watcher.snapshot and updates == [(1, 0)]  # Chưa có store
+    assert watcher.refresh() is watcher.snapshot and len(updates) == 1  # Không đổi thì không tải lại
+
+    _save(path, 2)
+    first = watcher.refresh()
+    assert (first.version, len(first)) == (2, 2)
+
+    append_store(path, np.ones((1, 4)), ['999'], ['Mới'])  # Ghi nhật ký cũng đổi chữ ký file
+    second = watcher.refresh()
+    assert (second.version, len(second)) == (3, 3) and second.person(2)['name'] == 'Mới'
+    assert len(first) == 2  # Bản cũ không bị sửa
+    assert updates[-2:] == [(2, 2), (3, 3)]
+
+def test_watcher_keeps_previous_snapshot_on_error(tmp_path, capsys):
+    path = tmp_path / "gallery.emb"
+    _save(str(path), 2)
+    watcher = GalleryWatcher(str(path))
+    good = watcher.refresh()
+    path.write_bytes(b"corrupt".ljust(64))
+    assert watcher.refresh() is good
+    assert "[LỖI]" in capsys.readouterr().out
+
+def test_background_refresh(tmp_path):
+    path = str(tmp_path / "gallery.emb")
+    loaded = threading.Event()
+    watcher = GalleryWatcher(path, interval=10.0,
+                             on_update=lambda snapshot, count: count > 0 and loaded.set())
+    watcher.refresh()
+    watcher.start()
+    try:
+        _save(path, 1)
+        watcher.request_refresh()  # Không phải chờ hết chu kỳ
+        assert loaded.wait(2.0)
+        assert len(watcher.snapshot) == 1
+    finally:
+        watcher.stop()
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from embedding_store import append_store, load_store, save_store
+from gallery_prototypes import build_prototypes, condense_identity, condense_store, find_outliers, k_medoids, normalized_mean
+
+def _cluster(center, count, spread=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    return (np.asarray(center, np.float32) + rng.standard_normal((count, len(center))) * spread).astype(np.float32)
+
+def test_normalized_mean_keeps_average_length():
+    vectors = np.array([[2.0, 0.0], [0.0, 2.0]], np.float32)
+    mean = normalized_mean(vectors)
+    assert np.linalg.norm(mean) == pytest.approx(2.0)
+    assert mean[0] == pytest.approx(mean[1])
+
+def test_k_medoids_picks_one_member_per_cluster():
+    vectors = np.concatenate([_cluster([0, 0], 5), _cluster([5, 5], 5, seed=1), _cluster([-5, 5], 5, seed=2)])
+    medoids = k_medoids(vectors, 3)
+    assert sorted(index // 5 for index in medoids) == [0, 1, 2]
+    assert k_medoids(vectors, 3) == medoids  # Tất định
+    assert len(k_medoids(vectors[:2], 5)) == 2  # k không vượt số vector
+
+def test_find_outliers():
+    vectors = np.concatenate([_cluster([0, 0], 5), [[3.0, 3.0]]]).astype(np.float32)
+    outliers, distances = find_outliers(vectors, threshold=1.0)
+    assert outliers == [5]
+    assert distances[0] > 1.0
+
+    assert find_outliers(vectors[[0, 5]], threshold=1.0) == ([], [])  # Quá ít ảnh
+    assert find_outliers(vectors, threshold=0.0) == ([], [])  # Mọi ảnh đều lạc
+
+def test_condense_identity_skips_outliers():
+    vectors = np.concatenate([_cluster([1, 0], 4), [[-1.0, 0.0]]]).astype(np.float32)
+    prototypes, outliers, _ = condense_identity(vectors, 'mean', outlier_threshold=1.0)
+    assert outliers == [4]
+    assert prototypes.shape == (1, 2) and prototypes[0, 0] > 0.9
+
+    prototypes, _, _ = condense_identity(vectors, 'medoids', max_prototypes=2, outlier_threshold=1.0)
+    assert prototypes.shape == (2, 2)
+    with pytest.raises(ValueError):
+        condense_identity(vectors, 'median')
+
+def test_build_prototypes_keeps_first_appearance_order():
+    embeddings = np.concatenate([_cluster([0, 1], 3), _cluster([1, 0], 2, seed=1)])
+    ids, names = ['b', 'b', 'b', 'a', 'a'], ['B', 'B', 'B', 'A', 'A']
+    prototypes, prototype_ids, prototype_names, report = build_prototypes(embeddings, ids, names, 'mean')
+    assert prototype_ids == ['b', 'a'] and prototype_names == ['B', 'A']
+    assert prototypes.shape == (2, 2)
+    assert (report['source_count'], report['prototype_count'], report['people']) == (5, 2, 2)
+
+def test_condense_store_and_append(tmp_path):
+    source, target = str(tmp_path / "images.emb"), str(tmp_path / "prototypes.emb")
+    embeddings = np.concatenate([_cluster([0, 1], 3), _cluster([1, 0], 3, seed=1)])
+    save_store(source, embeddings, list('111222'), list('AAABBB'), {'embedder': 'keras'})
+
+    report = condense_store(source, target)
+    store = load_store(target, verify=True)
+    assert store.ids.tolist() == ['1', '2']
+    assert store.header['gallery'] == 'prototype' and store.header['embedder'] == 'keras'
+    assert report['source_count'] == 6
+    with pytest.raises(ValueError):
+        condense_store(target, str(tmp_path / "again.emb"))  # Đã là gallery prototype
+
+    assert append_store(target, np.ones((1, 2)), ['3'], ['C']) == 3  # Người mới được thêm
+    with pytest.raises(ValueError, match="prototype"):
+        append_store(target, np.ones((1, 2)), ['1'], ['A'])  # Người đã có phải dựng lại
+
+def test_k_medoids_with_duplicated_embeddings():
+    vectors = np.repeat(np.array([[0.0, 1.0], [1.0, 0.0]], np.float32), 3, axis=0)
+    medoids = k_medoids(vectors, 3)
+    assert len(medoids) == 2 and sorted(index // 3 for index in medoids) == [0, 1]
+    assert k_medoids(vectors[:3], 3) == [0]  # Chỉ một vector khác nhau
+
+    embeddings = np.concatenate([vectors, np.tile([[0.6, 0.8]], (4, 1))]).astype(np.float32)
+    prototypes, ids, _, _ = build_prototypes(embeddings, ['a'] * 6 + ['b'] * 4, ['A'] * 6 + ['B'] * 4,
+                                             'medoids', max_prototypes=3, outlier_threshold=10.0)
+    assert ids == ['a', 'a', 'b']
+    assert len(np.unique(prototypes, axis=0)) == 3
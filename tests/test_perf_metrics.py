@@ -0,0 +1,81 @@
+import os
+import pytest
+from perf_metrics import METRIC_PREFIX, Histogram, PerfMetrics
+
+def test_histogram_buckets_and_mean():
+    histogram = Histogram((1, 2, 4))
+    for value in (0.5, 1.5, 2, 3, 10):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1]  # Giá trị bằng ngưỡng thuộc bucket đó (le), 10 vào +Inf
+    assert histogram.count == 5
+    assert histogram.mean == pytest.approx(17 / 5)
+
+def test_histogram_quantile_interpolates_within_bucket():
+    histogram = Histogram((1, 2, 4))
+    assert histogram.quantile(0.5) == 0.0
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        histogram.observe(value)
+    assert histogram.quantile(0.2) == pytest.approx(1.0)
+    assert histogram.quantile(0.5) == pytest.approx(1.75)  # rank 2.5: 1 + (2 - 1) * 1.5 / 2
+    assert histogram.quantile(0.6) == pytest.approx(2.0)
+    assert histogram.quantile(0.7) == pytest.approx(3.0)  # rank 3.5: 2 + (4 - 2) * 0.5 / 1
+    assert histogram.quantile(1.0) == 4  # Bucket +Inf trả về ngưỡng cuối
+
+def test_histogram_recent_is_smoothed():
+    histogram = Histogram((1,))
+    histogram.observe(1.0)
+    histogram.observe(2.0)
+    assert histogram.recent == pytest.approx(1.1)
+
+def test_disabled_metrics_record_nothing():
+    metrics = PerfMetrics(enabled=False)
+    with metrics.time('detect'):
+        pass
+    metrics.observe('faces_per_frame', 3)
+    metrics.increment('queue_dropped', label='embed')
+    metrics.frame(faces=2)
+    snapshot = metrics.snapshot()
+    assert snapshot['frames'] == 0 and snapshot['stages'] == {} and snapshot['counters'] == {}
+
+def test_snapshot_reports_stage_latency():
+    metrics = PerfMetrics()
+    for _ in range(20):
+        metrics.observe('stage_seconds', 0.003, 'detect')
+    metrics.observe('embed_batch_size', 4)
+    metrics.observe('embed_batch_size', 2)
+    snapshot = metrics.snapshot()
+    assert snapshot['stages']['detect']['mean_ms'] == pytest.approx(3.0)
+    assert 2.5 <= snapshot['stages']['detect']['p95_ms'] <= 5.0
+    assert snapshot['embed_batch_size'] == pytest.approx(3.0)
+
+def test_prometheus_text_format(tmp_path):
+    metrics = PerfMetrics()
+    metrics.observe('stage_seconds', 0.003, 'detect')
+    metrics.observe('stage_seconds', 0.02, 'embed')
+    metrics.set_gauge('queue_depth', 2, 'embed')
+    metrics.increment('queue_dropped', label='embed')
+    metrics.increment('queue_dropped', label='embed')
+    metrics.increment('display_frames_skipped')
+    lines = metrics.to_prometheus().splitlines()
+
+    stage = METRIC_PREFIX + "stage_seconds"
+    assert lines.count(f"# TYPE {stage} histogram") == 1
+    assert f'{stage}_bucket{{stage="detect",le="0.0025"}} 0' in lines
+    assert f'{stage}_bucket{{stage="detect",le="0.005"}} 1' in lines
+    assert f'{stage}_bucket{{stage="detect",le="+Inf"}} 1' in lines
+    assert f'{stage}_count{{stage="embed"}} 1' in lines
+    assert f'{stage}_sum{{stage="embed"}} 0.02' in lines
+    assert f"# TYPE {METRIC_PREFIX}queue_depth gauge" in lines
+    assert f'{METRIC_PREFIX}queue_depth{{queue="embed"}} 2' in lines
+    assert f"# TYPE {METRIC_PREFIX}queue_dropped counter" in lines
+    assert f'{METRIC_PREFIX}queue_dropped{{queue="embed"}} 2' in lines
+    assert f"{METRIC_PREFIX}display_frames_skipped 1" in lines
+
+    # Bucket tích lũy không giảm
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in lines if line.startswith(f'{stage}_bucket{{stage="embed"')]
+    assert buckets == sorted(buckets) and buckets[-1] == 1
+
+    path = str(tmp_path / "metrics.prom")
+    metrics.write_prometheus(path)
+    assert open(path, encoding='utf-8').read() == metrics.to_prometheus()
+    assert not os.path.exists(path + ".tmp")
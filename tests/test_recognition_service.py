@@ -0,0 +1,99 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import cv2
+import numpy as np
+import pytest
+from benchmarks.stubs import StubDetector, StubEmbedder
+from recognition_service import RecognitionService, make_server
+
+STUB_THRESHOLD = 0.3  # Embedding giả của hai ảnh khác nhau cách nhau khoảng 0.7
+
+def _image_bytes(seed):
+    # Ảnh khối lớn để embedding giả của hai seed khác nhau rõ ràng
+    blocks = np.random.default_rng(seed).integers(0, 255, (6, 8, 3), dtype=np.uint8)
+    image = cv2.resize(blocks, (320, 240), interpolation=cv2.INTER_NEAREST)
+    ok, encoded = cv2.imencode('.png', image)
+    assert ok
+    return encoded.tobytes()
+
+def _request(url, body=None):
+    """(mã trạng thái, JSON) của một yêu cầu; GET nếu body là None."""
+    request = urllib.request.Request(url, data=body, method='GET' if body is None else 'POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+@pytest.fixture
+def make_url(tmp_path):
+    servers = []
+
+    def start(images_folder=None):
+        service = RecognitionService(StubDetector(1), StubEmbedder(), str(tmp_path / "gallery.emb"),
+                                     str(images_folder or tmp_path / "dataset"), threshold=STUB_THRESHOLD,
+                                     max_wait=0.001)
+        server = make_server(service, '127.0.0.1', 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, service))
+        host, port = server.server_address
+        return f"http://{host}:{port}"
+
+    yield start
+    for server, service in servers:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+def test_enroll_identify_and_metrics(make_url):
+    url = make_url()
+    status, payload = _request(url + "/identify", _image_bytes(1))
+    assert status == 200
+    assert payload['faces'][0]['id'] is None
+
+    status, user = _request(url + "/enroll?name=Nguyen%20An&id=101", _image_bytes(1))
+    assert status == 200
+    assert (user['id'], user['name'], user['gallery_size']) == ('101', 'Nguyen_An', 1)
+
+    status, payload = _request(url + "/identify", _image_bytes(1))
+    assert status == 200
+    face = payload['faces'][0]
+    assert (face['id'], face['name']) == ('101', 'Nguyen_An')
+    assert face['distance'] < 0.05  # Cùng ảnh; đăng ký và nhận diện cắt khuôn mặt hơi khác nhau
+
+    status, payload = _request(url + "/identify", _image_bytes(2))
+    assert status == 200
+    assert payload['faces'][0]['id'] is None  # Ảnh khác, khoảng cách vượt ngưỡng
+
+    status, metrics = _request(url + "/metrics")
+    assert status == 200
+    assert metrics['gallery_size'] == 1
+    assert metrics['gallery_kind'] == 'image'
+    assert metrics['endpoints']['/identify']['requests'] == 3
+    assert metrics['endpoints']['/enroll']['requests'] == 1
+    assert metrics['embedder']['faces'] >= 4
+
+def test_invalid_requests(make_url):
+    url = make_url()
+    assert _request(url + "/identify", b"not an image")[0] == 400
+    assert _request(url + "/enroll?name=", _image_bytes(1))[0] == 400
+    assert _request(url + "/missing")[0] == 404
+
+def test_enroll_rejects_non_numeric_id(make_url, tmp_path):
+    url = make_url()
+    for user_id in ("../../x", "12a", "%2E%2E"):
+        assert _request(url + f"/enroll?name=An&id={user_id}", _image_bytes(1))[0] == 400
+    assert list(tmp_path.iterdir()) == []
+
+def test_enroll_requires_store_when_dataset_has_photos(make_url, tmp_path):
+    user_folder = tmp_path / "dataset" / "001_An"
+    user_folder.mkdir(parents=True)
+    cv2.imwrite(str(user_folder / "001_An_1.png"), np.zeros((8, 8, 3), np.uint8))
+    url = make_url()
+
+    status, payload = _request(url + "/enroll?name=Binh", _image_bytes(1))
+    assert status == 409
+    assert not (tmp_path / "gallery.emb").exists()
+    assert sorted(p.name for p in (tmp_path / "dataset").iterdir()) == ["001_An"]
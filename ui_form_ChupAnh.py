@@ -38,6 +38,10 @@ class Ui_Form(object):
         self.btnHuy = QtWidgets.QPushButton(Form)
         self.btnHuy.setGeometry(QtCore.QRect(780, 270, 81, 41))
         self.btnHuy.setObjectName("btnHuy")
+        self.progressBar = QtWidgets.QProgressBar(Form)
+        self.progressBar.setGeometry(QtCore.QRect(590, 330, 271, 23))
+        self.progressBar.setProperty("value", 0)
+        self.progressBar.setObjectName("progressBar")
 
         self.retranslateUi(Form)
         QtCore.QMetaObject.connectSlotsByName(Form)